@@ -52,6 +52,83 @@ class MongoUser:
         return f"MongoUser({self._user_dict.get('email', 'Unknown')})"
 
 
+def _bearer_token(request):
+    """
+    Token from the request's 'Authorization: Bearer <token>' header
+    
+    Returns:
+        str or None: Token, None if no bearer token was sent
+    
+    Raises:
+        AuthenticationFailed: If the header is malformed
+    """
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    
+    if not auth_header.startswith('Bearer '):
+        return None
+    
+    try:
+        return auth_header.split(' ')[1]
+    except IndexError:
+        raise exceptions.AuthenticationFailed('Invalid token header')
+
+
+def _token_user_id(token):
+    """
+    User ID of a valid token
+    
+    Raises:
+        AuthenticationFailed: If the token is expired, invalid or has no user_id
+    """
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed('Token has expired')
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('Invalid token')
+    
+    user_id = payload.get('user_id')
+    if not user_id:
+        raise exceptions.AuthenticationFailed('Token payload invalid')
+    
+    return user_id
+
+
+def _find_user(user_id):
+    """
+    Look a token's user up (the only database access of authentication)
+    
+    Returns:
+        MongoUser: Active user without the password
+    
+    Raises:
+        AuthenticationFailed: If the user is missing, disabled or cannot be read
+    """
+    try:
+        # Search in both collections
+        user = teachers_collection.find_one({'_id': ObjectId(user_id)})
+        if not user:
+            user = students_collection.find_one({'_id': ObjectId(user_id)})
+    except Exception as e:
+        logger.error(f"Authentication error: {e}")
+        raise exceptions.AuthenticationFailed('Authentication failed')
+    
+    if not user:
+        raise exceptions.AuthenticationFailed('User not found')
+    
+    # Check if user is active
+    if not user.get('is_active', True):
+        raise exceptions.AuthenticationFailed('User account is disabled')
+    
+    # Convert ObjectId to string for JSON serialization
+    user['_id'] = str(user['_id'])
+    # Remove password from user object
+    user.pop('password', None)
+    
+    # Wrap user dict in MongoUser class
+    return MongoUser(user)
+
+
 class JWTAuthentication(authentication.BaseAuthentication):
     """
     Custom JWT Authentication class for DRF.
@@ -61,55 +138,36 @@ class JWTAuthentication(authentication.BaseAuthentication):
         """
         Authenticate the request and return a two-tuple of (user, token).
         """
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        
-        if not auth_header:
-            return None
-        
-        if not auth_header.startswith('Bearer '):
+        token = _bearer_token(request)
+        if token is None:
             return None
         
-        try:
-            token = auth_header.split(' ')[1]
-        except IndexError:
-            raise exceptions.AuthenticationFailed('Invalid token header')
-        
-        try:
-            payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-            user_id = payload.get('user_id')
-            
-            if not user_id:
-                raise exceptions.AuthenticationFailed('Token payload invalid')
-            
-            # Search in both collections
-            user = teachers_collection.find_one({'_id': ObjectId(user_id)})
-            if not user:
-                user = students_collection.find_one({'_id': ObjectId(user_id)})
-            
-            if not user:
-                raise exceptions.AuthenticationFailed('User not found')
-            
-            # Check if user is active
-            if not user.get('is_active', True):
-                raise exceptions.AuthenticationFailed('User account is disabled')
-            
-            # Convert ObjectId to string for JSON serialization
-            user['_id'] = str(user['_id'])
-            # Remove password from user object
-            user.pop('password', None)
-            
-            # Wrap user dict in MongoUser class
-            mongo_user = MongoUser(user)
-            
-            return (mongo_user, token)
-        
-        except jwt.ExpiredSignatureError:
-            raise exceptions.AuthenticationFailed('Token has expired')
-        except jwt.InvalidTokenError:
-            raise exceptions.AuthenticationFailed('Invalid token')
-        except Exception as e:
-            logger.error(f"Authentication error: {e}")
-            raise exceptions.AuthenticationFailed('Authentication failed')
+        return (_find_user(_token_user_id(token)), token)
+
+
+async def authenticate_request_async(request):
+    """
+    Async counterpart of JWTAuthentication for plain async Django views
+    
+    Shares JWTAuthentication's header and token checks; only the user lookup
+    runs in a worker thread.
+    
+    Args:
+        request: Django HttpRequest
+    
+    Returns:
+        MongoUser or None: Authenticated user, None if no bearer token was sent
+    
+    Raises:
+        AuthenticationFailed: If the token or user is invalid
+    """
+    from asgiref.sync import sync_to_async
+    
+    token = _bearer_token(request)
+    if token is None:
+        return None
+    
+    return await sync_to_async(_find_user, thread_sensitive=False)(_token_user_id(token))
 
 
 def generate_token(user_id):
@@ -8,6 +8,7 @@ import jwt
 from django.conf import settings
 from bson import ObjectId
 from api.models import teachers_collection, students_collection
+from api.utils.audio_playback import get_playback_token_ttl
 import logging
 
 logger = logging.getLogger(__name__)
@@ -120,7 +121,7 @@ class MonitoringConsumer(AsyncWebsocketConsumer):
                         'type': 'audio_playback_url',
                         'chunk_id': chunk_id,
                         'url': audio_url,
-                        'expires_in': 300  # 5 minutes
+                        'expires_in': get_playback_token_ttl()
                     }))
             
             elif action == 'heartbeat':
@@ -173,12 +174,13 @@ class MonitoringConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def generate_audio_playback_url(self, chunk_id):
         """
-        Generate a temporary URL for audio playback.
+        Generate a temporary signed URL for audio playback.
+        The token is checked by the play endpoint without any database reads.
         """
         try:
-            from api.models import audio_chunks_collection, quizzes_collection
-            from api.utils.audio_storage import get_audio_file_path
-            import time
+            from api.models import audio_chunks_collection
+            from api.utils.audio_config import get_quiz_audio_config
+            from api.utils.audio_playback import playback_url
             
             # Get chunk
             chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
@@ -186,20 +188,21 @@ class MonitoringConsumer(AsyncWebsocketConsumer):
                 return None
             
             # Verify user has access (teacher of the quiz)
-            if self.user.get('role') == 'teacher':
-                quiz = quizzes_collection.find_one({'_id': ObjectId(chunk['quiz_id'])})
-                if not quiz or str(quiz['teacher_id']) != self.user_id:
-                    logger.warning(f"Unauthorized audio access attempt by {self.user_id}")
-                    return None
+            if self.user.get('role') != 'teacher':
+                logger.warning(f"Non-teacher audio access attempt by {self.user_id}")
+                return None
+            
+            quiz_config = get_quiz_audio_config(chunk['quiz_id'])
+            if not quiz_config.exists or quiz_config.teacher_id != self.user_id:
+                logger.warning(f"Unauthorized audio access attempt by {self.user_id}")
+                return None
             
             # Get file path
             file_path = chunk.get('preprocessed_path') or chunk.get('file_path')
             if not file_path:
                 return None
             
-            # Generate signed URL (simplified - in production use proper signed URLs)
-            # For now, return the chunk_id which can be used with an API endpoint
-            return f"/api/audio/play/{chunk_id}"
+            return playback_url(chunk, self.user_id)
         
         except Exception as e:
             logger.error(f"Error generating audio playback URL: {e}")
@@ -23,9 +23,41 @@ teachers_collection = db['teachers'] # Teachers ka data
 students_collection = db['students'] # Students ka data
 quizzes_collection = db['quizzes'] # Quizzes ka data
 flags_collection = db['flags'] # Violation flags ka data
+flag_counters_collection = db['flag_counters'] # Flags ke precomputed counts (quiz/student wise)
 submissions_collection = db['submissions'] # Quiz submissions ka data
 audio_chunks_collection = db['audio_chunks'] # Audio chunks ka data
 audio_sessions_collection = db['audio_sessions'] # Audio sessions ka data
+task_checkpoints_collection = db['task_checkpoints'] # Long-running maintenance tasks ka progress
+storage_stats_collection = db['storage_stats'] # Audio storage ke precomputed counters
+
+# Flag list ke (fields, timestamp, _id) indexes - create_indexes har shape ka ek banata hai.
+# Baaki filter combinations sabse lambe matching prefix wale index par chalte hain
+# (list_flags hint deta hai); flags collection write-hot hai isliye set chhota rakha hai
+FLAG_LIST_SHAPES = (
+    (),
+    ('quiz_id', 'student_id'),
+    ('quiz_id', 'resolved'),
+    ('quiz_id', 'severity'),
+    ('student_id', 'resolved'),
+    ('resolved', 'severity'),
+)
+
+# Async (motor) database handle - sirf ASGI async views ke liye, pehli baar use par banta hai
+_async_db = None
+
+
+def get_async_db():
+    """
+    Motor database handle for async views
+    Lazily created on first use so sync-only processes (Celery, manage.py) never need motor
+    """
+    global _async_db
+    
+    if _async_db is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        _async_db = AsyncIOMotorClient(settings.MONGODB_URI)[settings.DB_NAME]
+    
+    return _async_db
 
 
 def create_indexes():
@@ -54,16 +86,44 @@ def create_indexes():
         logger.info("Quizzes collection ke liye indexes ban gaye")
         
         # Flags indexes
-        flags_collection.create_index([('student_id', ASCENDING)])
-        flags_collection.create_index([('quiz_id', ASCENDING)])
-        flags_collection.create_index([('timestamp', DESCENDING)])
-        flags_collection.create_index([('resolved', ASCENDING)])
+        # Purane single-field indexes ab neeche wale compound indexes ke prefix hain
+        existing_flag_indexes = flags_collection.index_information()
+        for index_name in ('student_id_1', 'quiz_id_1', 'resolved_1', 'timestamp_-1'):
+            if index_name in existing_flag_indexes:
+                flags_collection.drop_index(index_name)
+        # Flag list pages: har shape ke liye (equality fields, timestamp, _id) sort order mein
+        list_index_keys = [
+            [(field, ASCENDING) for field in shape] + [('timestamp', DESCENDING), ('_id', DESCENDING)]
+            for shape in FLAG_LIST_SHAPES
+        ]
+        # Pehle ke list indexes jinka shape ab list mein nahi hai (har flag insert par kharcha)
+        for index_name, index_info in existing_flag_indexes.items():
+            keys = [(field, int(direction)) for field, direction in index_info['key']]
+            if keys[-2:] == [('timestamp', DESCENDING), ('_id', DESCENDING)] and keys not in list_index_keys:
+                flags_collection.drop_index(index_name)
+        for keys in list_index_keys:
+            flags_collection.create_index(keys)
         flags_collection.create_index([
             ('student_id', ASCENDING),
             ('quiz_id', ASCENDING),
             ('type', ASCENDING),
             ('timestamp', DESCENDING)
         ])
+        flags_collection.create_index(
+            [
+                ('student_id', ASCENDING),
+                ('quiz_id', ASCENDING),
+                ('type', ASCENDING),
+                ('aggregation_bucket', ASCENDING)
+            ],
+            unique=True,
+            partialFilterExpression={'aggregation_bucket': {'$exists': True}}
+        )  # Ek 30-second window mein ek hi open flag (atomic aggregation upsert)
+        flags_collection.create_index(
+            [('audio_data.chunk_id', ASCENDING)],
+            unique=True,
+            partialFilterExpression={'audio_data.chunk_id': {'$exists': True}}
+        )  # Ek audio chunk par ek hi flag (pipeline retry duplicate flag na banaye)
         logger.info("Created indexes for flags collection")
         
         # Submissions indexes
@@ -83,8 +143,21 @@ def create_indexes():
             ('student_id', ASCENDING)
         ])
         audio_chunks_collection.create_index([('processing_status', ASCENDING)])
+        audio_chunks_collection.create_index([
+            ('processing_status', ASCENDING),
+            ('updated_at', ASCENDING)
+        ])  # Oldest-first claim for batched transcription
+        audio_chunks_collection.create_index([('asr_batch_id', ASCENDING)], sparse=True)
         audio_chunks_collection.create_index([('timestamp', DESCENDING)])
         audio_chunks_collection.create_index([('created_at', DESCENDING)])
+        audio_chunks_collection.create_index([
+            ('created_at', ASCENDING),
+            ('_id', ASCENDING)
+        ])  # Keyset pages for retention cleanup
+        audio_chunks_collection.create_index([
+            ('storage_tier', ASCENDING),
+            ('quiz_id', ASCENDING)
+        ])  # Closed quizzes with audio still in the hot tiers
         logger.info("Created indexes for audio_chunks collection")
         
         # Audio sessions indexes
@@ -99,7 +172,7 @@ def create_indexes():
         
         logger.info("All database indexes created successfully")
         return True
-        
+    
     except Exception as e:
         logger.error(f"Error creating indexes: {e}")
         return False
@@ -224,13 +297,30 @@ Flags Collection Schema:
     resolved_at: ISODate (optional),
     resolution_note: String (optional),
     count: Number (default: 1),
+    aggregation_bucket: Integer (optional),  # 30-second window (epoch seconds // 30); unset once resolved
+    previous_severity: String (optional),  # severity before the last aggregated event
+    updated_at: ISODate (optional),
     audio_data: {  # Only present for audio flags
         chunk_id: String,
         transcription: String,
         num_speakers: Integer,
-        keywords_found: [String],
-        audio_url: String  # Presigned URL for playback
-    }
+        keywords_found: [String]
+    }  # Playback URLs are never stored; short-lived tokens are minted when the flag is served
+}
+
+Flag Counters Collection Schema:
+{
+    _id: String,  # 'total', 'quiz:<quiz_id>', 'student:<student_id>' or 'quiz_student:<quiz_id>:<student_id>'
+    scope: String,  # total, quiz, student, quiz_student
+    quiz_id: String (optional),
+    student_id: String (optional),
+    total: Integer,
+    resolved: Integer,
+    severity: {low: Integer, medium: Integer, high: Integer, critical: Integer},
+    type: Object,  # flag type -> count
+    seeded: Boolean,  # existing flags counted in; unseeded docs only count flags since they appeared
+    updated_at: ISODate,
+    reconciled_at: ISODate (optional)  # last rebuild from the flags collection
 }
 
 Submissions Collection Schema:
@@ -258,9 +348,19 @@ Audio Chunks Collection Schema:
     chunk_index: Integer,
     timestamp: ISODate (indexed),
     duration: Float,
-    file_path: String,
-    preprocessed_path: String,
-    processing_status: String (indexed),  # queued, preprocessing, vad, diarization, transcription, suspicion, completed, failed
+    file_path: String,  # own file, or the session segment file when file_offset is set
+    file_offset: Integer (optional),  # byte offset of the chunk in its session segment file
+    file_length: Integer (optional),  # byte length of the chunk in its session segment file
+    file_format: String,  # encoded format (webm, wav, ogg, mp3)
+    preprocessed_path: String,  # own WAV file, or the session PCM file when preprocessed_offset is set
+    preprocessed_offset: Integer (optional),  # byte offset of the chunk's float32 samples in the session PCM file
+    preprocessed_samples: Integer (optional),  # number of 16kHz samples at preprocessed_offset
+    storage_tier: String (indexed),  # hot, archived (own Opus/FLAC files under archived/)
+    archived_at: ISODate (optional),
+    processing_status: String (indexed),  # queued, preprocessing, vad, diarization, transcription, transcription_batched, suspicion, completed, failed
+    asr_batch_id: String (optional, indexed),  # set while claimed by a batched transcription run
+    asr_attempts: Integer (optional),  # failed batched transcription attempts so far
+    asr_retry_at: DateTime (optional),  # a failed chunk is not batched again before this
     created_at: ISODate (indexed),
     updated_at: ISODate,
     
@@ -270,14 +370,17 @@ Audio Chunks Collection Schema:
         speech_segments: [
             {start: Float, end: Float}
         ],
-        total_speech_duration: Float
+        total_speech_duration: Float,
+        gated: Boolean (optional),  # True when skipped by the silence gate
+        gate_stats: {peak_rms_dbfs: Float, zero_crossing_rate: Float} (optional)
     },
     diarization_results: {
         num_speakers: Integer,
         speaker_segments: [
             {speaker: String, start: Float, end: Float}
         ],
-        speaker_durations: Object
+        speaker_durations: Object,
+        profile: {enrolled: Boolean, foreign_speech_seconds: Float} (optional)  # session speaker-profile comparison
     },
     transcriptions: [
         {
@@ -292,7 +395,9 @@ Audio Chunks Collection Schema:
         score: Float,
         severity: String,
         reasons: [String],
-        keywords_found: [String]
+        keywords_found: [String],
+        keyword_counts: [{keyword: String, count: Int}],
+        keyword_matches: [{keyword: String, start: Int, end: Int}]  # character offsets in the joined transcript
     },
     error_message: String (optional)
 }
@@ -308,9 +413,45 @@ Audio Sessions Collection Schema:
     total_chunks: Integer,
     processed_chunks: Integer,
     failed_chunks: Integer,
+    gated_chunks: Integer,  # chunks skipped by the silence gate
     total_flags: Integer,
     consent_given: Boolean,
     consent_timestamp: ISODate,
+    segment_path: String (optional),  # append-only raw audio file for the whole session
+    segment_index: [  # byte ranges of the session's chunks in segment_path
+        {chunk_id: String, chunk_index: Integer, offset: Integer, length: Integer, format: String}
+    ],
     status: String (indexed)  # active, completed, terminated
 }
+
+Task Checkpoints Collection Schema:
+{
+    _id: String,  # task name, e.g. 'cleanup_expired_audio'
+    status: String,  # running, completed
+    cutoff: ISODate,  # retention cutoff, kept when a run resumes
+    last_created_at: ISODate,  # keyset position of the last finished batch
+    last_id: ObjectId,
+    deleted_count: Integer,
+    failed_count: Integer,
+    deleted_segments: Integer,
+    bytes_deleted: Integer,
+    elapsed_seconds: Float,
+    started_at: ISODate,
+    updated_at: ISODate,
+    finished_at: ISODate (optional)
+}
+
+Storage Stats Collection Schema:
+{
+    _id: String,  # 'total', 'quiz:<quiz_id>' or 'student:<quiz_id>:<student_id>'
+    scope: String,  # total, quiz, student
+    quiz_id: String (optional),
+    student_id: String (optional),
+    raw: {files: Integer, chunks: Integer, bytes: Integer},  # one file per chunk (hot tier)
+    segments: {files: Integer, chunks: Integer, bytes: Integer},  # per-session raw files
+    preprocessed: {files: Integer, chunks: Integer, bytes: Integer},
+    archived: {files: Integer, chunks: Integer, bytes: Integer},
+    updated_at: ISODate,
+    reconciled_at: ISODate (optional)  # last full recount
+}
 """
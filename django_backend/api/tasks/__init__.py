@@ -4,6 +4,8 @@ NOTE: Audio tasks are temporarily disabled due to missing dependencies
 """
 # Temporarily commented out until audio processing libraries are properly installed
 # from .audio_tasks import (
+#     enqueue_audio_chunk,
+#     process_audio_chunk,
 #     preprocess_audio_chunk,
 #     detect_voice_activity,
 #     diarize_speakers,
@@ -12,6 +14,8 @@ NOTE: Audio tasks are temporarily disabled due to missing dependencies
 # )
 
 # __all__ = [
+#     'enqueue_audio_chunk',
+#     'process_audio_chunk',
 #     'preprocess_audio_chunk',
 #     'detect_voice_activity',
 #     'diarize_speakers',
@@ -1,7 +1,11 @@
 """
 Celery tasks for audio processing pipeline
-NOTE: Audio processing features require additional libraries (librosa, noisereduce, pydub, whisper)
+NOTE: Audio processing features require additional libraries (librosa, noisereduce, whisper) and ffmpeg
 These are optional and the system will work without them (audio features will be disabled)
+
+Two pipeline modes are supported (AUDIO_CONFIG['processing']['pipeline_mode']):
+- 'chained': one Celery task per stage, each stage re-reads the chunk and its preprocessed audio
+- 'fused': a single task decodes the chunk once and runs every stage on the in-memory array
 """
 from celery import shared_task
 from datetime import datetime
@@ -20,13 +24,773 @@ try:
     import librosa
     import soundfile as sf
     import noisereduce as nr
-    from pydub import AudioSegment
     import numpy as np
     AUDIO_PROCESSING_AVAILABLE = True
 except ImportError as e:
     logger.warning(f"Audio processing libraries not available: {e}. Audio proctoring features will be disabled.")
 
 
+def chunk_priority(quiz_id):
+    """
+    Broker priority for a chunk's pipeline tasks (0 = most urgent on Redis)
+    
+    Chunks from quizzes ending within urgent_minutes jump ahead; chunks from
+    quizzes that have ended or end far in the future go last. The quiz comes
+    from the cached QuizAudioConfig, so this costs no lookup in steady state.
+    
+    Args:
+        quiz_id (str): Quiz ID
+    
+    Returns:
+        int: Priority 0-9
+    """
+    from api.utils.audio_config import get_quiz_audio_config
+    
+    priorities = settings.AUDIO_CONFIG['processing'].get('priority', {})
+    
+    try:
+        end_time = get_quiz_audio_config(quiz_id).end_time if quiz_id else None
+    except Exception as e:
+        logger.warning(f"Could not determine priority for quiz {quiz_id}: {e}")
+        end_time = None
+    
+    if not end_time:
+        return priorities.get('live', 3)
+    
+    remaining_minutes = (end_time - datetime.utcnow()).total_seconds() / 60
+    
+    if 0 <= remaining_minutes <= priorities.get('urgent_minutes', 15):
+        return priorities.get('urgent', 0)
+    if 0 <= remaining_minutes <= priorities.get('soon_minutes', 60):
+        return priorities.get('live', 3)
+    return priorities.get('background', 6)
+
+
+def enqueue_audio_chunk(chunk_id, quiz_id=None):
+    """
+    Enqueue an uploaded chunk using the configured pipeline mode
+    
+    Args:
+        chunk_id (str): Audio chunk ID
+        quiz_id (str, optional): Quiz ID, used to prioritise chunks from exams about to end
+    """
+    priority = chunk_priority(quiz_id)
+    
+    if settings.AUDIO_CONFIG['processing'].get('pipeline_mode', 'chained') == 'fused':
+        process_audio_chunk.apply_async((chunk_id,), priority=priority)
+    else:
+        preprocess_audio_chunk.apply_async((chunk_id,), priority=priority)
+
+
+# ---------------------------------------------------------------------------
+# Stage implementations (shared by the chained tasks and the fused task)
+# ---------------------------------------------------------------------------
+
+def _mark_chunk_failed(chunk_id, error):
+    """Record a processing failure on the chunk document"""
+    audio_chunks_collection.update_one(
+        {'chunk_id': chunk_id},
+        {
+            '$set': {
+                'processing_status': 'failed',
+                'error_message': str(error),
+                'updated_at': datetime.utcnow()
+            }
+        }
+    )
+
+
+def _decode_raw_audio(chunk):
+    """
+    Decode the raw upload to 16kHz mono
+    
+    Args:
+        chunk (dict): Audio chunk document
+    
+    Returns:
+        tuple: (samples, sample_rate)
+    """
+    from api.utils.audio_decode import decode_audio_bytes
+    from api.utils.audio_storage import read_audio_chunk
+    
+    # Decode straight to a 16kHz mono float32 buffer (no temp WAV round-trip);
+    # segment-stored chunks are read from their byte range
+    logger.info(f"Decoding audio file: {chunk['file_path']} (offset {chunk.get('file_offset')})")
+    y = decode_audio_bytes(read_audio_chunk(chunk), sample_rate=16000)
+    
+    return y, 16000
+
+
+def _clean_audio(chunk_id, y, sr):
+    """
+    Denoise and normalize decoded samples
+    
+    Returns:
+        np.ndarray: Preprocessed float32 samples
+    """
+    # Apply noise reduction
+    logger.info(f"Applying noise reduction for chunk: {chunk_id}")
+    y_denoised = nr.reduce_noise(y=y, sr=sr, prop_decrease=0.8)
+    
+    # Normalize audio
+    logger.info(f"Normalizing audio for chunk: {chunk_id}")
+    y_normalized = librosa.util.normalize(y_denoised)
+    
+    return y_normalized.astype(np.float32)
+
+
+def _complete_chunk(chunk, fields, flag_args=None, **session_counts):
+    """
+    Finish a chunk: store its results, raise its flag, count it on the session
+    
+    The one completion path for every pipeline mode (fused, chained, silence
+    gate, batched ASR), so session progress does not depend on pipeline_mode.
+    The flag is raised only after the results it points to are stored.
+    
+    Args:
+        chunk (dict): Audio chunk document
+        fields (dict): Result fields to $set on the chunk
+        flag_args (tuple, optional): (transcriptions, diarization_results, suspicion_results) to flag
+        **session_counts: Further session counters to increment (e.g. gated_chunks=1)
+    """
+    from api.models import audio_sessions_collection
+    
+    audio_chunks_collection.update_one(
+        {'chunk_id': chunk['chunk_id']},
+        {
+            '$set': dict(
+                fields,
+                processing_status='completed',
+                error_message=None,
+                updated_at=datetime.utcnow()
+            )
+        }
+    )
+    
+    session_inc = dict(session_counts, processed_chunks=1)
+    
+    # A retry reuses the existing flag, so it is counted once
+    if flag_args is not None:
+        _, created = _raise_audio_flag(chunk, *flag_args)
+        if created:
+            session_inc['total_flags'] = 1
+    
+    audio_sessions_collection.update_one(
+        {'session_id': chunk['session_id']},
+        {'$inc': session_inc}
+    )
+
+
+def _complete_if_silent(chunk, y, sr):
+    """
+    Run the silence gate on raw samples and finish the chunk if it is silent
+    
+    Runs before noise reduction and normalization (which would amplify a
+    silent room). A gated chunk is marked completed with one $set and
+    counted in the session's gated_chunks.
+    
+    Returns:
+        bool: True if the chunk was gated
+    """
+    from api.utils.vad import silence_gate
+    
+    gate_config = settings.AUDIO_CONFIG['processing'].get('silence_gate', {})
+    if not gate_config.get('enabled', False):
+        return False
+    
+    is_silent, gate_stats = silence_gate(
+        y, sr,
+        max_rms_dbfs=gate_config.get('max_rms_dbfs', -50.0),
+        noise_rms_dbfs=gate_config.get('noise_rms_dbfs', -40.0),
+        noise_min_zcr=gate_config.get('noise_min_zcr', 0.3)
+    )
+    if not is_silent:
+        return False
+    
+    _complete_chunk(
+        chunk,
+        {
+            'duration': len(y) / sr,
+            'vad_results': {
+                'has_speech': False,
+                'speech_segments': [],
+                'total_speech_duration': 0.0,
+                'gated': True,
+                'gate_stats': gate_stats
+            }
+        },
+        gated_chunks=1
+    )
+    
+    logger.info(f"Silence gate skipped chunk: {chunk['chunk_id']} ({gate_stats})")
+    return True
+
+
+def _stored_preprocessed(chunk):
+    """
+    Preprocessed audio an earlier attempt already stored for this chunk
+    
+    Returns:
+        dict or None: The chunk's preprocessed fields if they still point at
+        audio on disk, so a retry reuses them instead of writing (and
+        counting) the samples again
+    """
+    preprocessed_path = chunk.get('preprocessed_path')
+    if not preprocessed_path:
+        return None
+    
+    path = Path(preprocessed_path)
+    
+    if chunk.get('preprocessed_offset') is not None:
+        from api.utils.pcm_store import PCM_DTYPE
+        
+        end = chunk['preprocessed_offset'] + chunk['preprocessed_samples'] * PCM_DTYPE.itemsize
+        if not path.exists() or path.stat().st_size < end:
+            return None
+        return {
+            'preprocessed_path': preprocessed_path,
+            'preprocessed_offset': chunk['preprocessed_offset'],
+            'preprocessed_samples': chunk['preprocessed_samples']
+        }
+    
+    preprocessed_dir = settings.AUDIO_STORAGE_ROOT / 'preprocessed' / chunk['quiz_id'] / chunk['student_id']
+    if path != preprocessed_dir / f"{chunk['chunk_id']}.wav" or not path.exists():
+        return None
+    return {'preprocessed_path': preprocessed_path}
+
+
+def _save_preprocessed_audio(chunk, y, sr):
+    """
+    Write preprocessed samples to the preprocessed storage tree
+    
+    With preprocessed_format 'pcm' the samples are appended to the session's
+    memory-mapped PCM file; otherwise each chunk gets its own WAV file.
+    
+    Idempotent per chunk: the location is recorded on the chunk as soon as
+    the samples are written, so a task retry finds it (_stored_preprocessed)
+    and neither appends the samples again nor counts their bytes twice.
+    
+    Returns:
+        dict: Chunk document fields (preprocessed_path, and offset/samples for 'pcm')
+    """
+    from api.utils.storage_accounting import record_storage
+    
+    stored = _stored_preprocessed(chunk)
+    if stored is not None:
+        logger.info(f"Reusing preprocessed audio of an earlier attempt for chunk: {chunk['chunk_id']}")
+        return stored
+    
+    if settings.AUDIO_CONFIG['storage'].get('preprocessed_format', 'wav') == 'pcm':
+        from api.utils.pcm_store import append_pcm, PCM_DTYPE
+        
+        preprocessed = append_pcm(chunk, y)
+        bytes_delta = preprocessed['preprocessed_samples'] * PCM_DTYPE.itemsize
+        files_delta = 1 if preprocessed['preprocessed_offset'] == 0 else 0
+    else:
+        preprocessed_dir = settings.AUDIO_STORAGE_ROOT / 'preprocessed' / chunk['quiz_id'] / chunk['student_id']
+        preprocessed_dir.mkdir(parents=True, exist_ok=True)
+        
+        preprocessed_path = preprocessed_dir / f"{chunk['chunk_id']}.wav"
+        sf.write(str(preprocessed_path), y, sr)
+        
+        preprocessed = {'preprocessed_path': str(preprocessed_path)}
+        bytes_delta = preprocessed_path.stat().st_size
+        files_delta = 1
+    
+    audio_chunks_collection.update_one({'chunk_id': chunk['chunk_id']}, {'$set': preprocessed})
+    
+    record_storage(
+        chunk['quiz_id'], chunk['student_id'], 'preprocessed',
+        bytes_delta=bytes_delta, files_delta=files_delta, chunks_delta=1
+    )
+    
+    return preprocessed
+
+
+def _should_persist_preprocessed(flagged=False, handoff=False):
+    """
+    Decide whether preprocessed audio must be written to disk
+    
+    The fused pipeline keeps samples in memory, so the preprocessed WAV is
+    only needed when a later task reads it (handoff), when the chunk is
+    flagged and kept for teacher review, or when retention is set to 'always'.
+    """
+    policy = settings.AUDIO_CONFIG['storage'].get('persist_preprocessed', 'always')
+    return handoff or policy == 'always' or (policy == 'flagged' and flagged)
+
+
+def _load_preprocessed_audio(chunk):
+    """
+    Load preprocessed samples written by an earlier stage
+    
+    PCM-stored chunks come back as a read-only view of the mapped session file.
+    
+    Returns:
+        tuple: (samples, sample_rate)
+    """
+    if chunk.get('preprocessed_offset') is not None:
+        from api.utils.pcm_store import load_pcm, PCM_SAMPLE_RATE
+        return load_pcm(chunk), PCM_SAMPLE_RATE
+    
+    preprocessed_path = Path(chunk['preprocessed_path'])
+    if not preprocessed_path.exists():
+        raise FileNotFoundError(f"Preprocessed audio not found: {preprocessed_path}")
+    
+    return librosa.load(str(preprocessed_path), sr=16000, mono=True)
+
+
+def _run_vad(y, sr):
+    """
+    Detect voice activity in preprocessed samples
+    
+    Returns:
+        dict: VAD results (has_speech, speech_segments, total_speech_duration)
+    """
+    from api.utils.vad import detect_speech_segments
+    
+    # Vectorized segmentation with the configured backend (energy or webrtcvad)
+    return detect_speech_segments(y, sr)
+
+
+def _run_diarization(y, sr, vad_results, chunk=None):
+    """
+    Estimate speakers and assign VAD segments to them
+    
+    With a chunk and speaker profiles enabled, frames are compared against
+    the session's enrolled voice; otherwise a per-chunk MFCC variance
+    heuristic is used.
+    
+    Returns:
+        dict: Diarization results (num_speakers, speaker_segments, speaker_durations)
+    """
+    # Extract MFCC features
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    
+    profile_config = settings.AUDIO_CONFIG['processing'].get('speaker_profile', {})
+    if chunk and chunk.get('session_id') and profile_config.get('enabled', False):
+        from api.utils.speaker_profile import diarize_with_profile
+        
+        frame_times = librosa.frames_to_time(np.arange(mfccs.shape[1]), sr=sr)
+        return diarize_with_profile(
+            chunk['session_id'],
+            chunk.get('chunk_index'),
+            mfccs,
+            frame_times,
+            (vad_results or {}).get('speech_segments', [])
+        )
+    
+    # Simple speaker counting based on spectral clustering (placeholder for pyannote.audio)
+    # Simple heuristic: if variance in MFCCs is high, likely multiple speakers
+    mfcc_variance = np.var(mfccs, axis=1).mean()
+    
+    # Threshold for multiple speakers (this is a simplified approach)
+    num_speakers = 2 if mfcc_variance > 100 else 1
+    
+    # Create speaker segments based on VAD results
+    speech_segments = (vad_results or {}).get('speech_segments', [])
+    
+    speaker_segments = []
+    speaker_durations = {}
+    
+    for i, segment in enumerate(speech_segments):
+        speaker_label = f"SPEAKER_{i % num_speakers:02d}"
+        speaker_segments.append({
+            'speaker': speaker_label,
+            'start': segment['start'],
+            'end': segment['end']
+        })
+        
+        duration = segment['end'] - segment['start']
+        speaker_durations[speaker_label] = speaker_durations.get(speaker_label, 0) + duration
+    
+    return {
+        'num_speakers': num_speakers,
+        'speaker_segments': speaker_segments,
+        'speaker_durations': {k: round(v, 2) for k, v in speaker_durations.items()}
+    }
+
+
+def _run_transcription(audio, diarization_results):
+    """
+    Transcribe audio with Whisper and align segments to speakers
+    
+    Args:
+        audio (str or np.ndarray): Path to a WAV file or 16kHz float32 samples
+        diarization_results (dict): Output of the diarization stage
+    
+    Returns:
+        list: Transcription segments
+    """
+    # Resident Whisper model for this worker (loaded once per process)
+    from api.utils.asr_models import get_asr_model
+    model = get_asr_model()
+    
+    # Transcribe
+    result = model.transcribe(
+        audio,
+        language=None,  # Auto-detect
+        task='transcribe',
+        temperature=0.0
+    )
+    
+    return _align_transcription(result.get('segments', []), diarization_results)
+
+
+def _run_batched_transcription(audios):
+    """
+    Transcribe several chunks with one batched Whisper inference
+    
+    Each chunk is padded to Whisper's 30-second window and the log-mel
+    spectrograms are stacked so the encoder and decoder run once per batch.
+    
+    Args:
+        audios (list): 16kHz float32 sample arrays (one per chunk)
+    
+    Returns:
+        list: One segment dict per input (start, end, text, confidence)
+    """
+    import torch
+    import whisper
+    from api.utils.asr_models import get_asr_model
+    
+    model = get_asr_model()
+    
+    mels = [
+        whisper.log_mel_spectrogram(
+            whisper.pad_or_trim(torch.from_numpy(np.asarray(y, dtype=np.float32))),
+            n_mels=model.dims.n_mels
+        )
+        for y in audios
+    ]
+    mel_batch = torch.stack(mels).to(model.device)
+    
+    options = whisper.DecodingOptions(
+        task='transcribe',
+        language=None,  # Auto-detect per chunk
+        temperature=0.0,
+        without_timestamps=True,
+        fp16=model.device.type == 'cuda'
+    )
+    results = whisper.decode(model, mel_batch, options)
+    
+    segments = []
+    for y, result in zip(audios, results):
+        segments.append({
+            'start': 0.0,
+            'end': len(y) / 16000,
+            'text': result.text,
+            'confidence': float(np.exp(result.avg_logprob))
+        })
+    
+    return segments
+
+
+def _align_transcription(segments, diarization_results):
+    """
+    Attach a speaker label from diarization to each ASR segment
+    
+    Returns:
+        list: Transcription segments
+    """
+    speaker_segments = (diarization_results or {}).get('speaker_segments', [])
+    
+    # Align transcription with speaker segments
+    transcriptions = []
+    
+    for segment in segments:
+        # Find matching speaker
+        speaker = 'SPEAKER_00'
+        for sp_seg in speaker_segments:
+            if sp_seg['start'] <= segment['start'] <= sp_seg['end']:
+                speaker = sp_seg['speaker']
+                break
+        
+        transcriptions.append({
+            'speaker': speaker,
+            'start': round(segment['start'], 2),
+            'end': round(segment['end'], 2),
+            'text': segment['text'].strip(),
+            'confidence': round(segment.get('confidence', 0.9), 2)
+        })
+    
+    return transcriptions
+
+
+def _asr_batching_enabled():
+    """Whether transcription is deferred to the batching worker"""
+    return settings.AUDIO_CONFIG['processing'].get('asr_batching', {}).get('enabled', False)
+
+
+def _run_suspicion(chunk, transcriptions, diarization_results, duration):
+    """
+    Score transcriptions and speaker count against the quiz's keyword list
+    
+    Returns:
+        tuple: (suspicion_results, threshold)
+    """
+    from api.utils.audio_config import (
+        get_quiz_keyword_matcher,
+        get_suspicion_threshold,
+        calculate_suspicion_score,
+        get_severity_level
+    )
+    
+    transcriptions = transcriptions or []
+    num_speakers = (diarization_results or {}).get('num_speakers', 1)
+    
+    matcher = get_quiz_keyword_matcher(chunk['quiz_id'])
+    threshold = get_suspicion_threshold(chunk['quiz_id'])
+    
+    # Scan for keywords (single pass, whole words only)
+    full_text = ' '.join([t['text'] for t in transcriptions])
+    total_words = len(full_text.split())
+    
+    keyword_results = matcher.match(full_text)
+    keywords_found = keyword_results['keywords_found']
+    
+    # Calculate overlap duration (simplified)
+    overlap_duration = 0
+    
+    # Calculate suspicion score
+    score = calculate_suspicion_score(
+        num_speakers=num_speakers,
+        keyword_matches=len(keywords_found),
+        total_words=total_words,
+        overlap_duration=overlap_duration,
+        total_duration=duration or 5.0
+    )
+    
+    severity = get_severity_level(score)
+    
+    # Generate reasons
+    reasons = []
+    if num_speakers > 1:
+        reasons.append(f"Multiple speakers detected ({num_speakers})")
+    if keywords_found:
+        reasons.append(f"Suspicious keywords found: {', '.join(keywords_found[:3])}")
+    
+    suspicion_results = {
+        'score': round(score, 3),
+        'severity': severity,
+        'reasons': reasons,
+        'keywords_found': keywords_found,
+        'keyword_counts': keyword_results['keyword_counts'],
+        'keyword_matches': keyword_results['keyword_matches']
+    }
+    
+    return suspicion_results, threshold
+
+
+def _raise_audio_flag(chunk, transcriptions, diarization_results, suspicion_results):
+    """
+    Insert an audio flag and notify monitoring teachers over WebSocket
+    
+    Idempotent per chunk: the flag is upserted on audio_data.chunk_id, so a
+    retried or duplicated pipeline run finds the existing flag and neither
+    counts nor announces it again.
+    
+    Returns:
+        tuple: (flag ID, True if this call created the flag)
+    """
+    from bson import ObjectId
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+    from api.models import flags_collection
+    from api.utils.flag_counters import record_flag_created
+    
+    chunk_id = chunk['chunk_id']
+    num_speakers = (diarization_results or {}).get('num_speakers', 1)
+    severity = suspicion_results['severity']
+    
+    flag_type = 'audio_multiple_speakers' if num_speakers > 1 else 'audio_keywords'
+    description = f"Audio violation: {', '.join(suspicion_results['reasons'])}"
+    
+    # Create transcription text
+    transcription_text = '\n'.join([
+        f"[{t['speaker']}]: {t['text']}"
+        for t in transcriptions or []
+    ])
+    
+    flag_doc = {
+        '_id': ObjectId(),
+        'student_id': chunk['student_id'],
+        'quiz_id': chunk['quiz_id'],
+        'type': flag_type,
+        'description': description,
+        'timestamp': chunk['timestamp'],
+        'severity': severity,
+        'resolved': False,
+        'count': 1,
+        'audio_data': {
+            'chunk_id': chunk_id,
+            'transcription': transcription_text,
+            'num_speakers': num_speakers,
+            'keywords_found': suspicion_results['keywords_found']
+        }
+    }
+    
+    # chunk_id comes from the filter; the rest is only written on insert
+    on_insert = {field: value for field, value in flag_doc.items() if field != 'audio_data'}
+    on_insert.update({
+        f"audio_data.{field}": value
+        for field, value in flag_doc['audio_data'].items()
+        if field != 'chunk_id'
+    })
+    
+    try:
+        flag = flags_collection.find_one_and_update(
+            {'audio_data.chunk_id': chunk_id},
+            {'$setOnInsert': on_insert},
+            projection={'_id': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent run for the same chunk inserted it first
+        flag = flags_collection.find_one({'audio_data.chunk_id': chunk_id}, {'_id': 1})
+    
+    flag_id = str(flag['_id'])
+    if flag['_id'] != flag_doc['_id']:
+        logger.info(f"Audio flag for chunk {chunk_id} already exists: {flag_id}")
+        return flag_id, False
+    
+    record_flag_created(flag_doc)
+    
+    logger.info(f"Created audio flag: {flag_id}")
+    
+    # Send WebSocket notification
+    from channels.layers import get_channel_layer
+    from asgiref.sync import async_to_sync
+    
+    channel_layer = get_channel_layer()
+    
+    # No playback URL here: tokens are short-lived, so clients request one
+    # (request_audio_playback, or the flag list) when the clip is played
+    flag_notification = {
+        'type': 'audio_flag',
+        'flag': {
+            'flag_id': flag_id,
+            'student_id': chunk['student_id'],
+            'quiz_id': chunk['quiz_id'],
+            'severity': severity,
+            'transcription': transcription_text[:200],  # First 200 chars
+            'num_speakers': num_speakers,
+            'timestamp': chunk['timestamp'].isoformat(),
+            'chunk_id': chunk_id
+        }
+    }
+    
+    async_to_sync(channel_layer.group_send)(
+        f"quiz_{chunk['quiz_id']}",
+        flag_notification
+    )
+    
+    logger.info(f"Sent WebSocket notification for flag: {flag_id}")
+    
+    return flag_id, True
+
+
+# ---------------------------------------------------------------------------
+# Fused pipeline
+# ---------------------------------------------------------------------------
+
+@shared_task(bind=True, max_retries=3)
+def process_audio_chunk(self, chunk_id):
+    """
+    Run every pipeline stage for a chunk inside one worker invocation
+    
+    The raw upload is decoded once and VAD, diarization, transcription and
+    suspicion detection all work on the same in-memory array. Results are
+    written back with a single $set instead of one round-trip per stage.
+    
+    Args:
+        chunk_id (str): Audio chunk ID
+    """
+    if not AUDIO_PROCESSING_AVAILABLE:
+        logger.error(f"Audio processing libraries not available. Cannot process chunk: {chunk_id}")
+        return {'error': 'Audio processing not available'}
+    
+    from api.models import audio_sessions_collection
+    
+    chunk = None
+    try:
+        logger.info(f"Starting fused processing for chunk: {chunk_id}")
+        
+        chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
+        if not chunk:
+            logger.error(f"Chunk not found: {chunk_id}")
+            return
+        
+        y, sr = _decode_raw_audio(chunk)
+        if _complete_if_silent(chunk, y, sr):
+            return
+        
+        y = _clean_audio(chunk_id, y, sr)
+        duration = len(y) / sr
+        
+        results = {
+            'duration': duration,
+            'vad_results': _run_vad(y, sr)
+        }
+        
+        handoff = False
+        flag_args = None
+        
+        if results['vad_results']['has_speech'] and _asr_batching_enabled():
+            # Hand off to transcribe_pending_batch; detect_suspicion finishes the chunk
+            results['diarization_results'] = _run_diarization(y, sr, results['vad_results'], chunk)
+            handoff = True
+        elif results['vad_results']['has_speech']:
+            diarization_results = _run_diarization(y, sr, results['vad_results'], chunk)
+            transcriptions = _run_transcription(y, diarization_results)
+            suspicion_results, threshold = _run_suspicion(
+                chunk, transcriptions, diarization_results, duration
+            )
+            
+            results.update({
+                'diarization_results': diarization_results,
+                'transcriptions': transcriptions,
+                'suspicion_results': suspicion_results
+            })
+            
+            if suspicion_results['score'] >= threshold:
+                flag_args = (transcriptions, diarization_results, suspicion_results)
+        else:
+            logger.info(f"No speech detected in chunk: {chunk_id}, skipping further processing")
+        
+        if _should_persist_preprocessed(flagged=flag_args is not None, handoff=handoff):
+            results.update(_save_preprocessed_audio(chunk, y, sr))
+        
+        if handoff:
+            results.update({
+                'processing_status': 'transcription',
+                'error_message': None,
+                'updated_at': datetime.utcnow()
+            })
+            audio_chunks_collection.update_one({'chunk_id': chunk_id}, {'$set': results})
+        else:
+            _complete_chunk(chunk, results, flag_args)
+        
+        logger.info(f"Fused processing complete for chunk: {chunk_id}")
+    
+    except Exception as e:
+        logger.error(f"Error in fused processing for chunk {chunk_id}: {e}")
+        
+        _mark_chunk_failed(chunk_id, e)
+        
+        if chunk and self.request.retries >= self.max_retries:
+            audio_sessions_collection.update_one(
+                {'session_id': chunk['session_id']},
+                {'$inc': {'failed_chunks': 1}}
+            )
+        
+        raise self.retry(exc=e, countdown=60)
+
+
+# ---------------------------------------------------------------------------
+# Chained pipeline
+# ---------------------------------------------------------------------------
+
 @shared_task(bind=True, max_retries=3)
 def preprocess_audio_chunk(self, chunk_id):
     """
@@ -54,63 +818,29 @@ def preprocess_audio_chunk(self, chunk_id):
             {
                 '$set': {
                     'processing_status': 'preprocessing',
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
-        
-        # Get file path
-        raw_file_path = Path(chunk['file_path'])
-        if not raw_file_path.exists():
-            raise FileNotFoundError(f"Audio file not found: {raw_file_path}")
-        
-        # Load audio file
-        logger.info(f"Loading audio file: {raw_file_path}")
-        
-        # Convert to WAV using pydub (handles various formats)
-        audio = AudioSegment.from_file(str(raw_file_path))
-        
-        # Convert to mono
-        if audio.channels > 1:
-            audio = audio.set_channels(1)
-        
-        # Set sample rate to 16kHz
-        audio = audio.set_frame_rate(16000)
-        
-        # Export to temporary WAV file
-        temp_wav = raw_file_path.parent / f"{chunk_id}_temp.wav"
-        audio.export(str(temp_wav), format='wav')
-        
-        # Load with librosa for processing
-        y, sr = librosa.load(str(temp_wav), sr=16000, mono=True)
+                    'updated_at': datetime.utcnow()
+                }
+            }
+        )
         
-        # Apply noise reduction
-        logger.info(f"Applying noise reduction for chunk: {chunk_id}")
-        y_denoised = nr.reduce_noise(y=y, sr=sr, prop_decrease=0.8)
+        y, sr = _decode_raw_audio(chunk)
+        if _complete_if_silent(chunk, y, sr):
+            return
         
-        # Normalize audio
-        logger.info(f"Normalizing audio for chunk: {chunk_id}")
-        y_normalized = librosa.util.normalize(y_denoised)
+        y = _clean_audio(chunk_id, y, sr)
         
         # Save preprocessed audio
-        preprocessed_dir = settings.AUDIO_STORAGE_ROOT / 'preprocessed' / chunk['quiz_id'] / chunk['student_id']
-        preprocessed_dir.mkdir(parents=True, exist_ok=True)
-        
-        preprocessed_path = preprocessed_dir / f"{chunk_id}.wav"
-        sf.write(str(preprocessed_path), y_normalized, sr)
-        
-        # Clean up temp file
-        temp_wav.unlink()
+        preprocessed = _save_preprocessed_audio(chunk, y, sr)
         
         # Calculate duration
-        duration = len(y_normalized) / sr
+        duration = len(y) / sr
         
         # Update database
         audio_chunks_collection.update_one(
             {'chunk_id': chunk_id},
             {
                 '$set': {
-                    'preprocessed_path': str(preprocessed_path),
+                    **preprocessed,
                     'duration': duration,
                     'processing_status': 'preprocessing_complete',
                     'updated_at': datetime.utcnow()
@@ -121,22 +851,13 @@ def preprocess_audio_chunk(self, chunk_id):
         logger.info(f"Preprocessing complete for chunk: {chunk_id}")
         
         # Trigger next stage: VAD
-        detect_voice_activity.delay(chunk_id)
-        
+        detect_voice_activity.apply_async((chunk_id,), priority=chunk_priority(chunk['quiz_id']))
+    
     except Exception as e:
         logger.error(f"Error preprocessing chunk {chunk_id}: {e}")
         
         # Update status to failed
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
-            {
-                '$set': {
-                    'processing_status': 'failed',
-                    'error_message': str(e),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        _mark_chunk_failed(chunk_id, e)
         
         # Retry task
         raise self.retry(exc=e, countdown=60)
@@ -171,61 +892,10 @@ def detect_voice_activity(self, chunk_id):
         )
         
         # Load preprocessed audio
-        preprocessed_path = Path(chunk['preprocessed_path'])
-        if not preprocessed_path.exists():
-            raise FileNotFoundError(f"Preprocessed audio not found: {preprocessed_path}")
-        
-        y, sr = librosa.load(str(preprocessed_path), sr=16000, mono=True)
-        
-        # Simple energy-based VAD (placeholder for webrtcvad)
-        # Calculate frame energy
-        frame_length = int(0.03 * sr)  # 30ms frames
-        hop_length = frame_length // 2
-        
-        # Calculate RMS energy for each frame
-        rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-        
-        # Threshold for speech detection
-        threshold = np.mean(rms) * 0.5
-        
-        # Detect speech segments
-        speech_frames = rms > threshold
+        y, sr = _load_preprocessed_audio(chunk)
         
-        # Convert frames to time segments
-        speech_segments = []
-        in_speech = False
-        start_time = 0
-        
-        for i, is_speech in enumerate(speech_frames):
-            time = i * hop_length / sr
-            
-            if is_speech and not in_speech:
-                start_time = time
-                in_speech = True
-            elif not is_speech and in_speech:
-                speech_segments.append({
-                    'start': round(start_time, 2),
-                    'end': round(time, 2)
-                })
-                in_speech = False
-        
-        # Close last segment if still in speech
-        if in_speech:
-            speech_segments.append({
-                'start': round(start_time, 2),
-                'end': round(len(y) / sr, 2)
-            })
-        
-        # Calculate total speech duration
-        total_speech_duration = sum(seg['end'] - seg['start'] for seg in speech_segments)
-        has_speech = total_speech_duration > 0.5  # At least 0.5 seconds of speech
-        
-        # Store VAD results
-        vad_results = {
-            'has_speech': has_speech,
-            'speech_segments': speech_segments,
-            'total_speech_duration': round(total_speech_duration, 2)
-        }
+        vad_results = _run_vad(y, sr)
+        has_speech = vad_results['has_speech']
         
         audio_chunks_collection.update_one(
             {'chunk_id': chunk_id},
@@ -242,28 +912,16 @@ def detect_voice_activity(self, chunk_id):
         
         # If speech detected, trigger diarization
         if has_speech:
-            diarize_speakers.delay(chunk_id)
+            diarize_speakers.apply_async((chunk_id,), priority=chunk_priority(chunk['quiz_id']))
         else:
             # Mark as completed (no further processing needed)
-            audio_chunks_collection.update_one(
-                {'chunk_id': chunk_id},
-                {'$set': {'processing_status': 'completed'}}
-            )
+            _complete_chunk(chunk, {})
             logger.info(f"No speech detected in chunk: {chunk_id}, skipping further processing")
-        
+    
     except Exception as e:
         logger.error(f"Error in VAD for chunk {chunk_id}: {e}")
         
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
-            {
-                '$set': {
-                    'processing_status': 'failed',
-                    'error_message': str(e),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        _mark_chunk_failed(chunk_id, e)
         
         raise self.retry(exc=e, countdown=60)
 
@@ -297,46 +955,9 @@ def diarize_speakers(self, chunk_id):
         )
         
         # Load preprocessed audio
-        preprocessed_path = Path(chunk['preprocessed_path'])
-        if not preprocessed_path.exists():
-            raise FileNotFoundError(f"Preprocessed audio not found: {preprocessed_path}")
-        
-        # Simple speaker counting based on spectral clustering (placeholder for pyannote.audio)
-        y, sr = librosa.load(str(preprocessed_path), sr=16000, mono=True)
-        
-        # Extract MFCC features
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        
-        # Simple heuristic: if variance in MFCCs is high, likely multiple speakers
-        mfcc_variance = np.var(mfccs, axis=1).mean()
-        
-        # Threshold for multiple speakers (this is a simplified approach)
-        num_speakers = 2 if mfcc_variance > 100 else 1
-        
-        # Create speaker segments based on VAD results
-        vad_results = chunk.get('vad_results', {})
-        speech_segments = vad_results.get('speech_segments', [])
+        y, sr = _load_preprocessed_audio(chunk)
         
-        speaker_segments = []
-        speaker_durations = {}
-        
-        for i, segment in enumerate(speech_segments):
-            speaker_label = f"SPEAKER_{i % num_speakers:02d}"
-            speaker_segments.append({
-                'speaker': speaker_label,
-                'start': segment['start'],
-                'end': segment['end']
-            })
-            
-            duration = segment['end'] - segment['start']
-            speaker_durations[speaker_label] = speaker_durations.get(speaker_label, 0) + duration
-        
-        # Store diarization results
-        diarization_results = {
-            'num_speakers': num_speakers,
-            'speaker_segments': speaker_segments,
-            'speaker_durations': {k: round(v, 2) for k, v in speaker_durations.items()}
-        }
+        diarization_results = _run_diarization(y, sr, chunk.get('vad_results'), chunk)
         
         audio_chunks_collection.update_one(
             {'chunk_id': chunk_id},
@@ -349,24 +970,22 @@ def diarize_speakers(self, chunk_id):
             }
         )
         
-        logger.info(f"Diarization complete for chunk: {chunk_id}, speakers: {num_speakers}")
+        logger.info(f"Diarization complete for chunk: {chunk_id}, speakers: {diarization_results['num_speakers']}")
         
         # Trigger transcription
-        transcribe_audio.delay(chunk_id)
-        
+        if _asr_batching_enabled():
+            # Leave the chunk for transcribe_pending_batch to pick up
+            audio_chunks_collection.update_one(
+                {'chunk_id': chunk_id},
+                {'$set': {'processing_status': 'transcription', 'updated_at': datetime.utcnow()}}
+            )
+        else:
+            transcribe_audio.apply_async((chunk_id,), priority=chunk_priority(chunk['quiz_id']))
+    
     except Exception as e:
         logger.error(f"Error in diarization for chunk {chunk_id}: {e}")
         
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
-            {
-                '$set': {
-                    'processing_status': 'failed',
-                    'error_message': str(e),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        _mark_chunk_failed(chunk_id, e)
         
         raise self.retry(exc=e, countdown=60)
 
@@ -400,44 +1019,9 @@ def transcribe_audio(self, chunk_id):
         )
         
         # Load preprocessed audio
-        preprocessed_path = Path(chunk['preprocessed_path'])
-        if not preprocessed_path.exists():
-            raise FileNotFoundError(f"Preprocessed audio not found: {preprocessed_path}")
-        
-        # Load Whisper model (using base model for speed)
-        import whisper
-        model = whisper.load_model(settings.AUDIO_CONFIG['processing']['asr_model'])
-        
-        # Transcribe
-        result = model.transcribe(
-            str(preprocessed_path),
-            language=None,  # Auto-detect
-            task='transcribe',
-            temperature=0.0
-        )
+        y, sr = _load_preprocessed_audio(chunk)
         
-        # Get diarization results
-        diarization_results = chunk.get('diarization_results', {})
-        speaker_segments = diarization_results.get('speaker_segments', [])
-        
-        # Align transcription with speaker segments
-        transcriptions = []
-        
-        for segment in result.get('segments', []):
-            # Find matching speaker
-            speaker = 'SPEAKER_00'
-            for sp_seg in speaker_segments:
-                if sp_seg['start'] <= segment['start'] <= sp_seg['end']:
-                    speaker = sp_seg['speaker']
-                    break
-            
-            transcriptions.append({
-                'speaker': speaker,
-                'start': round(segment['start'], 2),
-                'end': round(segment['end'], 2),
-                'text': segment['text'].strip(),
-                'confidence': round(segment.get('confidence', 0.9), 2)
-            })
+        transcriptions = _run_transcription(y, chunk.get('diarization_results'))
         
         # Store transcriptions
         audio_chunks_collection.update_one(
@@ -454,71 +1038,308 @@ def transcribe_audio(self, chunk_id):
         logger.info(f"Transcription complete for chunk: {chunk_id}")
         
         # Trigger suspicion detection
-        detect_suspicion.delay(chunk_id)
-        
+        detect_suspicion.apply_async((chunk_id,), priority=chunk_priority(chunk['quiz_id']))
+    
     except Exception as e:
         logger.error(f"Error in transcription for chunk {chunk_id}: {e}")
         
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
+        _mark_chunk_failed(chunk_id, e)
+        
+        raise self.retry(exc=e, countdown=60)
+
+
+def _requeue_failed_asr_chunks(batch_id, chunks, error):
+    """
+    Return chunks of a failed ASR batch to the queue, or fail them when out of attempts
+    
+    Mirrors the per-chunk task's retries: each failure counts an attempt and
+    the chunk is batched again after retry_delay_seconds. Once max_attempts
+    have failed the chunk is marked failed and its session's failed_chunks
+    counted.
+    
+    Args:
+        batch_id (str): Batch the chunks were claimed by
+        chunks (list): Chunk documents of the batch that failed
+        error (Exception): Failure to record
+    
+    Returns:
+        dict: Number of chunks re-queued and failed
+    """
+    from collections import Counter
+    from datetime import timedelta
+    from api.models import audio_sessions_collection
+    
+    batching = settings.AUDIO_CONFIG['processing'].get('asr_batching', {})
+    max_attempts = batching.get('max_attempts', 4)
+    now = datetime.utcnow()
+    
+    exhausted = [chunk for chunk in chunks if chunk.get('asr_attempts', 0) + 1 >= max_attempts]
+    retry_ids = [chunk['chunk_id'] for chunk in chunks if chunk.get('asr_attempts', 0) + 1 < max_attempts]
+    
+    if retry_ids:
+        # The batch filter leaves chunks alone if a reclaim already took them back
+        audio_chunks_collection.update_many(
+            {'chunk_id': {'$in': retry_ids}, 'asr_batch_id': batch_id},
             {
                 '$set': {
-                    'processing_status': 'failed',
-                    'error_message': str(e),
-                    'updated_at': datetime.utcnow()
-                }
+                    'processing_status': 'transcription',
+                    'error_message': str(error),
+                    'asr_retry_at': now + timedelta(seconds=batching.get('retry_delay_seconds', 60)),
+                    'updated_at': now
+                },
+                '$inc': {'asr_attempts': 1},
+                '$unset': {'asr_batch_id': ''}
             }
         )
-        
-        raise self.retry(exc=e, countdown=60)
+    
+    for chunk in exhausted:
+        _mark_chunk_failed(chunk['chunk_id'], error)
+    
+    for session_id, failed in Counter(chunk['session_id'] for chunk in exhausted).items():
+        audio_sessions_collection.update_one(
+            {'session_id': session_id},
+            {'$inc': {'failed_chunks': failed}}
+        )
+    
+    if exhausted:
+        logger.error(f"{len(exhausted)} chunks of ASR batch {batch_id} failed after {max_attempts} attempts")
+    
+    return {'requeued': len(retry_ids), 'failed': len(exhausted)}
+
+
+@shared_task
+def transcribe_pending_batch():
+    """
+    Drain chunks waiting for ASR across students and transcribe them in one batch
+    
+    Claims up to batch_size chunks in processing_status 'transcription' once a
+    full batch is waiting or the oldest has waited max_wait_seconds, runs one
+    batched inference and fans the results back to each chunk. Otherwise it
+    returns at once; beat polls again every max_wait_seconds, so no worker
+    slot is held while a batch fills. Chunks of a failed batch are re-queued
+    (see _requeue_failed_asr_chunks) rather than failed outright.
+    """
+    import uuid
+    from datetime import timedelta
+    from pymongo import UpdateOne
+    
+    batching = settings.AUDIO_CONFIG['processing'].get('asr_batching', {})
+    batch_size = batching.get('batch_size', 8)
+    max_wait = batching.get('max_wait_seconds', 2.0)
+    
+    # Chunks of a failed batch wait out their retry delay
+    pending_query = {
+        'processing_status': 'transcription',
+        'asr_retry_at': {'$not': {'$gt': datetime.utcnow()}}
+    }
+    
+    # Oldest waiting chunks (one read)
+    candidates = list(
+        audio_chunks_collection.find(pending_query, {'chunk_id': 1, 'updated_at': 1})
+        .sort('updated_at', 1)
+        .limit(batch_size)
+    )
+    
+    if not candidates:
+        return {'transcribed': 0}
+    
+    oldest = candidates[0].get('updated_at') or datetime.min
+    if len(candidates) < batch_size and oldest > datetime.utcnow() - timedelta(seconds=max_wait):
+        return {'transcribed': 0, 'waiting': len(candidates)}
+    
+    # Claim them; the status filter makes the claim race-free
+    batch_id = str(uuid.uuid4())
+    candidate_ids = [c['chunk_id'] for c in candidates]
+    audio_chunks_collection.update_many(
+        {'chunk_id': {'$in': candidate_ids}, 'processing_status': 'transcription'},
+        {
+            '$set': {
+                'processing_status': 'transcription_batched',
+                'asr_batch_id': batch_id,
+                'updated_at': datetime.utcnow()
+            }
+        }
+    )
+    chunks = list(audio_chunks_collection.find({'asr_batch_id': batch_id}))
+    
+    batch = []
+    for chunk in chunks:
+        try:
+            y, sr = _load_preprocessed_audio(chunk)
+            batch.append((chunk, y))
+        except Exception as e:
+            logger.error(f"Error loading chunk {chunk['chunk_id']} for batched transcription: {e}")
+            _requeue_failed_asr_chunks(batch_id, [chunk], e)
+    
+    if not batch:
+        return {'transcribed': 0}
+    
+    logger.info(f"Starting batched transcription of {len(batch)} chunks (batch {batch_id})")
+    
+    try:
+        segments = _run_batched_transcription([y for _, y in batch])
+    except Exception as e:
+        logger.error(f"Error in batched transcription {batch_id}: {e}")
+        return dict(_requeue_failed_asr_chunks(batch_id, [chunk for chunk, _ in batch], e), error=str(e))
+    
+    now = datetime.utcnow()
+    updates = []
+    for (chunk, _), segment in zip(batch, segments):
+        transcriptions = _align_transcription([segment], chunk.get('diarization_results'))
+        updates.append(UpdateOne(
+            {'chunk_id': chunk['chunk_id']},
+            {
+                '$set': {
+                    'transcriptions': transcriptions,
+                    'processing_status': 'transcription_complete',
+                    'updated_at': now
+                }
+            }
+        ))
+    
+    audio_chunks_collection.bulk_write(updates, ordered=False)
+    
+    for chunk, _ in batch:
+        detect_suspicion.apply_async((chunk['chunk_id'],), priority=chunk_priority(chunk['quiz_id']))
+    
+    logger.info(f"Batched transcription complete: {len(batch)} chunks (batch {batch_id})")
+    
+    # Keep draining while a full batch is already waiting
+    if audio_chunks_collection.count_documents(pending_query, limit=batch_size) >= batch_size:
+        transcribe_pending_batch.delay()
+    
+    return {'transcribed': len(batch), 'batch_id': batch_id}
+
+
+@shared_task
+def reclaim_stale_asr_batches():
+    """
+    Return chunks of abandoned ASR batches to the transcription queue
+    
+    A worker that dies after claiming a batch leaves its chunks in
+    'transcription_batched'. Claims older than claim_timeout_minutes are
+    reset to 'transcription' so the next batch picks them up.
+    
+    Returns:
+        dict: Number of chunks reclaimed
+    """
+    from datetime import timedelta
+    
+    batching = settings.AUDIO_CONFIG['processing'].get('asr_batching', {})
+    cutoff = datetime.utcnow() - timedelta(minutes=batching.get('claim_timeout_minutes', 10))
+    
+    result = audio_chunks_collection.update_many(
+        {'processing_status': 'transcription_batched', 'updated_at': {'$lt': cutoff}},
+        {
+            '$set': {'processing_status': 'transcription', 'updated_at': datetime.utcnow()},
+            '$unset': {'asr_batch_id': ''}
+        }
+    )
+    
+    if result.modified_count:
+        logger.warning(f"Reclaimed {result.modified_count} chunks from stale ASR batches")
+    
+    return {'reclaimed': result.modified_count}
 
 
 @shared_task
-def cleanup_expired_audio():
+def enqueue_audio_chunks(chunk_ids, quiz_id=None):
+    """
+    Fan a batch upload out to the pipeline
+    
+    The upload view sends this single message instead of one per chunk;
+    each chunk is then queued with its own priority as usual.
+    
+    Args:
+        chunk_ids (list): Audio chunk IDs
+        quiz_id (str, optional): Quiz ID shared by the chunks
+    """
+    for chunk_id in chunk_ids:
+        enqueue_audio_chunk(chunk_id, quiz_id)
+    
+    return {'enqueued': len(chunk_ids)}
+
+
+@shared_task
+def get_asr_model_stats():
+    """
+    Report ASR model load time and resident memory for the worker that runs it
+    """
+    from api.utils.asr_models import get_asr_model_metrics
+    return get_asr_model_metrics()
+
+
+@shared_task
+def cleanup_expired_audio(max_batches=None):
     """
     Periodic task to cleanup expired audio files
     Runs daily to delete audio older than retention period
+    
+    Works in checkpointed batches (see api.utils.audio_retention); an
+    interrupted run resumes from its last batch on the next invocation.
+    
+    Args:
+        max_batches (int, optional): Stop after this many batches
     """
     try:
-        from datetime import timedelta
+        from api.utils.audio_retention import run_audio_retention
         
         logger.info("Starting audio cleanup task")
-        
-        retention_days = settings.AUDIO_CONFIG['storage']['retention_days']
-        cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
-        
-        # Find expired chunks
-        expired_chunks = audio_chunks_collection.find({
-            'created_at': {'$lt': cutoff_date}
-        })
-        
-        deleted_count = 0
-        for chunk in expired_chunks:
-            try:
-                # Delete audio files
-                from api.utils.audio_storage import delete_audio_file
-                
-                if chunk.get('file_path'):
-                    delete_audio_file(chunk['file_path'])
-                
-                if chunk.get('preprocessed_path'):
-                    delete_audio_file(chunk['preprocessed_path'])
-                
-                # Delete database record
-                audio_chunks_collection.delete_one({'_id': chunk['_id']})
-                deleted_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error deleting chunk {chunk.get('chunk_id')}: {e}")
-        
-        logger.info(f"Audio cleanup complete: deleted {deleted_count} chunks")
-        return {'deleted_count': deleted_count}
-        
+        return run_audio_retention(max_batches=max_batches)
+    
     except Exception as e:
         logger.error(f"Error in cleanup task: {e}")
         return {'error': str(e)}
 
 
+@shared_task
+def archive_closed_quiz_audio(max_batches=None):
+    """
+    Periodic task that moves audio of closed quizzes to the compressed archived tier
+    
+    Args:
+        max_batches (int, optional): Stop after this many pages; the next run continues
+    """
+    if not settings.AUDIO_CONFIG['storage'].get('compression_enabled', True):
+        return {'skipped': 'compression disabled'}
+    
+    from api.utils.audio_archive import run_audio_archival
+    
+    try:
+        return run_audio_archival(max_batches=max_batches)
+    except Exception as e:
+        logger.error(f"Error archiving audio: {e}")
+        return {'error': str(e)}
+
+
+@shared_task
+def reconcile_flag_counters():
+    """
+    Periodic task that rebuilds the materialized flag counters from the flags
+    """
+    from api.utils.flag_counters import reconcile_flag_counters as reconcile
+    
+    try:
+        return reconcile()
+    except Exception as e:
+        logger.error(f"Error reconciling flag counters: {e}")
+        return {'error': str(e)}
+
+
+@shared_task
+def reconcile_storage_stats():
+    """
+    Periodic task that recounts audio storage and corrects counter drift
+    """
+    from api.utils.storage_accounting import reconcile_storage_stats as reconcile
+    
+    try:
+        return reconcile()
+    except Exception as e:
+        logger.error(f"Error reconciling storage stats: {e}")
+        return {'error': str(e)}
+
+
 @shared_task(bind=True, max_retries=3)
 def detect_suspicion(self, chunk_id):
     """
@@ -527,6 +1348,9 @@ def detect_suspicion(self, chunk_id):
     Args:
         chunk_id (str): Audio chunk ID
     """
+    from api.models import audio_sessions_collection
+    
+    chunk = None
     try:
         logger.info(f"Starting suspicion detection for chunk: {chunk_id}")
         
@@ -550,167 +1374,31 @@ def detect_suspicion(self, chunk_id):
         # Get processing results
         transcriptions = chunk.get('transcriptions', [])
         diarization_results = chunk.get('diarization_results', {})
-        num_speakers = diarization_results.get('num_speakers', 1)
-        
-        # Get quiz keywords
-        from api.utils.audio_config import (
-            get_quiz_keywords,
-            get_suspicion_threshold,
-            calculate_suspicion_score,
-            get_severity_level
-        )
-        
-        keywords = get_quiz_keywords(chunk['quiz_id'])
-        threshold = get_suspicion_threshold(chunk['quiz_id'])
-        
-        # Scan for keywords
-        keywords_found = []
-        total_words = 0
-        
-        full_text = ' '.join([t['text'] for t in transcriptions]).lower()
-        words = full_text.split()
-        total_words = len(words)
-        
-        for keyword in keywords:
-            if keyword.lower() in full_text:
-                keywords_found.append(keyword)
-        
-        # Calculate overlap duration (simplified)
-        overlap_duration = 0
-        
-        # Calculate suspicion score
-        score = calculate_suspicion_score(
-            num_speakers=num_speakers,
-            keyword_matches=len(keywords_found),
-            total_words=total_words,
-            overlap_duration=overlap_duration,
-            total_duration=chunk.get('duration', 5.0)
-        )
-        
-        severity = get_severity_level(score)
-        
-        # Generate reasons
-        reasons = []
-        if num_speakers > 1:
-            reasons.append(f"Multiple speakers detected ({num_speakers})")
-        if keywords_found:
-            reasons.append(f"Suspicious keywords found: {', '.join(keywords_found[:3])}")
         
-        # Store suspicion results
-        suspicion_results = {
-            'score': round(score, 3),
-            'severity': severity,
-            'reasons': reasons,
-            'keywords_found': keywords_found
-        }
-        
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
-            {
-                '$set': {
-                    'suspicion_results': suspicion_results,
-                    'processing_status': 'completed',
-                    'updated_at': datetime.utcnow()
-                }
-            }
+        suspicion_results, threshold = _run_suspicion(
+            chunk, transcriptions, diarization_results, chunk.get('duration', 5.0)
         )
-        
-        logger.info(f"Suspicion detection complete for chunk: {chunk_id}, score: {score}")
+        score = suspicion_results['score']
         
         # Create flag if threshold exceeded
+        flag_args = None
         if score >= threshold:
-            from api.models import flags_collection, audio_sessions_collection
-            
-            flag_type = 'audio_multiple_speakers' if num_speakers > 1 else 'audio_keywords'
-            description = f"Audio violation: {', '.join(reasons)}"
-            
-            # Create transcription text
-            transcription_text = '\n'.join([
-                f"[{t['speaker']}]: {t['text']}"
-                for t in transcriptions
-            ])
-            
-            flag_doc = {
-                'student_id': chunk['student_id'],
-                'quiz_id': chunk['quiz_id'],
-                'type': flag_type,
-                'description': description,
-                'timestamp': chunk['timestamp'],
-                'severity': severity,
-                'resolved': False,
-                'count': 1,
-                'audio_data': {
-                    'chunk_id': chunk_id,
-                    'transcription': transcription_text,
-                    'num_speakers': num_speakers,
-                    'keywords_found': keywords_found,
-                    'audio_url': None  # Will be generated on request
-                }
-            }
-            
-            result = flags_collection.insert_one(flag_doc)
-            flag_id = str(result.inserted_id)
-            
-            logger.info(f"Created audio flag: {flag_id}")
-            
-            # Update session flag count
-            audio_sessions_collection.update_one(
-                {'session_id': chunk['session_id']},
-                {'$inc': {'total_flags': 1}}
-            )
-            
-            # Send WebSocket notification
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-            
-            channel_layer = get_channel_layer()
-            
-            flag_notification = {
-                'type': 'audio_flag',
-                'flag': {
-                    'flag_id': flag_id,
-                    'student_id': chunk['student_id'],
-                    'quiz_id': chunk['quiz_id'],
-                    'severity': severity,
-                    'transcription': transcription_text[:200],  # First 200 chars
-                    'num_speakers': num_speakers,
-                    'timestamp': chunk['timestamp'].isoformat()
-                }
-            }
-            
-            async_to_sync(channel_layer.group_send)(
-                f"quiz_{chunk['quiz_id']}",
-                flag_notification
-            )
-            
-            logger.info(f"Sent WebSocket notification for flag: {flag_id}")
+            flag_args = (transcriptions, diarization_results, suspicion_results)
         
-        # Update session processed count
-        from api.models import audio_sessions_collection
-        audio_sessions_collection.update_one(
-            {'session_id': chunk['session_id']},
-            {'$inc': {'processed_chunks': 1}}
-        )
+        _complete_chunk(chunk, {'suspicion_results': suspicion_results}, flag_args)
         
+        logger.info(f"Suspicion detection complete for chunk: {chunk_id}, score: {score}")
+    
     except Exception as e:
         logger.error(f"Error in suspicion detection for chunk {chunk_id}: {e}")
         
-        audio_chunks_collection.update_one(
-            {'chunk_id': chunk_id},
-            {
-                '$set': {
-                    'processing_status': 'failed',
-                    'error_message': str(e),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        _mark_chunk_failed(chunk_id, e)
         
         # Update session failed count
-        from api.models import audio_sessions_collection
-        audio_sessions_collection.update_one(
-            {'session_id': chunk['session_id']},
-            {'$inc': {'failed_chunks': 1}}
-        )
+        if chunk:
+            audio_sessions_collection.update_one(
+                {'session_id': chunk['session_id']},
+                {'$inc': {'failed_chunks': 1}}
+            )
         
         raise self.retry(exc=e, countdown=60)
@@ -0,0 +1,5 @@
+"""
+Unit tests for the api app's pure helpers (no MongoDB or Redis needed)
+
+    python manage.py test api
+"""
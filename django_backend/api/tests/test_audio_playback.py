@@ -0,0 +1,139 @@
+"""
+Tests for range parsing and playback tokens
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from api.utils.audio_playback import (
+    attach_playback_urls,
+    mint_playback_token,
+    parse_range_header,
+    verify_playback_token,
+    InvalidPlaybackToken,
+    RangeNotSatisfiable
+)
+
+
+class ParseRangeHeaderTests(SimpleTestCase):
+    
+    def test_no_header_serves_whole_resource(self):
+        self.assertIsNone(parse_range_header(None, 100))
+        self.assertIsNone(parse_range_header('', 100))
+    
+    def test_closed_range(self):
+        self.assertEqual(parse_range_header('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range_header('bytes=10-19', 100), (10, 19))
+    
+    def test_open_ended_range_runs_to_the_end(self):
+        self.assertEqual(parse_range_header('bytes=90-', 100), (90, 99))
+    
+    def test_end_past_the_resource_is_truncated(self):
+        self.assertEqual(parse_range_header('bytes=50-500', 100), (50, 99))
+    
+    def test_suffix_range_is_the_last_bytes(self):
+        self.assertEqual(parse_range_header('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range_header('bytes=-500', 100), (0, 99))
+    
+    def test_other_units_and_bad_syntax_are_ignored(self):
+        self.assertIsNone(parse_range_header('items=0-9', 100))
+        self.assertIsNone(parse_range_header('bytes=abc', 100))
+        self.assertIsNone(parse_range_header('bytes=-', 100))
+    
+    def test_start_beyond_the_resource_is_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=100-', 100)
+    
+    def test_reversed_range_is_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=20-10', 100)
+    
+    def test_empty_suffix_is_unsatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=-0', 100)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=-10', 0)
+    
+    def test_multiple_ranges_are_rejected(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header('bytes=0-9,20-29', 100)
+
+
+class PlaybackTokenTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.chunk = {
+            'chunk_id': 'chunk-1',
+            'file_path': str(settings.AUDIO_STORAGE_ROOT / 'raw' / 'quiz-1' / 'student-1' / 'chunk-1.webm'),
+            'file_format': 'webm',
+            'updated_at': datetime(2026, 1, 1, 12, 0, 0)
+        }
+    
+    def test_round_trip_restores_location(self):
+        token = mint_playback_token(self.chunk, 'teacher-1')
+        
+        chunk = verify_playback_token(token, 'chunk-1')
+        
+        self.assertEqual(chunk['teacher_id'], 'teacher-1')
+        self.assertEqual(chunk['file_path'], self.chunk['file_path'])
+        self.assertEqual(chunk['file_format'], 'webm')
+        self.assertIsNone(chunk['preprocessed_path'])
+        self.assertEqual(chunk['updated_at'], self.chunk['updated_at'])
+    
+    def test_expired_token_is_rejected(self):
+        token = mint_playback_token(self.chunk, 'teacher-1', ttl_seconds=-1)
+        
+        with self.assertRaisesMessage(InvalidPlaybackToken, 'expired'):
+            verify_playback_token(token, 'chunk-1')
+    
+    def test_tampered_token_is_rejected(self):
+        token = mint_playback_token(self.chunk, 'teacher-1')
+        header, payload, signature = token.split('.')
+        tampered = '.'.join([header, payload, signature[::-1]])
+        
+        with self.assertRaises(InvalidPlaybackToken):
+            verify_playback_token(tampered, 'chunk-1')
+    
+    def test_token_for_another_chunk_is_rejected(self):
+        token = mint_playback_token(self.chunk, 'teacher-1')
+        
+        with self.assertRaises(InvalidPlaybackToken):
+            verify_playback_token(token, 'chunk-2')
+    
+    def test_other_jwts_are_rejected(self):
+        import jwt
+        
+        login_token = jwt.encode({'chunk_id': 'chunk-1'}, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+        
+        with self.assertRaises(InvalidPlaybackToken):
+            verify_playback_token(login_token, 'chunk-1')
+
+
+class AttachPlaybackUrlsTests(SimpleTestCase):
+    
+    def test_urls_are_minted_for_the_teachers_stored_chunks_only(self):
+        chunks = [
+            {'chunk_id': 'own', 'quiz_id': 'quiz-1', 'file_path': '/audio/own.webm'},
+            {'chunk_id': 'other', 'quiz_id': 'quiz-2', 'file_path': '/audio/other.webm'},
+            {'chunk_id': 'deleted', 'quiz_id': 'quiz-1'},
+        ]
+        flags = [
+            {'type': 'audio_keywords', 'audio_data': {'chunk_id': chunk['chunk_id']}}
+            for chunk in chunks
+        ] + [{'type': 'tab_switch'}]
+        teachers = {'quiz-1': 'teacher-1', 'quiz-2': 'teacher-2'}
+        
+        with mock.patch('api.models.audio_chunks_collection') as collection, \
+                mock.patch('api.utils.audio_config.get_quiz_audio_config',
+                           side_effect=lambda quiz_id: SimpleNamespace(teacher_id=teachers[quiz_id])):
+            collection.find.return_value = chunks
+            attach_playback_urls(flags, 'teacher-1')
+        
+        self.assertEqual(collection.find.call_count, 1)
+        self.assertTrue(flags[0]['audio_data']['audio_url'].startswith('/api/audio/play/own/?token='))
+        self.assertNotIn('audio_url', flags[1]['audio_data'])
+        self.assertNotIn('audio_url', flags[2]['audio_data'])
+        self.assertNotIn('audio_data', flags[3])
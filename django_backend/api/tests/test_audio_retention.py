@@ -0,0 +1,68 @@
+"""
+Tests for the retention engine's paging and deletion helpers
+"""
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+import tempfile
+
+from django.test import SimpleTestCase
+
+from api.utils import audio_retention
+
+
+class ExpiredPageTests(SimpleTestCase):
+    
+    def _query(self, after):
+        with mock.patch.object(audio_retention, 'audio_chunks_collection') as collection:
+            cursor = collection.find.return_value
+            cursor.sort.return_value.limit.return_value = []
+            audio_retention._expired_page(datetime(2026, 1, 1), after, 50)
+        
+        cursor.sort.assert_called_once_with([('created_at', 1), ('_id', 1)])
+        cursor.sort.return_value.limit.assert_called_once_with(50)
+        return collection.find.call_args[0][0]
+    
+    def test_first_page_only_filters_on_cutoff(self):
+        self.assertEqual(self._query(None), {'created_at': {'$lt': datetime(2026, 1, 1)}})
+    
+    def test_later_pages_continue_after_the_last_key(self):
+        last = datetime(2025, 12, 1)
+        
+        query = self._query((last, 'last-id'))
+        
+        self.assertEqual(query, {'$and': [
+            {'created_at': {'$lt': datetime(2026, 1, 1)}},
+            {'$or': [
+                {'created_at': {'$gt': last}},
+                {'created_at': last, '_id': {'$gt': 'last-id'}}
+            ]}
+        ]})
+
+
+class WipeTests(SimpleTestCase):
+    
+    def test_wipe_reports_bytes_of_a_deleted_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'chunk.webm'
+            path.write_bytes(b'x' * 1234)
+            
+            self.assertEqual(audio_retention._wipe(str(path)), (str(path), 1234, True))
+            self.assertFalse(path.exists())
+    
+    def test_missing_file_counts_as_deleted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'gone.webm')
+            
+            self.assertEqual(audio_retention._wipe(path), (path, 0, True))
+
+
+class RecordDeletionsTests(SimpleTestCase):
+    
+    def test_deltas_are_recorded_as_decrements(self):
+        with mock.patch.object(audio_retention, 'record_storage') as record_storage:
+            audio_retention._record_deletions({('quiz-1', 'student-1', 'raw'): [2048, 2, 2]})
+        
+        record_storage.assert_called_once_with(
+            'quiz-1', 'student-1', 'raw', bytes_delta=-2048, files_delta=-2, chunks_delta=-2
+        )
@@ -0,0 +1,297 @@
+"""
+Tests for streamed audio uploads and raw audio storage
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import multiprocessing
+from pathlib import Path
+from unittest import mock
+import tempfile
+
+from django.conf import settings
+from django.http.multipartparser import MultiPartParser
+from django.test import SimpleTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.authentication import MongoUser
+from api.utils.audio_storage import (
+    AudioChunkTooLarge, AudioStreamUploadHandler, append_locked, append_to_segment, get_segment_path,
+    read_audio_chunk, stream_audio_to_staging
+)
+from api.views import audio_views
+
+
+class StorageTestCase(SimpleTestCase):
+    """Runs each test against an empty storage root with the given raw layout"""
+    
+    layout = 'files'
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        
+        storage = dict(settings.AUDIO_CONFIG['storage'], layout=self.layout, max_chunk_size_mb=1)
+        root_override = override_settings(AUDIO_STORAGE_ROOT=self.root)
+        root_override.enable()
+        self.addCleanup(root_override.disable)
+        
+        for patcher in (
+            mock.patch.dict(settings.AUDIO_CONFIG, {'storage': storage}),
+            mock.patch('api.utils.storage_accounting.record_storage')
+        ):
+            patched = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.record_storage = patched
+    
+    def staged_files(self):
+        return list((self.root / 'incoming').glob('*'))
+
+
+class FailingStream:
+    """Request body that breaks after a few blocks"""
+    
+    def __init__(self, blocks):
+        self.blocks = blocks
+    
+    def read(self, size):
+        if not self.blocks:
+            raise IOError('client went away')
+        return self.blocks.pop(0)
+
+
+def _append_payload(path, marker):
+    """Append one large single-byte payload, copied through in blocks"""
+    payload = bytes([marker]) * 1000000
+    return marker, append_locked(path, BytesIO(payload))
+
+
+class StreamToStagingTests(StorageTestCase):
+    
+    def test_body_is_copied_in_blocks(self):
+        body = bytes(range(256)) * 1000
+        
+        staged = stream_audio_to_staging(BytesIO(body), max_size=len(body), block_size=1000)
+        
+        self.assertEqual(staged.size, len(body))
+        self.assertEqual(staged.path.read_bytes(), body)
+    
+    def test_oversized_body_is_rejected_and_removed(self):
+        with self.assertRaises(AudioChunkTooLarge):
+            stream_audio_to_staging(BytesIO(b'x' * 5000), max_size=4096, block_size=1000)
+        
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_read_error_removes_the_partial_file(self):
+        with self.assertRaises(IOError):
+            stream_audio_to_staging(FailingStream([b'x' * 100, b'y' * 100]), max_size=4096)
+        
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_commit_moves_the_upload_into_raw_storage(self):
+        staged = stream_audio_to_staging(BytesIO(b'audio'), max_size=100)
+        
+        chunk_id, storage = staged.commit('q1', 's1', 'session-1', 'webm')
+        
+        self.assertEqual(Path(storage['file_path']), self.root / 'raw' / 'q1' / 's1' / f'{chunk_id}.webm')
+        self.assertEqual(Path(storage['file_path']).read_bytes(), b'audio')
+        self.assertIsNone(storage['file_offset'])
+        self.assertEqual(self.staged_files(), [])
+        self.record_storage.assert_called_once_with('q1', 's1', 'raw', bytes_delta=5, files_delta=1, chunks_delta=1)
+
+
+class UploadHandlerTests(StorageTestCase):
+    
+    def _parse(self, data, handler):
+        body = encode_multipart(BOUNDARY, data)
+        meta = {'CONTENT_TYPE': MULTIPART_CONTENT, 'CONTENT_LENGTH': str(len(body))}
+        return MultiPartParser(meta, BytesIO(body), [handler]).parse()
+    
+    def _audio(self, content, name='chunk.webm', content_type='audio/webm'):
+        upload = BytesIO(content)
+        upload.name = name
+        upload.content_type = content_type
+        return upload
+    
+    def test_audio_field_is_streamed_to_staging(self):
+        handler = AudioStreamUploadHandler()
+        content = b'a' * 200000
+        
+        fields, files = self._parse({'quiz_id': 'q1', 'audio': self._audio(content)}, handler)
+        
+        self.assertEqual(fields['quiz_id'], 'q1')
+        self.assertEqual(len(files), 0)
+        self.assertEqual(handler.audio_content_type, 'audio/webm')
+        self.assertEqual(handler.staged.size, len(content))
+        self.assertEqual(handler.staged.path.read_bytes(), content)
+    
+    def test_other_file_fields_are_dropped(self):
+        handler = AudioStreamUploadHandler()
+        
+        self._parse({'other': self._audio(b'ignored'), 'audio': self._audio(b'kept')}, handler)
+        
+        self.assertEqual(handler.staged.path.read_bytes(), b'kept')
+        self.assertEqual(len(self.staged_files()), 1)
+    
+    def test_oversized_audio_stops_the_upload(self):
+        handler = AudioStreamUploadHandler()
+        
+        self._parse({'audio': self._audio(b'x' * (1024 * 1024 + 1))}, handler)
+        
+        self.assertTrue(handler.too_large)
+        self.assertIsNone(handler.staged)
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_interrupted_upload_is_discarded(self):
+        handler = AudioStreamUploadHandler()
+        self._parse({'audio': self._audio(b'partial')}, handler)
+        
+        handler.upload_interrupted()
+        
+        self.assertIsNone(handler.staged)
+        self.assertEqual(self.staged_files(), [])
+
+
+class StreamUploadViewTests(StorageTestCase):
+    
+    params = 'quiz_id=q1&student_id=s1&session_id=session-1&chunk_index=3&timestamp=2026-01-01T10:00:00Z'
+    
+    def _post(self, body, content_type='audio/webm', params=None):
+        request = APIRequestFactory().post(
+            f'/api/audio/upload/stream/?{params or self.params}', body, content_type=content_type
+        )
+        force_authenticate(request, MongoUser({'_id': 's1', 'role': 'student'}))
+        
+        with mock.patch.object(audio_views, '_check_upload_access', return_value=None), \
+                mock.patch.object(audio_views, '_register_chunk', return_value=Response(status=status.HTTP_201_CREATED)) as register:
+            response = audio_views.upload_audio_chunk_stream(request)
+        return response, register
+    
+    def test_raw_body_is_stored(self):
+        body = b'\x1aE\xdf\xa3' + b'o' * 3000
+        
+        response, register = self._post(body)
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp = register.call_args[0]
+        self.assertEqual((quiz_id, student_id, session_id, chunk_index), ('q1', 's1', 'session-1', 3))
+        self.assertEqual(storage['file_format'], 'webm')
+        self.assertEqual(Path(storage['file_path']).read_bytes(), body)
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_raw_body_over_the_limit_is_rejected(self):
+        response, register = self._post(b'x' * (1024 * 1024 + 1))
+        
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        register.assert_not_called()
+        self.assertEqual(self.staged_files(), [])
+        self.assertFalse((self.root / 'raw').exists())
+    
+    def test_unsupported_format_discards_the_staged_body(self):
+        response, register = self._post(b'data', params=f'{self.params}&audio_format=exe')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        register.assert_not_called()
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_empty_body_is_rejected(self):
+        response, register = self._post(b'')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.staged_files(), [])
+    
+    def test_multipart_upload_is_stored(self):
+        upload = BytesIO(b'wav-bytes')
+        upload.name = 'chunk.wav'
+        upload.content_type = 'audio/wav'
+        body = encode_multipart(BOUNDARY, {
+            'quiz_id': 'q1', 'student_id': 's1', 'session_id': 'session-1',
+            'chunk_index': '0', 'timestamp': '2026-01-01T10:00:00Z', 'audio': upload
+        })
+        
+        response, register = self._post(body, content_type=MULTIPART_CONTENT, params='x=1')
+        
+        storage = register.call_args[0][1]
+        self.assertEqual(storage['file_format'], 'wav')
+        self.assertEqual(Path(storage['file_path']).read_bytes(), b'wav-bytes')
+
+
+class SegmentStorageTests(StorageTestCase):
+    
+    layout = 'segments'
+    
+    def _chunk(self, storage, chunk_id='c1'):
+        return dict(storage, chunk_id=chunk_id)
+    
+    def test_appended_chunks_read_back_by_offset(self):
+        payloads = [b'first', b'second-chunk', BytesIO(b'third from a file')]
+        
+        stored = [append_to_segment(payload, 'q1', 's1', 'session-1') for payload in payloads]
+        
+        segment = get_segment_path('q1', 's1', 'session-1')
+        self.assertEqual({entry['file_path'] for entry in stored}, {str(segment)})
+        self.assertEqual([(entry['file_offset'], entry['file_length']) for entry in stored], [(0, 5), (5, 12), (17, 17)])
+        self.assertEqual(
+            [read_audio_chunk(self._chunk(entry)) for entry in stored],
+            [b'first', b'second-chunk', b'third from a file']
+        )
+        self.assertEqual(segment.stat().st_size, 34)
+    
+    def test_own_file_chunks_are_read_whole(self):
+        path = self.root / 'chunk.webm'
+        path.write_bytes(b'whole file')
+        
+        self.assertEqual(read_audio_chunk({'chunk_id': 'c1', 'file_path': str(path), 'file_offset': None}), b'whole file')
+    
+    def test_truncated_segment_raises(self):
+        storage = append_to_segment(b'0123456789', 'q1', 's1', 'session-1')
+        with open(storage['file_path'], 'r+b') as f:
+            f.truncate(6)
+        
+        with self.assertRaises(IOError):
+            read_audio_chunk(self._chunk(storage))
+    
+    def test_missing_segment_raises(self):
+        storage = append_to_segment(b'data', 'q1', 's1', 'session-1')
+        Path(storage['file_path']).unlink()
+        
+        with self.assertRaises(FileNotFoundError):
+            read_audio_chunk(self._chunk(storage))
+    
+    def test_staged_upload_is_appended_to_the_segment(self):
+        first = stream_audio_to_staging(BytesIO(b'one'), max_size=100).commit('q1', 's1', 'session-1', 'webm')[1]
+        second = stream_audio_to_staging(BytesIO(b'two!'), max_size=100).commit('q1', 's1', 'session-1', 'webm')[1]
+        
+        self.assertEqual((second['file_offset'], second['file_length']), (3, 4))
+        self.assertEqual(read_audio_chunk(self._chunk(first)), b'one')
+        self.assertEqual(read_audio_chunk(self._chunk(second)), b'two!')
+        self.assertEqual(self.staged_files(), [])
+    
+    def _assert_disjoint(self, path, results):
+        data = Path(path).read_bytes()
+        ranges = sorted(span for marker, span in results)
+        
+        self.assertEqual(sum(length for offset, length in ranges), len(data))
+        for (offset, length), (next_offset, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(offset + length, next_offset)
+        for marker, (offset, length) in results:
+            self.assertEqual(data[offset:offset + length], bytes([marker]) * length)
+    
+    def test_concurrent_thread_appends_do_not_interleave(self):
+        path = self.root / 'shared.seg'
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(_append_payload, [path] * 32, range(32)))
+        
+        self._assert_disjoint(path, results)
+    
+    def test_concurrent_process_appends_do_not_interleave(self):
+        path = self.root / 'shared.seg'
+        
+        with multiprocessing.get_context('fork').Pool(8) as pool:
+            results = pool.starmap(_append_payload, [(path, marker) for marker in range(32)])
+        
+        self._assert_disjoint(path, results)
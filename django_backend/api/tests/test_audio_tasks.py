@@ -0,0 +1,230 @@
+"""
+Tests for the audio pipeline's chunk completion, preprocessed storage and batched transcription
+"""
+from pathlib import Path
+from unittest import mock
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from api.tasks import audio_tasks
+
+
+class RequeueFailedAsrChunksTests(SimpleTestCase):
+    
+    def _requeue(self, chunks):
+        with mock.patch.object(audio_tasks, 'audio_chunks_collection') as chunks_collection, \
+                mock.patch('api.models.audio_sessions_collection') as sessions_collection:
+            result = audio_tasks._requeue_failed_asr_chunks('batch-1', chunks, RuntimeError('CUDA error'))
+        return result, chunks_collection, sessions_collection
+    
+    def test_chunks_with_attempts_left_are_requeued(self):
+        chunks = [
+            {'chunk_id': 'c1', 'session_id': 's1'},
+            {'chunk_id': 'c2', 'session_id': 's1', 'asr_attempts': 2}
+        ]
+        
+        result, chunks_collection, sessions_collection = self._requeue(chunks)
+        
+        self.assertEqual(result, {'requeued': 2, 'failed': 0})
+        query, update = chunks_collection.update_many.call_args[0]
+        self.assertEqual(query, {'chunk_id': {'$in': ['c1', 'c2']}, 'asr_batch_id': 'batch-1'})
+        self.assertEqual(update['$set']['processing_status'], 'transcription')
+        self.assertEqual(update['$set']['error_message'], 'CUDA error')
+        self.assertGreater(update['$set']['asr_retry_at'], update['$set']['updated_at'])
+        self.assertEqual(update['$inc'], {'asr_attempts': 1})
+        self.assertEqual(update['$unset'], {'asr_batch_id': ''})
+        chunks_collection.update_one.assert_not_called()
+        sessions_collection.update_one.assert_not_called()
+    
+    def test_chunks_out_of_attempts_fail_and_count_per_session(self):
+        chunks = [
+            {'chunk_id': 'c1', 'session_id': 's1', 'asr_attempts': 3},
+            {'chunk_id': 'c2', 'session_id': 's1', 'asr_attempts': 3},
+            {'chunk_id': 'c3', 'session_id': 's2', 'asr_attempts': 3},
+            {'chunk_id': 'c4', 'session_id': 's2', 'asr_attempts': 1}
+        ]
+        
+        result, chunks_collection, sessions_collection = self._requeue(chunks)
+        
+        self.assertEqual(result, {'requeued': 1, 'failed': 3})
+        self.assertEqual(chunks_collection.update_many.call_args[0][0]['chunk_id'], {'$in': ['c4']})
+        failed = [call[0][0]['chunk_id'] for call in chunks_collection.update_one.call_args_list]
+        self.assertEqual(failed, ['c1', 'c2', 'c3'])
+        for call in chunks_collection.update_one.call_args_list:
+            self.assertEqual(call[0][1]['$set']['processing_status'], 'failed')
+        self.assertEqual(
+            [call[0] for call in sessions_collection.update_one.call_args_list],
+            [({'session_id': 's1'}, {'$inc': {'failed_chunks': 2}}),
+             ({'session_id': 's2'}, {'$inc': {'failed_chunks': 1}})]
+        )
+
+
+class TranscribePendingBatchTests(SimpleTestCase):
+    
+    def test_inference_failure_requeues_the_batch(self):
+        chunks = [{'chunk_id': f'c{i}', 'session_id': 's1', 'quiz_id': 'q1'} for i in range(8)]
+        
+        with mock.patch.object(audio_tasks, 'audio_chunks_collection') as collection, \
+                mock.patch.object(audio_tasks, '_load_preprocessed_audio', return_value=([0.0], 16000)), \
+                mock.patch.object(audio_tasks, '_run_batched_transcription', side_effect=RuntimeError('OOM')), \
+                mock.patch.object(audio_tasks, '_requeue_failed_asr_chunks',
+                                  return_value={'requeued': 8, 'failed': 0}) as requeue, \
+                mock.patch.object(audio_tasks, '_mark_chunk_failed') as mark_failed:
+            collection.find.return_value.sort.return_value.limit.return_value = [
+                {'chunk_id': chunk['chunk_id']} for chunk in chunks
+            ]
+            collection.find.side_effect = [collection.find.return_value, chunks]
+            
+            result = audio_tasks.transcribe_pending_batch()
+        
+        self.assertEqual(result['requeued'], 8)
+        self.assertEqual(result['error'], 'OOM')
+        batch_id, requeued, error = requeue.call_args[0]
+        self.assertEqual(requeued, chunks)
+        self.assertEqual(str(error), 'OOM')
+        mark_failed.assert_not_called()
+    
+    def test_retrying_chunks_are_not_picked_before_their_delay(self):
+        with mock.patch.object(audio_tasks, 'audio_chunks_collection') as collection:
+            collection.find.return_value.sort.return_value.limit.return_value = []
+            
+            self.assertEqual(audio_tasks.transcribe_pending_batch(), {'transcribed': 0})
+        
+        query = collection.find.call_args[0][0]
+        self.assertEqual(query['processing_status'], 'transcription')
+        self.assertIn('$not', query['asr_retry_at'])
+
+
+class CompleteChunkTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.chunk = {'chunk_id': 'c1', 'session_id': 's1', 'quiz_id': 'q1'}
+    
+    def _complete(self, *args, created=True, **counts):
+        with mock.patch.object(audio_tasks, 'audio_chunks_collection') as chunks_collection, \
+                mock.patch('api.models.audio_sessions_collection') as sessions_collection, \
+                mock.patch.object(audio_tasks, '_raise_audio_flag', return_value=('flag-1', created)) as raise_flag:
+            audio_tasks._complete_chunk(self.chunk, *args, **counts)
+        return chunks_collection, sessions_collection, raise_flag
+    
+    def test_results_are_stored_and_the_chunk_counted(self):
+        chunks_collection, sessions_collection, raise_flag = self._complete({'duration': 5.0}, gated_chunks=1)
+        
+        query, update = chunks_collection.update_one.call_args[0]
+        self.assertEqual(query, {'chunk_id': 'c1'})
+        self.assertEqual(update['$set']['duration'], 5.0)
+        self.assertEqual(update['$set']['processing_status'], 'completed')
+        self.assertIsNone(update['$set']['error_message'])
+        sessions_collection.update_one.assert_called_once_with(
+            {'session_id': 's1'}, {'$inc': {'gated_chunks': 1, 'processed_chunks': 1}}
+        )
+        raise_flag.assert_not_called()
+    
+    def test_new_flag_is_counted(self):
+        flag_args = (['text'], {'num_speakers': 2}, {'score': 0.9})
+        
+        _, sessions_collection, raise_flag = self._complete({}, flag_args)
+        
+        raise_flag.assert_called_once_with(self.chunk, *flag_args)
+        self.assertEqual(sessions_collection.update_one.call_args[0][1], {
+            '$inc': {'processed_chunks': 1, 'total_flags': 1}
+        })
+    
+    def test_existing_flag_is_not_counted_again(self):
+        _, sessions_collection, _ = self._complete({}, ([], {}, {}), created=False)
+        
+        self.assertEqual(sessions_collection.update_one.call_args[0][1], {'$inc': {'processed_chunks': 1}})
+
+
+class NoSpeechCompletionTests(SimpleTestCase):
+    """A chunk without speech counts as processed whatever the pipeline mode"""
+    
+    def setUp(self):
+        self.chunk = {'chunk_id': 'c1', 'session_id': 's1', 'quiz_id': 'q1'}
+        self.no_speech = {'has_speech': False, 'speech_segments': [], 'total_speech_duration': 0.0}
+    
+    def test_fused_pipeline(self):
+        with mock.patch.object(audio_tasks, 'AUDIO_PROCESSING_AVAILABLE', True), \
+                mock.patch.object(audio_tasks, 'audio_chunks_collection') as collection, \
+                mock.patch.object(audio_tasks, '_decode_raw_audio', return_value=([0.0] * 16000, 16000)), \
+                mock.patch.object(audio_tasks, '_complete_if_silent', return_value=False), \
+                mock.patch.object(audio_tasks, '_clean_audio', side_effect=lambda chunk_id, y, sr: y), \
+                mock.patch.object(audio_tasks, '_run_vad', return_value=self.no_speech), \
+                mock.patch.object(audio_tasks, '_should_persist_preprocessed', return_value=False), \
+                mock.patch.object(audio_tasks, '_complete_chunk') as complete:
+            collection.find_one.return_value = self.chunk
+            
+            audio_tasks.process_audio_chunk('c1')
+        
+        complete.assert_called_once_with(self.chunk, {'duration': 1.0, 'vad_results': self.no_speech}, None)
+    
+    def test_chained_pipeline(self):
+        with mock.patch.object(audio_tasks, 'audio_chunks_collection') as collection, \
+                mock.patch.object(audio_tasks, '_load_preprocessed_audio', return_value=([0.0], 16000)), \
+                mock.patch.object(audio_tasks, '_run_vad', return_value=self.no_speech), \
+                mock.patch.object(audio_tasks, '_complete_chunk') as complete:
+            collection.find_one.return_value = self.chunk
+            
+            audio_tasks.detect_voice_activity('c1')
+        
+        complete.assert_called_once_with(self.chunk, {})
+
+
+class SavePreprocessedAudioTests(SimpleTestCase):
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.chunk = {'chunk_id': 'c1', 'session_id': 's1', 'quiz_id': 'q1', 'student_id': 'st1'}
+        self.samples = np.linspace(-1, 1, 1600, dtype=np.float32)
+    
+    def _save(self, chunk):
+        storage = dict(settings.AUDIO_CONFIG['storage'], preprocessed_format='pcm')
+        with override_settings(AUDIO_STORAGE_ROOT=self.root), \
+                mock.patch.dict(settings.AUDIO_CONFIG, {'storage': storage}), \
+                mock.patch.object(audio_tasks, 'audio_chunks_collection') as collection, \
+                mock.patch('api.utils.storage_accounting.record_storage') as record_storage:
+            fields = audio_tasks._save_preprocessed_audio(chunk, self.samples, 16000)
+        return fields, collection, record_storage
+    
+    def test_samples_are_appended_recorded_and_counted_once(self):
+        fields, collection, record_storage = self._save(self.chunk)
+        
+        self.assertEqual(fields['preprocessed_offset'], 0)
+        self.assertEqual(fields['preprocessed_samples'], 1600)
+        collection.update_one.assert_called_once_with({'chunk_id': 'c1'}, {'$set': fields})
+        record_storage.assert_called_once_with(
+            'q1', 'st1', 'preprocessed', bytes_delta=6400, files_delta=1, chunks_delta=1
+        )
+    
+    def test_retry_reuses_the_stored_samples(self):
+        fields, _, _ = self._save(self.chunk)
+        
+        # The retry re-reads the chunk, which now carries the stored location
+        again, collection, record_storage = self._save(dict(self.chunk, **fields))
+        
+        self.assertEqual(again, fields)
+        self.assertEqual(Path(fields['preprocessed_path']).stat().st_size, 6400)
+        collection.update_one.assert_not_called()
+        record_storage.assert_not_called()
+    
+    def test_next_chunk_appends_after_the_first(self):
+        self._save(self.chunk)
+        
+        fields, _, record_storage = self._save(dict(self.chunk, chunk_id='c2'))
+        
+        self.assertEqual(fields['preprocessed_offset'], 6400)
+        self.assertEqual(record_storage.call_args[1]['files_delta'], 0)
+    
+    def test_missing_store_is_written_again(self):
+        fields, _, _ = self._save(self.chunk)
+        Path(fields['preprocessed_path']).unlink()
+        
+        again, _, record_storage = self._save(dict(self.chunk, **fields))
+        
+        self.assertEqual(again['preprocessed_offset'], 0)
+        record_storage.assert_called_once()
@@ -0,0 +1,81 @@
+"""
+Tests for JWT authentication of DRF and async views
+"""
+from unittest import mock
+import asyncio
+
+from bson import ObjectId
+from django.test import RequestFactory, SimpleTestCase
+from rest_framework import exceptions
+
+from api import authentication
+from api.authentication import JWTAuthentication, authenticate_request_async, generate_token
+
+
+class AuthenticationTests(SimpleTestCase):
+    """Both entry points share the token checks and user lookup"""
+    
+    def setUp(self):
+        self.user_id = ObjectId()
+        self.factory = RequestFactory()
+    
+    def _request(self, header=None):
+        extra = {'HTTP_AUTHORIZATION': header} if header is not None else {}
+        return self.factory.get('/', **extra)
+    
+    def _authenticate(self, request, teacher=None, student=None):
+        """Run both authenticators; returns [(sync result or error), (async result or error)]"""
+        results = []
+        
+        for run in (
+            lambda: JWTAuthentication().authenticate(request),
+            lambda: asyncio.run(authenticate_request_async(request))
+        ):
+            with mock.patch.object(authentication, 'teachers_collection') as teachers, \
+                    mock.patch.object(authentication, 'students_collection') as students:
+                teachers.find_one.return_value = dict(teacher) if teacher else None
+                students.find_one.return_value = dict(student) if student else None
+                try:
+                    results.append(run())
+                except exceptions.AuthenticationFailed as e:
+                    results.append(str(e.detail))
+        
+        return results
+    
+    def test_valid_token_returns_the_user_without_password(self):
+        token = generate_token(self.user_id)
+        teacher = {'_id': self.user_id, 'email': 't@example.com', 'password': 'hash', 'role': 'teacher'}
+        
+        (user, sync_token), async_user = self._authenticate(self._request(f'Bearer {token}'), teacher=teacher)
+        
+        self.assertEqual(sync_token, token)
+        for authenticated in (user, async_user):
+            self.assertEqual(authenticated['_id'], str(self.user_id))
+            self.assertEqual(authenticated['role'], 'teacher')
+            self.assertNotIn('password', authenticated)
+    
+    def test_students_are_found_too(self):
+        token = generate_token(self.user_id)
+        student = {'_id': self.user_id, 'email': 's@example.com', 'role': 'student'}
+        
+        (user, _), async_user = self._authenticate(self._request(f'Bearer {token}'), student=student)
+        
+        self.assertEqual(user['role'], 'student')
+        self.assertEqual(async_user['role'], 'student')
+    
+    def test_missing_or_other_scheme_is_anonymous(self):
+        self.assertEqual(self._authenticate(self._request()), [None, None])
+        self.assertEqual(self._authenticate(self._request('Basic abc')), [None, None])
+    
+    def test_failures_match(self):
+        token = generate_token(self.user_id)
+        cases = [
+            (self._request('Bearer garbage'), {}, 'Invalid token'),
+            (self._request(f'Bearer {token}'), {}, 'User not found'),
+            (self._request(f'Bearer {token}'), {'teacher': {'_id': self.user_id, 'is_active': False}},
+             'User account is disabled')
+        ]
+        
+        for request, users, message in cases:
+            with self.subTest(message=message):
+                self.assertEqual(self._authenticate(request, **users), [message, message])
@@ -0,0 +1,123 @@
+"""
+Tests for the materialized flag counters
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.utils import flag_counters
+
+
+class ScopeKeysTests(SimpleTestCase):
+    
+    def test_scopes_follow_available_ids(self):
+        self.assertEqual([key for key, _ in flag_counters._scope_keys(None, None)], ['total'])
+        self.assertEqual(
+            [key for key, _ in flag_counters._scope_keys('quiz-1', 'student-1')],
+            ['total', 'quiz:quiz-1', 'student:student-1', 'quiz_student:quiz-1:student-1']
+        )
+    
+    def test_counter_key_is_a_safe_field_name(self):
+        self.assertEqual(flag_counters._counter_key('face.missing'), 'face_missing')
+        self.assertEqual(flag_counters._counter_key('$where'), 'where')
+        self.assertEqual(flag_counters._counter_key('$'), 'unknown')
+
+
+class FlagIncrementsTests(SimpleTestCase):
+    
+    def test_created_flag(self):
+        flag = {'type': 'audio', 'severity': 'high', 'resolved': False}
+        
+        self.assertEqual(flag_counters._flag_increments(flag, 1), {
+            'total': 1, 'severity.high': 1, 'type.audio': 1
+        })
+    
+    def test_deleted_resolved_flag(self):
+        flag = {'type': 'audio', 'severity': 'low', 'resolved': True}
+        
+        self.assertEqual(flag_counters._flag_increments(flag, -1), {
+            'total': -1, 'resolved': -1, 'severity.low': -1, 'type.audio': -1
+        })
+
+
+class TransitionIncrementsTests(SimpleTestCase):
+    
+    def test_resolving(self):
+        inc = flag_counters._transition_increments({'resolved': False}, {'resolved': True})
+        
+        self.assertEqual(dict(inc), {'resolved': 1})
+    
+    def test_unresolving(self):
+        inc = flag_counters._transition_increments({'resolved': True}, {'resolved': False})
+        
+        self.assertEqual(dict(inc), {'resolved': -1})
+    
+    def test_unchanged_resolution_is_not_counted(self):
+        inc = flag_counters._transition_increments({'resolved': True}, {'resolved': True, 'notes': 'ok'})
+        
+        self.assertEqual(dict(inc), {})
+    
+    def test_escalation_moves_severity(self):
+        inc = flag_counters._transition_increments({'severity': 'medium'}, {'severity': 'critical'})
+        
+        self.assertEqual(dict(inc), {'severity.medium': -1, 'severity.critical': 1})
+    
+    def test_first_severity_is_only_added(self):
+        inc = flag_counters._transition_increments({'severity': None}, {'severity': 'low'})
+        
+        self.assertEqual(dict(inc), {'severity.low': 1})
+    
+    def test_same_severity_is_not_counted(self):
+        inc = flag_counters._transition_increments({'severity': 'high'}, {'severity': 'high'})
+        
+        self.assertEqual(dict(inc), {})
+
+
+class GetFlagCountersTests(SimpleTestCase):
+    
+    def test_seeded_counters_are_read_directly(self):
+        doc = {
+            'seeded': True, 'total': 4, 'resolved': 1,
+            'severity': {'high': 4}, 'type': {'audio': 3, 'tab_switch': 1, 'gone': 0}
+        }
+        
+        with mock.patch.object(flag_counters, 'flag_counters_collection') as counters, \
+                mock.patch.object(flag_counters, 'flags_collection') as flags:
+            counters.find_one.return_value = doc
+            
+            result = flag_counters.get_flag_counters('quiz-1')
+        
+        counters.find_one.assert_called_once_with({'_id': 'quiz:quiz-1'})
+        flags.aggregate.assert_not_called()
+        self.assertEqual(result['unresolved_flags'], 3)
+        self.assertEqual(result['severity_counts'], {'low': 0, 'medium': 0, 'high': 4, 'critical': 0})
+        self.assertEqual(list(result['type_counts'].items()), [('audio', 3), ('tab_switch', 1)])
+    
+    def test_unseeded_scope_is_counted_from_existing_flags(self):
+        rows = [
+            {'_id': {'severity': 'high', 'type': 'audio'}, 'total': 2, 'resolved': 1},
+            {'_id': {'severity': 'low', 'type': 'audio'}, 'total': 1, 'resolved': 0}
+        ]
+        
+        with mock.patch.object(flag_counters, 'flag_counters_collection') as counters, \
+                mock.patch.object(flag_counters, 'flags_collection') as flags:
+            counters.find_one.return_value = {'total': 1}
+            flags.aggregate.return_value = iter(rows)
+            
+            result = flag_counters.get_flag_counters('quiz-1', 'student-1')
+        
+        self.assertEqual(flags.aggregate.call_args[0][0][0], {'$match': {'quiz_id': 'quiz-1', 'student_id': 'student-1'}})
+        query, update = counters.update_one.call_args[0]
+        self.assertEqual(query, {'_id': 'quiz_student:quiz-1:student-1', 'seeded': {'$ne': True}})
+        self.assertTrue(update['$set']['seeded'])
+        self.assertEqual(result['total_flags'], 3)
+        self.assertEqual(result['resolved_flags'], 1)
+        self.assertEqual(result['type_counts'], {'audio': 3})
+    
+    def test_seeding_failure_returns_none(self):
+        with mock.patch.object(flag_counters, 'flag_counters_collection') as counters, \
+                mock.patch.object(flag_counters, 'flags_collection') as flags:
+            counters.find_one.return_value = None
+            flags.aggregate.side_effect = RuntimeError('down')
+            
+            self.assertIsNone(flag_counters.get_flag_counters())
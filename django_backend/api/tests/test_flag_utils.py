@@ -0,0 +1,477 @@
+"""
+Tests for flag statistics, aggregation and listing helpers
+"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+from bson import ObjectId
+from django.test import SimpleTestCase
+
+from api.utils import flag_utils
+
+
+class FlagStatisticsTests(SimpleTestCase):
+    
+    def test_counters_are_returned_when_available(self):
+        counters = {'total_flags': 3}
+        
+        with mock.patch.object(flag_utils, 'get_flag_counters', return_value=counters), \
+                mock.patch.object(flag_utils, 'flags_collection') as collection:
+            self.assertIs(flag_utils.get_flag_statistics('quiz-1'), counters)
+        
+        collection.aggregate.assert_not_called()
+    
+    def test_facet_fallback_when_counters_fail(self):
+        facets = {
+            'totals': [{'_id': None, 'total': 5, 'resolved': 2}],
+            'by_severity': [{'_id': 'high', 'count': 4}, {'_id': 'bogus', 'count': 1}],
+            'by_type': [{'_id': 'tab_switch', 'count': 1}, {'_id': 'audio', 'count': 4}, {'_id': None, 'count': 0}]
+        }
+        
+        with mock.patch.object(flag_utils, 'get_flag_counters', return_value=None), \
+                mock.patch.object(flag_utils, 'flags_collection') as collection:
+            collection.aggregate.return_value = iter([facets])
+            
+            stats = flag_utils.get_flag_statistics('quiz-1', 'student-1')
+        
+        pipeline = collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], {'$match': {'quiz_id': 'quiz-1', 'student_id': 'student-1'}})
+        self.assertEqual(stats['total_flags'], 5)
+        self.assertEqual(stats['resolved_flags'], 2)
+        self.assertEqual(stats['unresolved_flags'], 3)
+        self.assertEqual(stats['severity_counts'], {'low': 0, 'medium': 0, 'high': 4, 'critical': 0})
+        self.assertEqual(list(stats['type_counts'].items()), [('audio', 4), ('tab_switch', 1)])
+    
+    def test_facet_fallback_with_no_flags(self):
+        with mock.patch.object(flag_utils, 'get_flag_counters', return_value=None), \
+                mock.patch.object(flag_utils, 'flags_collection') as collection:
+            collection.aggregate.return_value = iter([{'totals': [], 'by_severity': [], 'by_type': []}])
+            
+            stats = flag_utils.get_flag_statistics()
+        
+        self.assertEqual(stats['total_flags'], 0)
+        self.assertEqual(stats['unresolved_flags'], 0)
+        self.assertEqual(stats['type_counts'], {})
+
+
+_REMOVE = object()
+
+
+def _evaluate(expression, doc):
+    """Evaluate the subset of aggregation expressions aggregation_update uses"""
+    if isinstance(expression, str):
+        if expression == '$$REMOVE':
+            return _REMOVE
+        return doc.get(expression[1:], None) if expression.startswith('$') else expression
+    if not isinstance(expression, dict):
+        return expression
+    
+    operator, args = next(iter(expression.items()))
+    if operator == '$literal':
+        return args
+    if operator == '$cond':
+        condition, then, otherwise = args
+        return _evaluate(then if _evaluate(condition, doc) else otherwise, doc)
+    if operator == '$eq':
+        return _evaluate(args[0], doc) == _evaluate(args[1], doc)
+    if operator == '$type':
+        return 'missing' if _evaluate(args, doc) is None else 'present'
+    if operator == '$ifNull':
+        value = _evaluate(args[0], doc)
+        return _evaluate(args[1], doc) if value is None else value
+    if operator == '$add':
+        return sum(_evaluate(arg, doc) for arg in args)
+    if operator == '$switch':
+        for branch in args['branches']:
+            if _evaluate(branch['case'], doc):
+                return _evaluate(branch['then'], doc)
+        return _evaluate(args['default'], doc)
+    raise AssertionError(f"Unexpected operator {operator}")
+
+
+def _apply_update(pipeline, doc):
+    """Apply a single-stage $set update pipeline to a document"""
+    (stage,) = pipeline
+    fields = {field: _evaluate(expression, doc) for field, expression in stage['$set'].items()}
+    
+    updated = dict(doc)
+    for field, value in fields.items():
+        if value is _REMOVE:
+            updated.pop(field, None)
+        else:
+            updated[field] = value
+    return updated
+
+
+class AggregationBucketTests(SimpleTestCase):
+    
+    def test_events_in_one_window_share_a_bucket(self):
+        start = datetime(2026, 1, 1, 10, 0, 0)
+        
+        self.assertEqual(
+            flag_utils.get_aggregation_bucket(start),
+            flag_utils.get_aggregation_bucket(start + timedelta(seconds=29, microseconds=999999))
+        )
+        self.assertEqual(
+            flag_utils.get_aggregation_bucket(start + timedelta(seconds=30)),
+            flag_utils.get_aggregation_bucket(start) + 1
+        )
+    
+    def test_bucket_counts_windows_since_epoch(self):
+        self.assertEqual(flag_utils.get_aggregation_bucket(datetime(1970, 1, 1, 0, 1, 5)), 2)
+    
+    def test_key_includes_the_bucket(self):
+        timestamp = datetime(2026, 1, 1, 10, 0, 0)
+        
+        self.assertEqual(flag_utils.aggregation_key('student-1', 'quiz-1', 'tab_switch', timestamp), {
+            'student_id': 'student-1',
+            'quiz_id': 'quiz-1',
+            'type': 'tab_switch',
+            'aggregation_bucket': flag_utils.get_aggregation_bucket(timestamp)
+        })
+
+
+class SeverityEscalationTests(SimpleTestCase):
+    
+    def test_escalation_steps_and_ceiling(self):
+        self.assertEqual(flag_utils.escalate_severity('low'), 'medium')
+        self.assertEqual(flag_utils.escalate_severity('medium', 2), 'critical')
+        self.assertEqual(flag_utils.escalate_severity('critical'), 'critical')
+        self.assertEqual(flag_utils.escalate_severity(None), 'medium')
+        self.assertEqual(flag_utils.escalate_severity('high', 0), 'high')
+    
+    def test_escalation_expression_matches_python(self):
+        for severity in ('low', 'medium', 'high', 'critical'):
+            for steps in (1, 2, 3):
+                self.assertEqual(
+                    _evaluate(flag_utils._escalated_severity_expr(steps), {'severity': severity}),
+                    flag_utils.escalate_severity(severity, steps)
+                )
+
+
+class AggregationUpdateTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.now = datetime(2026, 1, 1, 10, 0, 5)
+        self.fields = {'description': '$student.name', 'timestamp': self.now, 'severity': 'low'}
+    
+    def test_first_event_creates_the_flag(self):
+        flag = _apply_update(flag_utils.aggregation_update(self.fields, self.now), {})
+        
+        self.assertEqual(flag, {
+            'description': '$student.name',
+            'timestamp': self.now,
+            'severity': 'low',
+            'resolved': False,
+            'count': 1,
+            'updated_at': self.now
+        })
+    
+    def test_later_events_escalate_and_keep_the_previous_level(self):
+        update = flag_utils.aggregation_update(self.fields, self.now)
+        
+        flag = _apply_update(update, {})
+        flag = _apply_update(update, flag)
+        
+        self.assertEqual(flag['count'], 2)
+        self.assertEqual(flag['severity'], 'medium')
+        self.assertEqual(flag['previous_severity'], 'low')
+        
+        for _ in range(3):
+            flag = _apply_update(update, flag)
+        
+        self.assertEqual(flag['count'], 5)
+        self.assertEqual(flag['severity'], 'critical')
+        self.assertEqual(flag['previous_severity'], 'critical')
+    
+    def test_existing_fields_and_resolution_are_kept(self):
+        existing = {
+            'description': 'first', 'timestamp': self.now - timedelta(seconds=3),
+            'severity': 'medium', 'resolved': True, 'count': 2
+        }
+        
+        flag = _apply_update(flag_utils.aggregation_update(self.fields, self.now), existing)
+        
+        self.assertEqual(flag['description'], 'first')
+        self.assertEqual(flag['timestamp'], existing['timestamp'])
+        self.assertTrue(flag['resolved'])
+        self.assertEqual(flag['severity'], 'high')
+    
+    def test_batched_events_apply_as_if_sent_one_by_one(self):
+        batched = flag_utils.aggregation_update(self.fields, self.now, events=3)
+        single = flag_utils.aggregation_update(self.fields, self.now)
+        
+        one_by_one = {}
+        for _ in range(3):
+            one_by_one = _apply_update(single, one_by_one)
+        
+        flag = _apply_update(batched, {})
+        
+        self.assertEqual(flag['count'], one_by_one['count'])
+        self.assertEqual(flag['severity'], one_by_one['severity'])
+        self.assertEqual(_apply_update(batched, one_by_one)['severity'], 'critical')
+
+
+class AggregateFlagTests(SimpleTestCase):
+    
+    def _aggregate(self, stored):
+        with mock.patch.object(flag_utils, 'flags_collection') as collection, \
+                mock.patch.object(flag_utils, 'record_flag_created') as created, \
+                mock.patch.object(flag_utils, 'record_flag_changed') as changed:
+            collection.find_one_and_update.return_value = stored
+            
+            result = flag_utils.aggregate_flag('student-1', 'quiz-1', 'tab_switch', severity='low')
+        
+        self.assertEqual(collection.find_one_and_update.call_count, 1)
+        collection.find_one.assert_not_called()
+        return result, created, changed
+    
+    def test_first_event_counts_a_new_flag(self):
+        stored = {'_id': 'flag-1', 'count': 1, 'severity': 'low'}
+        
+        (flag, aggregated), created, changed = self._aggregate(stored)
+        
+        self.assertFalse(aggregated)
+        created.assert_called_once_with(stored)
+        changed.assert_not_called()
+    
+    def test_later_event_counts_the_severity_transition(self):
+        stored = {'_id': 'flag-1', 'count': 2, 'severity': 'medium', 'previous_severity': 'low'}
+        
+        (flag, aggregated), created, changed = self._aggregate(stored)
+        
+        self.assertTrue(aggregated)
+        created.assert_not_called()
+        before, changes = changed.call_args[0]
+        self.assertEqual(before['severity'], 'low')
+        self.assertEqual(changes, {'severity': 'medium'})
+
+
+class WindowFlags:
+    """In-memory flags collection answering aggregation upserts"""
+    
+    def __init__(self, *flags):
+        self.flags = list(flags)
+    
+    def find_one_and_update(self, query, update, upsert, return_document):
+        for index, flag in enumerate(self.flags):
+            if all(flag.get(field) == value for field, value in query.items()):
+                self.flags[index] = _apply_update(update, flag)
+                return self.flags[index]
+        
+        flag = _apply_update(update, dict(query, _id=ObjectId()))
+        self.flags.append(flag)
+        return flag
+
+
+class AggregateFlagEventsTests(SimpleTestCase):
+    
+    start = datetime(2026, 1, 1, 10, 0, 0)
+    
+    def _aggregate(self, collection, events):
+        with mock.patch.object(flag_utils, 'flags_collection', collection), \
+                mock.patch.object(flag_utils, 'record_flag_batch') as batch:
+            results = flag_utils.aggregate_flag_events('student-1', 'quiz-1', events)
+        return results, batch
+    
+    def _event(self, flag_type, seconds, severity='low'):
+        return {'type': flag_type, 'timestamp': self.start + timedelta(seconds=seconds), 'severity': severity}
+    
+    def test_new_windows_are_counted_as_created(self):
+        collection = WindowFlags()
+        
+        results, batch = self._aggregate(collection, [
+            self._event('tab_switch', 0), self._event('tab_switch', 5), self._event('copy_paste', 1)
+        ])
+        
+        self.assertEqual([(r['type'], r['events'], r['severity'], r['aggregated']) for r in results], [
+            ('tab_switch', 2, 'medium', False), ('copy_paste', 1, 'low', False)
+        ])
+        quiz_id, student_id, created, changed = batch.call_args[0]
+        self.assertEqual([(flag['type'], flag['severity']) for flag in created], [('tab_switch', 'medium'), ('copy_paste', 'low')])
+        self.assertEqual(changed, [])
+        batch.assert_called_once()
+    
+    def test_existing_flag_transition_uses_the_stored_severity(self):
+        # Written by another request after the client sent its batch
+        existing = flag_utils.aggregation_key('student-1', 'quiz-1', 'tab_switch', self.start)
+        existing.update({'_id': ObjectId(), 'timestamp': self.start, 'severity': 'high', 'resolved': False, 'count': 3})
+        collection = WindowFlags(existing)
+        
+        results, batch = self._aggregate(collection, [self._event('tab_switch', 2)])
+        
+        self.assertEqual(results[0]['severity'], 'critical')
+        self.assertTrue(results[0]['aggregated'])
+        self.assertEqual(results[0]['flag_id'], str(existing['_id']))
+        created, changed = batch.call_args[0][2:]
+        self.assertEqual(created, [])
+        ((before, changes),) = changed
+        self.assertEqual(before['severity'], 'high')
+        self.assertEqual(changes, {'severity': 'critical'})
+    
+    def test_batch_matches_events_sent_one_by_one(self):
+        events = [self._event('tab_switch', seconds) for seconds in (0, 3, 31, 7)]
+        batched = WindowFlags()
+        one_by_one = WindowFlags()
+        
+        self._aggregate(batched, events)
+        for event in events:
+            self._aggregate(one_by_one, [event])
+        
+        def summary(collection):
+            return sorted((flag['aggregation_bucket'], flag['count'], flag['severity']) for flag in collection.flags)
+        self.assertEqual(summary(batched), summary(one_by_one))
+    
+    def test_empty_batch_writes_nothing(self):
+        collection = mock.Mock()
+        
+        results, batch = self._aggregate(collection, [])
+        
+        self.assertEqual(results, [])
+        collection.find_one_and_update.assert_not_called()
+        batch.assert_not_called()
+
+
+class FlagCursorTests(SimpleTestCase):
+    
+    def test_round_trip(self):
+        flag = {'_id': ObjectId(), 'timestamp': datetime(2026, 1, 1, 10, 0, 0, 123456)}
+        
+        cursor = flag_utils.encode_flag_cursor(flag)
+        
+        self.assertNotIn('=', cursor)
+        self.assertEqual(flag_utils.decode_flag_cursor(cursor), {
+            '$or': [
+                {'timestamp': {'$lt': flag['timestamp']}},
+                {'timestamp': flag['timestamp'], '_id': {'$lt': flag['_id']}}
+            ]
+        })
+    
+    def test_invalid_cursors_raise(self):
+        bad_id = flag_utils.encode_flag_cursor({'_id': 'not-an-id', 'timestamp': datetime(2026, 1, 1)})
+        
+        for cursor in ('', 'not a cursor', 'e30', bad_id, 'eyJ0IjogIm5vdy'):
+            with self.subTest(cursor=cursor):
+                with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+                    flag_utils.decode_flag_cursor(cursor)
+
+
+class ListFlagsTests(SimpleTestCase):
+    
+    def _flags(self, count):
+        start = datetime(2026, 1, 1, 10, 0, 0)
+        return [{'_id': ObjectId(), 'timestamp': start - timedelta(seconds=index)} for index in range(count)]
+    
+    def _list(self, stored, query, **kwargs):
+        with mock.patch.object(flag_utils, 'flags_collection') as collection:
+            cursor = collection.find.return_value
+            cursor.sort.return_value.hint.return_value.limit.return_value = stored
+            
+            result = flag_utils.list_flags(query, **kwargs)
+        
+        cursor.sort.assert_called_once_with([('timestamp', -1), ('_id', -1)])
+        hinted = cursor.sort.return_value.hint
+        hinted.assert_called_once_with(flag_utils.flag_list_index(query))
+        return result, collection.find.call_args[0], hinted.return_value.limit.call_args[0][0]
+    
+    def test_full_page_returns_a_cursor_for_its_last_flag(self):
+        stored = self._flags(3)
+        
+        (flags, next_cursor), (query, projection), fetched = self._list(stored, {'quiz_id': 'quiz-1'}, limit=2)
+        
+        self.assertEqual(fetched, 3)
+        self.assertEqual(flags, stored[:2])
+        self.assertEqual(next_cursor, flag_utils.encode_flag_cursor(stored[1]))
+        self.assertEqual(projection, flag_utils.FLAG_LIST_PROJECTIONS['compact'])
+    
+    def test_last_page_has_no_cursor(self):
+        stored = self._flags(2)
+        
+        (flags, next_cursor), _, _ = self._list(stored, {}, limit=2)
+        
+        self.assertEqual(flags, stored)
+        self.assertIsNone(next_cursor)
+    
+    def test_cursor_is_combined_with_the_filters(self):
+        last = self._flags(1)[0]
+        cursor = flag_utils.encode_flag_cursor(last)
+        
+        _, (query, _), _ = self._list([], {'student_id': 'student-1', 'resolved': False}, cursor=cursor)
+        
+        self.assertEqual(query, {'$and': [
+            {'student_id': 'student-1', 'resolved': False},
+            flag_utils.decode_flag_cursor(cursor)
+        ]})
+    
+    def test_limit_is_capped(self):
+        _, _, fetched = self._list([], {}, limit=10 ** 6)
+        
+        self.assertEqual(fetched, flag_utils.MAX_FLAG_PAGE_SIZE + 1)
+    
+    def test_full_view_returns_whole_documents(self):
+        _, (_, projection), _ = self._list([], {'quiz_id': 'quiz-1'}, view='full')
+        
+        self.assertIsNone(projection)
+    
+    def test_compact_view_omits_the_transcription(self):
+        projection = flag_utils.FLAG_LIST_PROJECTIONS['compact']
+        
+        self.assertNotIn('audio_data', projection)
+        self.assertNotIn('audio_data.transcription', projection)
+        self.assertIn('transcription_preview', projection)
+    
+    def test_every_filter_combination_is_accepted(self):
+        fields = ('quiz_id', 'student_id', 'resolved', 'severity')
+        
+        for mask in range(2 ** len(fields)):
+            query = {field: 'value' for bit, field in enumerate(fields) if mask & (1 << bit)}
+            with self.subTest(query=query):
+                self._list([], query)
+    
+    def test_invalid_requests_raise_before_querying(self):
+        invalid = [
+            ({}, {'limit': 'many'}),
+            ({}, {'view': 'everything'}),
+            ({}, {'cursor': 'garbage'})
+        ]
+        
+        for query, kwargs in invalid:
+            with self.subTest(query=query, **kwargs):
+                with mock.patch.object(flag_utils, 'flags_collection') as collection:
+                    with self.assertRaises(ValueError):
+                        flag_utils.list_flags(query, **kwargs)
+                
+                collection.find.assert_not_called()
+
+
+class FlagListIndexTests(SimpleTestCase):
+    
+    def _shape(self, *fields):
+        index = flag_utils.flag_list_index({field: 'value' for field in fields})
+        
+        self.assertEqual(index[-2:], [('timestamp', -1), ('_id', -1)])
+        return tuple(field for field, _ in index[:-2])
+    
+    def test_filter_sets_with_an_index_use_it(self):
+        for shape in flag_utils.FLAG_LIST_SHAPES:
+            with self.subTest(shape=shape):
+                self.assertEqual(self._shape(*shape), shape)
+    
+    def test_other_filter_sets_use_the_closest_prefix(self):
+        self.assertEqual(self._shape('quiz_id'), ('quiz_id', 'student_id'))
+        self.assertEqual(self._shape('student_id'), ('student_id', 'resolved'))
+        self.assertEqual(self._shape('student_id', 'severity'), ('student_id', 'resolved'))
+        self.assertEqual(self._shape('quiz_id', 'student_id', 'resolved', 'severity'), ('quiz_id', 'student_id'))
+        self.assertEqual(self._shape('quiz_id', 'resolved', 'severity'), ('quiz_id', 'resolved'))
+    
+    def test_unindexed_filters_fall_back_to_the_timestamp_index(self):
+        self.assertEqual(self._shape('severity'), ())
+        self.assertEqual(self._shape('type'), ())
+    
+    def test_list_indexes_are_not_prefixes_of_each_other(self):
+        shapes = flag_utils.FLAG_LIST_SHAPES
+        
+        for shape in shapes:
+            for other in shapes:
+                if shape and shape != other:
+                    self.assertNotEqual(other[:len(shape)], shape)
@@ -0,0 +1,50 @@
+"""
+Tests for batched flag event parsing
+"""
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from api.utils.flag_utils import MAX_FLAG_EVENT_AGE_SECONDS
+from api.views.flag_views import _parse_event_timestamp
+
+
+class ParseEventTimestampTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.now = datetime(2026, 1, 1, 10, 0, 0)
+    
+    def test_missing_timestamp_is_now(self):
+        self.assertEqual(_parse_event_timestamp(None, self.now), self.now)
+        self.assertEqual(_parse_event_timestamp('', self.now), self.now)
+    
+    def test_recent_utc_timestamp_is_kept(self):
+        self.assertEqual(
+            _parse_event_timestamp('2026-01-01T09:59:30Z', self.now),
+            datetime(2026, 1, 1, 9, 59, 30)
+        )
+    
+    def test_offset_is_converted_to_naive_utc(self):
+        self.assertEqual(
+            _parse_event_timestamp('2026-01-01T15:29:45+05:30', self.now),
+            datetime(2026, 1, 1, 9, 59, 45)
+        )
+    
+    def test_naive_timestamp_is_taken_as_utc(self):
+        self.assertEqual(
+            _parse_event_timestamp('2026-01-01T09:59:50', self.now),
+            datetime(2026, 1, 1, 9, 59, 50)
+        )
+    
+    def test_future_timestamp_is_clamped_to_now(self):
+        self.assertEqual(_parse_event_timestamp('2026-01-01T11:00:00Z', self.now), self.now)
+    
+    def test_old_timestamp_is_clamped_to_the_oldest_accepted(self):
+        oldest = self.now - timedelta(seconds=MAX_FLAG_EVENT_AGE_SECONDS)
+        
+        self.assertEqual(_parse_event_timestamp('2025-12-31T10:00:00Z', self.now), oldest)
+        self.assertEqual(_parse_event_timestamp(oldest.isoformat(), self.now), oldest)
+    
+    def test_invalid_timestamp_raises(self):
+        with self.assertRaises(ValueError):
+            _parse_event_timestamp('yesterday', self.now)
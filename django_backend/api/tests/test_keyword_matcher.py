@@ -0,0 +1,163 @@
+"""
+Tests for the Aho-Corasick keyword matcher
+"""
+import random
+
+from django.test import SimpleTestCase
+
+from api.utils import keyword_matcher
+from api.utils.keyword_matcher import KeywordMatcher, get_keyword_matcher, invalidate_keyword_matcher, tokenize
+
+DEFAULT_KEYWORDS = [
+    'help', 'tell me', "what's the answer", 'give me', 'you', 'your answer',
+    'same as', 'copy', 'answer key', 'solution', 'cheat sheet', 'cheat',
+    'question', 'problem', 'which one', 'answer'
+]
+
+
+def legacy_match(keywords, text):
+    """Keyword scan as it was in detect_suspicion"""
+    full_text = text.lower()
+    return [keyword for keyword in keywords if keyword.lower() in full_text]
+
+
+def padded_legacy_match(keywords, text):
+    """The substring scan restricted to whole words (padded by spaces on both sides)"""
+    full_text = f" {' '.join(word for word, _, _ in tokenize(text))} "
+    return [keyword for keyword in keywords if f" {keyword.lower()} " in full_text]
+
+
+def brute_force_matches(keywords, text):
+    """Every (keyword, start, end) occurrence by checking each keyword at each word"""
+    tokens = tokenize(text)
+    matches = []
+    for end in range(1, len(tokens) + 1):
+        for keyword in keywords:
+            words = [word for word, _, _ in tokenize(keyword)]
+            start = end - len(words)
+            if start >= 0 and [word for word, _, _ in tokens[start:end]] == words:
+                matches.append((keyword, tokens[start][1], tokens[end - 1][2]))
+    return sorted(matches)
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+    
+    def test_agrees_with_the_substring_scan_on_whole_words(self):
+        rng = random.Random(0)
+        pool = [
+            'you', 'your', 'young', 'the', 'answer', 'tell', 'me', 'is', "what's", 'key', 'cheat', 'sheet',
+            'give', 'same', 'as', 'copy', 'help', 'which', 'one', 'problem', 'solution', 'question'
+        ]
+        
+        for _ in range(200):
+            text = ' '.join(rng.choice(pool) for _ in range(rng.randint(0, 30)))
+            with self.subTest(text=text):
+                self.assertEqual(
+                    set(self.matcher.match(text)['keywords_found']),
+                    set(padded_legacy_match(DEFAULT_KEYWORDS, text))
+                )
+    
+    def test_positions_match_a_brute_force_scan(self):
+        rng = random.Random(1)
+        pool = ['a', 'b', 'c', 'a b', 'b c']
+        keywords = ['a', 'a b', 'b', 'a b c', 'c a', 'b c b']
+        matcher = KeywordMatcher(keywords)
+        
+        for _ in range(200):
+            text = ' '.join(rng.choice(pool) for _ in range(rng.randint(0, 20)))
+            with self.subTest(text=text):
+                found = sorted((m['keyword'], m['start'], m['end']) for m in matcher.find_all(text))
+                self.assertEqual(found, brute_force_matches(keywords, text))
+    
+    def test_only_whole_words_match(self):
+        text = "Your young friend is yourself"
+        
+        self.assertIn('you', legacy_match(DEFAULT_KEYWORDS, text))
+        self.assertEqual(self.matcher.match(text)['keywords_found'], [])
+        self.assertEqual(self.matcher.match('can you help')['keywords_found'], ['you', 'help'])
+    
+    def test_overlapping_keywords_are_all_reported(self):
+        result = self.matcher.match("Cheat sheet: what's the answer key?")
+        
+        self.assertEqual(
+            [(m['keyword'], m['start'], m['end']) for m in result['keyword_matches']],
+            [
+                ('cheat', 0, 5),
+                ('cheat sheet', 0, 11),
+                ("what's the answer", 13, 30),
+                ('answer', 24, 30),
+                ('answer key', 24, 34)
+            ]
+        )
+        self.assertEqual(
+            result['keywords_found'],
+            ['cheat', 'cheat sheet', "what's the answer", 'answer', 'answer key']
+        )
+    
+    def test_repeated_keywords_are_counted(self):
+        result = self.matcher.match('help, HELP me. Help!')
+        
+        self.assertEqual(result['keyword_counts'], [{'keyword': 'help', 'count': 3}])
+        self.assertEqual([m['start'] for m in result['keyword_matches']], [0, 6, 15])
+    
+    def test_punctuation_and_spacing_between_phrase_words(self):
+        found = self.matcher.match('Tell   me,\nwhich\tone')['keywords_found']
+        
+        self.assertEqual(found, ['tell me', 'which one'])
+    
+    def test_unicode_offsets_point_into_the_original_text(self):
+        matcher = KeywordMatcher(['naïve', 'straße', 'kya hai', 'उत्तर'])
+        text = 'Ça va? NAÏVE question, die STRASSE ist keine Straße; उत्तर बताओ, kya hai'
+        
+        for match in matcher.find_all(text):
+            with self.subTest(match=match):
+                self.assertEqual(text[match['start']:match['end']].lower(), match['keyword'])
+        self.assertEqual(matcher.match(text)['keywords_found'], ['naïve', 'straße', 'उत्तर', 'kya hai'])
+    
+    def test_indic_words_are_not_split_at_combining_marks(self):
+        matcher = KeywordMatcher(['उत्तर', 'बताओ', 'क्या है'])
+        
+        self.assertEqual(tokenize('उत्तर बताओ')[0], ('उत्तर', 0, 5))
+        self.assertEqual(matcher.match('मुझे उत्तर बताओ, क्या है?')['keywords_found'], ['उत्तर', 'बताओ', 'क्या है'])
+        # Part of a longer word does not match
+        self.assertEqual(matcher.match('उत्तरों को बताओगे')['keywords_found'], [])
+    
+    def test_length_changing_case_mapping_keeps_offsets(self):
+        matcher = KeywordMatcher(['help'])
+        text = 'İ need help'
+        
+        (match,) = matcher.find_all(text)
+        
+        self.assertEqual(text[match['start']:match['end']], 'help')
+    
+    def test_keywords_are_normalised_and_deduplicated(self):
+        matcher = KeywordMatcher(['Tell  Me', 'tell me', '  ', 'HELP'])
+        
+        self.assertEqual(matcher.keywords, ['tell me', 'help'])
+        self.assertEqual(len(matcher), 2)
+    
+    def test_empty_inputs(self):
+        self.assertEqual(KeywordMatcher([]).match('anything')['keywords_found'], [])
+        self.assertEqual(self.matcher.match('')['keyword_matches'], [])
+
+
+class KeywordMatcherCacheTests(SimpleTestCase):
+    
+    def tearDown(self):
+        keyword_matcher._matchers.clear()
+    
+    def test_matcher_is_reused_until_keywords_change(self):
+        first = get_keyword_matcher('quiz-1', ['a', 'b'])
+        
+        self.assertIs(get_keyword_matcher('quiz-1', ['b', 'a']), first)
+        self.assertIsNot(get_keyword_matcher('quiz-1', ['a', 'c']), first)
+    
+    def test_invalidate_drops_the_matcher(self):
+        first = get_keyword_matcher('quiz-1', ['a'])
+        
+        invalidate_keyword_matcher('quiz-1')
+        
+        self.assertIsNot(get_keyword_matcher('quiz-1', ['a']), first)
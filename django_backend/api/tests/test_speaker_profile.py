@@ -0,0 +1,54 @@
+"""
+Tests for the speaker profile's chunk de-duplication
+"""
+from django.test import SimpleTestCase
+
+from api.utils.speaker_profile import _empty_profile, _mark_merged
+
+
+class MarkMergedTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.profile = _empty_profile(13)
+    
+    def _merge(self, *indexes, window=4):
+        return [_mark_merged(self.profile, index, window) for index in indexes]
+    
+    def test_in_order_chunks_only_advance_the_high_water_mark(self):
+        self.assertEqual(self._merge(0, 1, 2, 3), [True] * 4)
+        
+        self.assertEqual(self.profile['merged_through'], 3)
+        self.assertEqual(self.profile['merged_ahead'], [])
+    
+    def test_duplicates_are_rejected(self):
+        self._merge(0, 1, 5)
+        
+        self.assertEqual(self._merge(0, 1, 5), [False] * 3)
+    
+    def test_out_of_order_chunks_fill_the_gap(self):
+        self.assertEqual(self._merge(0, 3, 2, 1), [True] * 4)
+        
+        self.assertEqual(self.profile['merged_through'], 3)
+        self.assertEqual(self.profile['merged_ahead'], [])
+        self.assertEqual(self._merge(2), [False])
+    
+    def test_state_stays_bounded_past_a_missing_chunk(self):
+        self._merge(0, *range(2, 200), window=4)
+        
+        self.assertLessEqual(len(self.profile['merged_ahead']), 4)
+        self.assertEqual(self.profile['merged_through'], 199)
+        # The chunk that never arrived in time is given up on
+        self.assertEqual(self._merge(1), [False])
+    
+    def test_window_keeps_recent_gaps_open(self):
+        self._merge(0, 2, 3, 4)
+        
+        self.assertEqual(self.profile['merged_through'], 0)
+        self.assertEqual(self._merge(1), [True])
+        self.assertEqual(self.profile['merged_through'], 4)
+    
+    def test_profiles_without_de_dup_state_are_upgraded(self):
+        profile = {'n': 0, 'mean': [], 'm2': [], 'enrolled_seconds': 0.0}
+        
+        self.assertTrue(_mark_merged(profile, 7, 4))
+        self.assertFalse(_mark_merged(profile, 7, 4))
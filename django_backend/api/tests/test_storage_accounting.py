@@ -0,0 +1,78 @@
+"""
+Tests for the incremental storage counters
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.utils import storage_accounting
+
+
+class RecordStorageTests(SimpleTestCase):
+    
+    def _record(self, **deltas):
+        with mock.patch.object(storage_accounting, 'storage_stats_collection') as collection:
+            storage_accounting.record_storage('quiz-1', 'student-1', 'raw', **deltas)
+        return collection
+    
+    def test_one_upsert_per_scope(self):
+        collection = self._record(bytes_delta=100, files_delta=1, chunks_delta=1)
+        
+        operations = collection.bulk_write.call_args[0][0]
+        self.assertEqual(
+            [operation._filter for operation in operations],
+            [{'_id': 'total'}, {'_id': 'quiz:quiz-1'}, {'_id': 'student:quiz-1:student-1'}]
+        )
+        for operation in operations:
+            self.assertTrue(operation._upsert)
+            self.assertEqual(operation._doc['$inc'], {'raw.bytes': 100, 'raw.files': 1, 'raw.chunks': 1})
+        self.assertEqual(operations[2]._doc['$setOnInsert'], {
+            'scope': 'student', 'quiz_id': 'quiz-1', 'student_id': 'student-1'
+        })
+    
+    def test_only_nonzero_deltas_are_incremented(self):
+        collection = self._record(bytes_delta=-50)
+        
+        for operation in collection.bulk_write.call_args[0][0]:
+            self.assertEqual(operation._doc['$inc'], {'raw.bytes': -50})
+    
+    def test_no_change_skips_the_write(self):
+        collection = self._record()
+        
+        collection.bulk_write.assert_not_called()
+    
+    def test_write_errors_are_swallowed(self):
+        with mock.patch.object(storage_accounting, 'storage_stats_collection') as collection:
+            collection.bulk_write.side_effect = RuntimeError('down')
+            
+            storage_accounting.record_storage('quiz-1', 'student-1', 'raw', bytes_delta=1)
+
+
+class TierSummaryTests(SimpleTestCase):
+    
+    def test_missing_document_reads_as_zero(self):
+        summary = storage_accounting._tier_summary(None)
+        
+        self.assertEqual(set(summary), set(storage_accounting.STORAGE_TIERS))
+        for counters in summary.values():
+            self.assertEqual(counters, {'files': 0, 'chunks': 0, 'bytes': 0})
+    
+    def test_partial_counters_are_filled_in(self):
+        summary = storage_accounting._tier_summary({'raw': {'bytes': 10}, 'archived': {'chunks': 3}})
+        
+        self.assertEqual(summary['raw'], {'files': 0, 'chunks': 0, 'bytes': 10})
+        self.assertEqual(summary['archived'], {'files': 0, 'chunks': 3, 'bytes': 0})
+
+
+class GetStorageCountersTests(SimpleTestCase):
+    
+    def _key(self, *args):
+        with mock.patch.object(storage_accounting, 'storage_stats_collection') as collection:
+            collection.find_one.return_value = None
+            storage_accounting.get_storage_counters(*args)
+        return collection.find_one.call_args[0][0]['_id']
+    
+    def test_scope_key_follows_arguments(self):
+        self.assertEqual(self._key(), 'total')
+        self.assertEqual(self._key('quiz-1'), 'quiz:quiz-1')
+        self.assertEqual(self._key('quiz-1', 'student-1'), 'student:quiz-1:student-1')
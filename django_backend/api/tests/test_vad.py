@@ -0,0 +1,239 @@
+"""
+Tests for the vectorized VAD helpers against per-frame reference loops
+"""
+import numpy as np
+from django.test import SimpleTestCase
+
+from api.utils.vad import (
+    EnergyVAD,
+    detect_speech_segments,
+    frame_rms,
+    hysteresis_mask,
+    mask_to_segments,
+    silence_gate
+)
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = int(0.03 * SAMPLE_RATE)
+HOP_LENGTH = FRAME_LENGTH // 2
+HOP_SECONDS = HOP_LENGTH / SAMPLE_RATE
+
+
+def make_signal(seconds, bursts, seed=0):
+    """Quiet noise floor with louder noise bursts at the given (start, end) seconds"""
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 0.005, int(seconds * SAMPLE_RATE))
+    
+    for start, end in bursts:
+        burst = slice(int(start * SAMPLE_RATE), int(end * SAMPLE_RATE))
+        y[burst] += rng.normal(0, 0.2, burst.stop - burst.start)
+    
+    return y
+
+
+def loop_rms(y, frame_length, hop_length):
+    """Per-frame RMS over a zero-padded, centered signal (as librosa.feature.rms)"""
+    padded = np.pad(np.asarray(y, dtype=np.float64), frame_length // 2)
+    n_frames = 1 + (len(padded) - frame_length) // hop_length
+    
+    return np.array([
+        np.sqrt(np.mean(padded[i * hop_length:i * hop_length + frame_length] ** 2))
+        for i in range(n_frames)
+    ])
+
+
+def loop_hysteresis(values, high, low):
+    """Frame-by-frame hysteresis: runs above low that touch high somewhere"""
+    mask = np.zeros(len(values), dtype=bool)
+    i = 0
+    while i < len(values):
+        if values[i] > low:
+            j = i
+            while j < len(values) and values[j] > low:
+                j += 1
+            mask[i:j] = any(values[k] > high for k in range(i, j))
+            i = j
+        else:
+            i += 1
+    return mask
+
+
+def loop_segments(speech_frames, total_duration):
+    """Segmentation loop as it was in detect_voice_activity"""
+    speech_segments = []
+    in_speech = False
+    start_time = 0
+    
+    for i, is_speech in enumerate(speech_frames):
+        time = i * HOP_SECONDS
+        
+        if is_speech and not in_speech:
+            start_time = time
+            in_speech = True
+        elif not is_speech and in_speech:
+            speech_segments.append((round(start_time, 2), round(time, 2)))
+            in_speech = False
+    
+    if in_speech:
+        speech_segments.append((round(start_time, 2), round(total_duration, 2)))
+    
+    return speech_segments
+
+
+class FrameRmsTests(SimpleTestCase):
+    
+    def test_matches_per_frame_rms(self):
+        y = make_signal(2.0, [(0.3, 0.9), (1.2, 1.5)])
+        
+        np.testing.assert_allclose(
+            frame_rms(y, FRAME_LENGTH, HOP_LENGTH), loop_rms(y, FRAME_LENGTH, HOP_LENGTH), atol=1e-9
+        )
+    
+    def test_constant_signal(self):
+        rms = frame_rms(np.full(SAMPLE_RATE, 0.5), FRAME_LENGTH, HOP_LENGTH)
+        
+        # Frames away from the zero-padded edges see only the constant
+        np.testing.assert_allclose(rms[2:-2], 0.5)
+    
+    def test_short_and_empty_input(self):
+        self.assertEqual(len(frame_rms(np.zeros(0), FRAME_LENGTH, HOP_LENGTH)), 1)
+        np.testing.assert_allclose(
+            frame_rms(np.ones(10), FRAME_LENGTH, HOP_LENGTH), loop_rms(np.ones(10), FRAME_LENGTH, HOP_LENGTH)
+        )
+
+
+class HysteresisMaskTests(SimpleTestCase):
+    
+    def test_runs_need_to_reach_the_high_threshold(self):
+        values = np.array([0, 2, 2, 0, 2, 5, 2, 2, 0, 5, 0, 2], dtype=float)
+        
+        mask = hysteresis_mask(values, high=4, low=1)
+        
+        self.assertEqual(mask.astype(int).tolist(), [0, 0, 0, 0, 1, 1, 1, 1, 0, 1, 0, 0])
+    
+    def test_matches_frame_by_frame_hysteresis(self):
+        rng = np.random.default_rng(1)
+        
+        for _ in range(20):
+            values = rng.random(500)
+            np.testing.assert_array_equal(hysteresis_mask(values, 0.8, 0.4), loop_hysteresis(values, 0.8, 0.4))
+    
+    def test_equal_thresholds_are_a_plain_threshold(self):
+        values = np.random.default_rng(2).random(300)
+        
+        np.testing.assert_array_equal(hysteresis_mask(values, 0.5, 0.5), values > 0.5)
+    
+    def test_nothing_above_low(self):
+        self.assertFalse(hysteresis_mask(np.zeros(10), 1, 0.5).any())
+
+
+class MaskToSegmentsTests(SimpleTestCase):
+    
+    def _segments(self, mask, total, **kwargs):
+        starts, ends = mask_to_segments(np.asarray(mask, dtype=bool), HOP_SECONDS, total, **kwargs)
+        return [(round(float(s), 2), round(float(e), 2)) for s, e in zip(starts, ends)]
+    
+    def test_matches_the_original_loop(self):
+        rng = np.random.default_rng(3)
+        
+        for _ in range(20):
+            mask = rng.random(400) > 0.6
+            total = len(mask) * HOP_SECONDS + 0.01
+            self.assertEqual(self._segments(mask, total), loop_segments(mask, total))
+    
+    def test_leading_and_trailing_speech(self):
+        mask = [True, True, False, False, True]
+        
+        self.assertEqual(self._segments(mask, 1.0), loop_segments(mask, 1.0))
+        self.assertEqual(self._segments(mask, 1.0)[-1][1], 1.0)
+    
+    def test_no_speech(self):
+        self.assertEqual(self._segments([False] * 10, 1.0), [])
+        self.assertEqual(self._segments([], 0.0), [])
+    
+    def test_short_gaps_are_merged(self):
+        # Two runs 2 frames (30 ms) apart, then one 20 frames (300 ms) later
+        mask = [True] * 10 + [False] * 2 + [True] * 10 + [False] * 20 + [True] * 10 + [False]
+        
+        segments = self._segments(mask, 1.0, min_silence=0.15)
+        
+        self.assertEqual(segments, [
+            (0.0, round(22 * HOP_SECONDS, 2)),
+            (round(42 * HOP_SECONDS, 2), round(52 * HOP_SECONDS, 2))
+        ])
+    
+    def test_short_segments_are_dropped_after_merging(self):
+        mask = [True] * 3 + [False] + [True] * 3 + [False] * 30 + [True] * 3 + [False]
+        
+        segments = self._segments(mask, 1.0, min_speech=0.08, min_silence=0.05)
+        
+        # The first pair merges into 7 frames (105 ms); the lone 3-frame run (45 ms) is dropped
+        self.assertEqual(segments, [(0.0, round(7 * HOP_SECONDS, 2))])
+
+
+class SilenceGateTests(SimpleTestCase):
+    
+    def test_digital_silence(self):
+        is_silent, stats = silence_gate(np.zeros(SAMPLE_RATE), SAMPLE_RATE)
+        
+        self.assertTrue(is_silent)
+        self.assertEqual(stats['peak_rms_dbfs'], -200.0)
+    
+    def test_quiet_hiss_is_silent(self):
+        hiss = np.random.default_rng(4).normal(0, 0.006, SAMPLE_RATE)
+        
+        is_silent, stats = silence_gate(hiss, SAMPLE_RATE)
+        
+        # Above the silence level, but below the noise level with a noise-like ZCR
+        self.assertTrue(-50 < stats['peak_rms_dbfs'] < -40)
+        self.assertTrue(is_silent)
+        self.assertGreaterEqual(stats['zero_crossing_rate'], 0.3)
+    
+    def test_quiet_voiced_tone_is_kept(self):
+        t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+        tone = 0.01 * np.sin(2 * np.pi * 150 * t)
+        
+        is_silent, stats = silence_gate(tone, SAMPLE_RATE)
+        
+        self.assertTrue(-50 < stats['peak_rms_dbfs'] < -40)
+        self.assertFalse(is_silent)
+        self.assertLess(stats['zero_crossing_rate'], 0.3)
+    
+    def test_one_loud_window_keeps_the_chunk(self):
+        y = np.zeros(5 * SAMPLE_RATE)
+        y[SAMPLE_RATE:SAMPLE_RATE + 1600] = np.random.default_rng(5).normal(0, 0.2, 1600)
+        
+        self.assertFalse(silence_gate(y, SAMPLE_RATE)[0])
+
+
+class EnergyVadTests(SimpleTestCase):
+    
+    def test_level_two_matches_the_original_threshold_without_hysteresis(self):
+        y = make_signal(3.0, [(0.5, 1.0), (1.8, 2.6)])
+        rms = frame_rms(y, FRAME_LENGTH, HOP_LENGTH)
+        
+        mask, hop_seconds = EnergyVAD(aggressiveness=2, hysteresis_ratio=1.0).speech_mask(y, SAMPLE_RATE)
+        
+        self.assertEqual(hop_seconds, HOP_SECONDS)
+        np.testing.assert_array_equal(mask, rms > np.mean(rms) * 0.5)
+    
+    def test_speech_segments_follow_the_bursts(self):
+        y = make_signal(3.0, [(0.5, 1.0), (1.8, 2.6)])
+        
+        results = detect_speech_segments(y, SAMPLE_RATE, backend=EnergyVAD(), min_speech=0.1, min_silence=0.15)
+        
+        self.assertTrue(results['has_speech'])
+        segments = [(segment['start'], segment['end']) for segment in results['speech_segments']]
+        self.assertEqual(len(segments), 2)
+        for (start, end), (expected_start, expected_end) in zip(segments, [(0.5, 1.0), (1.8, 2.6)]):
+            self.assertAlmostEqual(start, expected_start, delta=0.03)
+            self.assertAlmostEqual(end, expected_end, delta=0.03)
+        self.assertAlmostEqual(results['total_speech_duration'], 1.3, delta=0.06)
+    
+    def test_noise_floor_only_has_no_speech(self):
+        results = detect_speech_segments(
+            np.zeros(SAMPLE_RATE), SAMPLE_RATE, backend=EnergyVAD(), min_speech=0.1, min_silence=0.15
+        )
+        
+        self.assertFalse(results['has_speech'])
+        self.assertEqual(results['speech_segments'], [])
@@ -2,7 +2,7 @@
 API URL Configuration - yahan saare API endpoints define karte hain
 """
 from django.urls import path
-from api.views import auth_views, quiz_views, flag_views, health_views, audio_views, theme_views, ai_views
+from api.views import auth_views, quiz_views, flag_views, health_views, audio_views, audio_async_views, theme_views, ai_views
 
 urlpatterns = [
     # Health check - server chal raha hai ya nahi check karne ke liye
@@ -21,6 +21,7 @@ urlpatterns = [
     
     # Flag endpoints - violation flags manage karne ke liye
     path('flags/', flag_views.flag_list_create, name='flag_list_create'), # Flags list aur create karne ke liye
+    path('flags/batch/', flag_views.flag_batch_create, name='flag_batch_create'), # Kai flag events ek request mein bhejne ke liye
     path('flags/<str:flag_id>/', flag_views.flag_detail, name='flag_detail'), # Specific flag details get karne ke liye
     
     # Submission endpoints
@@ -29,12 +30,16 @@ urlpatterns = [
     
     # Audio proctoring endpoints - audio monitoring ke liye
     path('audio/upload/', audio_views.upload_audio_chunk, name='upload_audio_chunk'), # Audio chunks upload karne ke liye
+    path('audio/upload/async/', audio_async_views.upload_audio_chunk_async, name='upload_audio_chunk_async'), # ASGI par async upload (spikes ke liye)
+    path('audio/upload/batch/', audio_views.upload_audio_chunks_batch, name='upload_audio_chunks_batch'), # Kai audio chunks ek request mein upload karne ke liye
+    path('audio/upload/stream/', audio_views.upload_audio_chunk_stream, name='upload_audio_chunk_stream'), # Binary audio chunks stream karke upload karne ke liye
     path('audio/flag/', audio_views.flag_suspicious_audio, name='flag_suspicious_audio'), # Suspicious audio flag karne ke liye
     path('audio/session/start/', audio_views.start_audio_session, name='start_audio_session'), # Audio session start karne ke liye
     path('audio/session/end/', audio_views.end_audio_session, name='end_audio_session'), # Audio session end karne ke liye
     path('audio/session/<str:session_id>/', audio_views.get_session_status, name='get_session_status'), # Session status check karne ke liye
     path('audio/chunk/<str:chunk_id>/', audio_views.get_chunk_details, name='get_chunk_details'), # Audio chunk details get karne ke liye
     path('audio/play/<str:chunk_id>/', audio_views.play_audio_chunk, name='play_audio_chunk'), # Audio chunk play karne ke liye
+    path('audio/storage/stats/', audio_views.get_audio_storage_stats, name='get_audio_storage_stats'), # Audio storage usage dekhne ke liye
     
     # Theme endpoints
     path('user/theme/', theme_views.get_user_theme, name='get_user_theme'),
@@ -0,0 +1,171 @@
+"""
+Process-level ASR model registry
+
+Whisper weights are loaded once per Celery worker process and kept resident,
+instead of being reloaded for every 5-second chunk.
+"""
+from django.conf import settings
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# model name -> loaded whisper model
+_models = {}
+
+# model name -> load metrics
+_metrics = {}
+
+# Queues the current worker consumes from (set before the pool forks)
+_worker_queues = []
+
+_lock = threading.Lock()
+
+
+def set_worker_queues(queues):
+    """
+    Remember which queues this worker consumes from
+    
+    Args:
+        queues (iterable): Queue names
+    """
+    _worker_queues[:] = list(queues)
+
+
+def get_worker_model_name():
+    """
+    Get the ASR model size this worker should serve
+    
+    Uses AUDIO_CONFIG['processing']['asr_models_by_queue'] when one of the
+    worker's queues has an entry, otherwise the global asr_model.
+    
+    Returns:
+        str: Whisper model name
+    """
+    processing = settings.AUDIO_CONFIG['processing']
+    models_by_queue = processing.get('asr_models_by_queue', {})
+    
+    for queue in _worker_queues:
+        if queue in models_by_queue:
+            return models_by_queue[queue]
+    
+    return processing['asr_model']
+
+
+def get_asr_model(model_name=None):
+    """
+    Get a resident Whisper model, loading it on first use
+    
+    Args:
+        model_name (str, optional): Whisper model name (defaults to this worker's model)
+    
+    Returns:
+        whisper.Whisper: Loaded model
+    """
+    model_name = model_name or get_worker_model_name()
+    
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+    
+    with _lock:
+        # Another thread may have loaded it while we waited
+        model = _models.get(model_name)
+        if model is not None:
+            return model
+        
+        import whisper
+        
+        rss_before = _resident_memory_bytes()
+        started = time.perf_counter()
+        
+        model = whisper.load_model(model_name)
+        
+        load_seconds = time.perf_counter() - started
+        rss_after = _resident_memory_bytes()
+        
+        _models[model_name] = model
+        _metrics[model_name] = {
+            'model': model_name,
+            'pid': os.getpid(),
+            'load_seconds': round(load_seconds, 3),
+            'loaded_at': time.time(),
+            'resident_memory_mb': _to_mb(rss_after),
+            'model_memory_mb': _to_mb(rss_after - rss_before) if rss_before is not None and rss_after is not None else None
+        }
+        
+        logger.info(
+            f"Loaded ASR model '{model_name}' in {load_seconds:.2f}s "
+            f"(pid {os.getpid()}, rss {_metrics[model_name]['resident_memory_mb']} MB)"
+        )
+        
+        return model
+
+
+def preload_asr_models():
+    """
+    Load this worker's ASR model ahead of the first task
+    
+    Called from the worker_process_init signal. Workers that only consume
+    non-ASR queues skip it. Failures are logged and the model is loaded
+    lazily on first use instead.
+    """
+    from exam_proctoring.celery import QUEUE_ASR_HEAVY
+    
+    if _worker_queues and QUEUE_ASR_HEAVY not in _worker_queues:
+        return
+    
+    model_name = get_worker_model_name()
+    
+    try:
+        get_asr_model(model_name)
+    except Exception as e:
+        logger.warning(f"Could not preload ASR model '{model_name}': {e}")
+
+
+def get_asr_model_metrics():
+    """
+    Get load-time and memory metrics for resident models in this process
+    
+    Returns:
+        dict: Metrics keyed by model name plus current process memory
+    """
+    return {
+        'pid': os.getpid(),
+        'worker_queues': list(_worker_queues),
+        'resident_memory_mb': _to_mb(_resident_memory_bytes()),
+        'models': {name: dict(metrics) for name, metrics in _metrics.items()}
+    }
+
+
+def _resident_memory_bytes():
+    """
+    Get current resident set size of this process
+    
+    Returns:
+        int or None: RSS in bytes, None if it cannot be determined
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    
+    try:
+        import resource
+        import sys
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def _to_mb(value):
+    """Convert bytes to megabytes rounded for reporting"""
+    if value is None:
+        return None
+    return round(value / (1024 * 1024), 1)
@@ -0,0 +1,403 @@
+"""
+Tiered archival of audio after a quiz closes
+
+Once a quiz has ended, its processed chunks are moved to the 'archived'
+tier as one compact file per chunk under AUDIO_STORAGE_ROOT/archived:
+
+- preprocessed audio (float32 PCM / WAV, by far the largest) is re-encoded
+  to Opus or FLAC (storage.archive.codec)
+- raw uploads already in a compressed container (webm/ogg/mp3 from the
+  browser) are copied out of the session segment file as they are; raw
+  WAV uploads are re-encoded like preprocessed audio
+
+New files are written completely before the chunk document is switched to
+them with a single update_one guarded on the old location, so readers see
+either the old or the new files, never a mix. Old files are removed only
+after the switch; session files go once no chunk refers to them.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import io
+import os
+import time
+import logging
+
+from django.conf import settings
+
+from api.models import audio_chunks_collection
+from api.utils.audio_storage import delete_audio_file, read_audio_chunk
+from api.utils.audio_retention import delete_unreferenced_shared
+from api.utils.storage_accounting import record_storage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_TIER = 'archived'
+
+# Chunks in these states are never touched by the pipeline again
+ARCHIVABLE_STATUSES = ('completed', 'failed')
+
+# Raw formats that are already compressed and are archived byte-for-byte
+_COMPRESSED_FORMATS = ('webm', 'ogg', 'mp3')
+
+# codec -> (file extension, soundfile format, soundfile subtype)
+_CODECS = {
+    'opus': ('opus', 'OGG', 'OPUS'),
+    'flac': ('flac', 'FLAC', 'PCM_16'),
+}
+
+_OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+_CHUNK_PROJECTION = {
+    '_id': 1,
+    'chunk_id': 1,
+    'quiz_id': 1,
+    'student_id': 1,
+    'file_path': 1,
+    'file_offset': 1,
+    'file_length': 1,
+    'file_format': 1,
+    'preprocessed_path': 1,
+    'preprocessed_offset': 1,
+    'preprocessed_samples': 1
+}
+
+
+def get_archive_config():
+    """storage.archive settings with defaults"""
+    archive_config = {
+        'codec': 'opus',
+        'delay_hours': 1,
+        'batch_size': 200,
+        'workers': 4
+    }
+    archive_config.update(settings.AUDIO_CONFIG['storage'].get('archive', {}))
+    return archive_config
+
+
+def get_archive_dir(quiz_id, student_id):
+    """Directory holding a student's archived chunks for a quiz"""
+    return settings.AUDIO_STORAGE_ROOT / ARCHIVED_TIER / quiz_id / student_id
+
+
+def encode_audio(y, sample_rate, codec):
+    """
+    Encode mono float samples in memory
+    
+    Args:
+        y (np.ndarray): Samples
+        sample_rate (int): Sample rate
+        codec (str): 'opus' or 'flac'
+    
+    Returns:
+        tuple: (encoded bytes, file extension)
+    """
+    import numpy as np
+    import soundfile as sf
+    
+    extension, file_format, subtype = _CODECS[codec]
+    
+    if codec == 'opus' and sample_rate not in _OPUS_SAMPLE_RATES:
+        import librosa
+        y = librosa.resample(np.asarray(y, dtype=np.float32), orig_sr=sample_rate, target_sr=48000)
+        sample_rate = 48000
+    
+    buffer = io.BytesIO()
+    # Integer FLAC would wrap out-of-range samples
+    sf.write(buffer, np.clip(y, -1.0, 1.0), sample_rate, format=file_format, subtype=subtype)
+    
+    return buffer.getvalue(), extension
+
+
+def _write_atomic(path, data):
+    """Write a file under a temporary name and rename it into place"""
+    os.makedirs(path.parent, exist_ok=True)
+    
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _load_preprocessed_samples(chunk):
+    """Preprocessed samples and sample rate of a hot-tier chunk"""
+    if chunk.get('preprocessed_offset') is not None:
+        from api.utils.pcm_store import load_pcm, PCM_SAMPLE_RATE
+        return load_pcm(chunk), PCM_SAMPLE_RATE
+    
+    import soundfile as sf
+    return sf.read(chunk['preprocessed_path'], dtype='float32')
+
+
+def _archive_chunk(chunk, codec):
+    """
+    Write a chunk's archived files and switch its document to them
+    
+    Returns:
+        dict or None: Old and new file details, or None if the chunk changed meanwhile
+    """
+    archive_dir = get_archive_dir(chunk['quiz_id'], chunk['student_id'])
+    written = []
+    update = {
+        'storage_tier': ARCHIVED_TIER,
+        'archived_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+    
+    try:
+        if chunk.get('file_path'):
+            raw_format = chunk.get('file_format') or Path(chunk['file_path']).suffix.lstrip('.')
+            data = read_audio_chunk(chunk)
+            
+            if raw_format not in _COMPRESSED_FORMATS:
+                import soundfile as sf
+                y, sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+                data, raw_format = encode_audio(y.mean(axis=1), sr, codec)
+            
+            raw_path = archive_dir / f"{chunk['chunk_id']}.{raw_format}"
+            _write_atomic(raw_path, data)
+            written.append((raw_path, len(data)))
+            update.update({
+                'file_path': str(raw_path),
+                'file_offset': None,
+                'file_length': None,
+                'file_format': raw_format
+            })
+        
+        if chunk.get('preprocessed_path'):
+            y, sr = _load_preprocessed_samples(chunk)
+            data, extension = encode_audio(y, sr, codec)
+            
+            preprocessed_path = archive_dir / f"{chunk['chunk_id']}.pre.{extension}"
+            _write_atomic(preprocessed_path, data)
+            written.append((preprocessed_path, len(data)))
+            update.update({
+                'preprocessed_path': str(preprocessed_path),
+                'preprocessed_offset': None,
+                'preprocessed_samples': None
+            })
+    
+    except Exception:
+        for path, _ in written:
+            path.unlink(missing_ok=True)
+        raise
+    
+    # Switch only if the chunk still points at the files that were archived
+    result = audio_chunks_collection.update_one(
+        {
+            '_id': chunk['_id'],
+            'file_path': chunk.get('file_path'),
+            'preprocessed_path': chunk.get('preprocessed_path'),
+            'storage_tier': {'$ne': ARCHIVED_TIER}
+        },
+        {'$set': update}
+    )
+    
+    if not result.modified_count:
+        for path, _ in written:
+            path.unlink(missing_ok=True)
+        return None
+    
+    return {
+        'chunk': chunk,
+        'bytes': sum(size for _, size in written),
+        'files': len(written)
+    }
+
+
+def _try_archive_chunk(chunk, codec):
+    try:
+        return _archive_chunk(chunk, codec)
+    except Exception as e:
+        logger.error(f"Error archiving audio chunk {chunk['chunk_id']}: {e}")
+        return False
+
+
+def _release_hot_files(archived, pool):
+    """
+    Remove the hot-tier files of archived chunks and update the storage counters
+    
+    Args:
+        archived (list): Results of _archive_chunk
+        pool (ThreadPoolExecutor): Pool used for the wipes
+    
+    Returns:
+        int: Bytes freed in the hot tiers
+    """
+    # (quiz_id, student_id, tier) -> [bytes, files, chunks]
+    deltas = defaultdict(lambda: [0, 0, 0])
+    own_files = []
+    shared_files = set()
+    
+    for item in archived:
+        chunk = item['chunk']
+        scope = (chunk['quiz_id'], chunk['student_id'])
+        
+        archived_delta = deltas[scope + (ARCHIVED_TIER,)]
+        archived_delta[0] += item['bytes']
+        archived_delta[1] += item['files']
+        archived_delta[2] += 1
+        
+        for field, offset_field, own_tier, shared_tier in (
+            ('file_path', 'file_offset', 'raw', 'segments'),
+            ('preprocessed_path', 'preprocessed_offset', 'preprocessed', 'preprocessed')
+        ):
+            path = chunk.get(field)
+            if not path:
+                continue
+            if chunk.get(offset_field) is not None:
+                shared_files.add((field, chunk['quiz_id'], chunk['student_id'], path))
+                deltas[scope + (shared_tier,)][2] -= 1
+            else:
+                own_files.append((scope + (own_tier,), path))
+                deltas[scope + (own_tier,)][2] -= 1
+    
+    freed = 0
+    for (key, _), size in zip(own_files, pool.map(lambda entry: delete_audio_file(entry[1]), own_files)):
+        if size:
+            deltas[key][0] -= int(size)
+            deltas[key][1] -= 1
+            freed += int(size)
+    
+    for quiz_id, student_id, tier, size in delete_unreferenced_shared(shared_files, pool):
+        deltas[(quiz_id, student_id, tier)][0] -= size
+        deltas[(quiz_id, student_id, tier)][1] -= 1
+        freed += size
+    
+    for (quiz_id, student_id, tier), (size, files, chunks) in deltas.items():
+        record_storage(quiz_id, student_id, tier, bytes_delta=size, files_delta=files, chunks_delta=chunks)
+    
+    return freed
+
+
+def get_closed_quiz_ids(delay_hours):
+    """
+    Quizzes with hot-tier audio whose exam has closed
+    
+    A quiz is closed once end_time + delay_hours has passed, or when it has
+    been deleted. Deactivation alone does not count: a teacher may pause a
+    running exam and resume it. Quizzes without an end_time are left to
+    retention cleanup. Closed quizzes that still have chunks in the pipeline
+    are skipped until every chunk has finished.
+    
+    Returns:
+        list: Quiz IDs
+    """
+    from api.utils.audio_config import get_quiz_audio_config
+    
+    threshold = datetime.utcnow() - timedelta(hours=delay_hours)
+    closed = []
+    
+    for quiz_id in audio_chunks_collection.distinct('quiz_id', {'storage_tier': {'$ne': ARCHIVED_TIER}}):
+        quiz_config = get_quiz_audio_config(quiz_id)
+        
+        if not quiz_config.exists:
+            closed.append(quiz_id)
+        elif quiz_config.end_time and quiz_config.end_time <= threshold:
+            closed.append(quiz_id)
+    
+    if not closed:
+        return closed
+    
+    # Still queued / being processed somewhere (one query for all candidates)
+    unfinished = set(audio_chunks_collection.distinct('quiz_id', {
+        'quiz_id': {'$in': closed},
+        'processing_status': {'$nin': list(ARCHIVABLE_STATUSES)}
+    }))
+    if unfinished:
+        logger.info(f"Deferring archival of {len(unfinished)} closed quizzes with chunks still in the pipeline")
+    
+    return [quiz_id for quiz_id in closed if quiz_id not in unfinished]
+
+
+def run_audio_archival(quiz_ids=None, batch_size=None, workers=None, max_batches=None):
+    """
+    Move processed chunks of closed quizzes to the archived tier
+    
+    Safe to re-run at any point: archived chunks are skipped, and chunks
+    that changed while being encoded are left for the next run.
+    
+    Args:
+        quiz_ids (list, optional): Quizzes to archive (defaults to all closed quizzes)
+        batch_size (int, optional): Chunks per page (defaults to storage.archive.batch_size)
+        workers (int, optional): Encoding threads (defaults to storage.archive.workers)
+        max_batches (int, optional): Stop after this many pages
+    
+    Returns:
+        dict: Totals for the run
+    """
+    archive_config = get_archive_config()
+    codec = archive_config['codec']
+    batch_size = batch_size or archive_config['batch_size']
+    workers = workers or archive_config['workers']
+    
+    if codec not in _CODECS:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    
+    if quiz_ids is None:
+        quiz_ids = get_closed_quiz_ids(archive_config['delay_hours'])
+    
+    started = time.monotonic()
+    totals = {'archived_count': 0, 'failed_count': 0, 'skipped_count': 0, 'archived_bytes': 0, 'freed_bytes': 0}
+    batches = 0
+    finished = True
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for quiz_id in quiz_ids:
+            last_id = None
+            
+            while True:
+                if max_batches is not None and batches >= max_batches:
+                    finished = False
+                    break
+                
+                query = {
+                    'quiz_id': quiz_id,
+                    'storage_tier': {'$ne': ARCHIVED_TIER},
+                    'processing_status': {'$in': list(ARCHIVABLE_STATUSES)}
+                }
+                if last_id is not None:
+                    query['_id'] = {'$gt': last_id}
+                
+                page = list(
+                    audio_chunks_collection.find(query, _CHUNK_PROJECTION)
+                    .sort('_id', 1)
+                    .limit(batch_size)
+                )
+                if not page:
+                    break
+                
+                results = list(pool.map(lambda chunk: _try_archive_chunk(chunk, codec), page))
+                archived = [result for result in results if result]
+                
+                totals['archived_count'] += len(archived)
+                totals['failed_count'] += sum(1 for result in results if result is False)
+                totals['skipped_count'] += sum(1 for result in results if result is None)
+                totals['archived_bytes'] += sum(item['bytes'] for item in archived)
+                totals['freed_bytes'] += _release_hot_files(archived, pool)
+                
+                last_id = page[-1]['_id']
+                batches += 1
+            
+            if not finished:
+                break
+    
+    elapsed = time.monotonic() - started
+    result = dict(totals)
+    result.update({
+        'quizzes': len(quiz_ids),
+        'batches': batches,
+        'completed': finished,
+        'codec': codec,
+        'elapsed_seconds': round(elapsed, 3)
+    })
+    
+    logger.info(
+        f"Audio archival {'complete' if finished else 'paused'}: archived {result['archived_count']} chunks "
+        f"({result['archived_bytes']} bytes, {result['freed_bytes']} bytes freed), "
+        f"{result['failed_count']} failed, {result['skipped_count']} changed meanwhile"
+    )
+    return result
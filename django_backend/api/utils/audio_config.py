@@ -4,6 +4,8 @@ Audio processing configuration utilities
 from django.conf import settings
 from api.models import quizzes_collection
 from bson import ObjectId
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,63 +29,263 @@ def get_audio_config():
     return settings.AUDIO_CONFIG
 
 
+class QuizAudioConfig:
+    """
+    Audio proctoring settings for one quiz, read from a single quiz lookup
+    
+    Instances are cached per quiz (see get_quiz_audio_config) and shared by
+    the upload view and the processing tasks.
+    """
+    
+    def __init__(self, quiz_id, quiz=None):
+        audio_settings = (quiz or {}).get('audio_proctoring') or {}
+        default_threshold = settings.AUDIO_CONFIG['processing']['suspicion_threshold']
+        
+        self.quiz_id = str(quiz_id)
+        self.exists = quiz is not None
+        self.is_active = bool((quiz or {}).get('is_active', False))
+        self.teacher_id = str(quiz['teacher_id']) if quiz and quiz.get('teacher_id') else None
+        self.end_time = (quiz or {}).get('end_time')
+        
+        self.enabled = bool(audio_settings.get('enabled', False))
+        self.custom_keywords = list(audio_settings.get('custom_keywords') or [])
+        self.suspicion_threshold = audio_settings.get('suspicion_threshold', default_threshold)
+        self.language = audio_settings.get('language', 'auto')
+        
+        # Default + custom, lowercased and de-duplicated
+        self.keywords = list(set(kw.lower() for kw in _flatten_keywords(DEFAULT_KEYWORDS) + self.custom_keywords))
+        
+        self.loaded_at = time.monotonic()
+    
+    @property
+    def keyword_matcher(self):
+        """Compiled keyword matcher for this quiz's keywords"""
+        from api.utils.keyword_matcher import get_keyword_matcher
+        
+        return get_keyword_matcher(self.quiz_id, self.keywords)
+
+
+# Shared per-quiz config version, bumped on every edit so all processes see it
+CONFIG_VERSION_KEY = 'audio:quiz_config_version:{quiz_id}'
+
+# quiz_id -> _CachedConfig
+_quiz_configs = {}
+
+_quiz_configs_lock = threading.Lock()
+
+_redis_client = None
+
+
+class _CachedConfig:
+    """Cache entry: config, the shared version it was loaded at, and when that was last confirmed"""
+    
+    def __init__(self, config, version, expires_at, checked_at):
+        self.config = config
+        self.version = version
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+def _get_redis():
+    """Lazily create the Redis client holding the shared config versions"""
+    global _redis_client
+    
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(
+            settings.AUDIO_STATE_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    
+    return _redis_client
+
+
+def _get_config_version(key):
+    """
+    Current shared version of a quiz's config
+    
+    Returns:
+        int or None: Version (0 if never edited), None if the version store is unreachable
+    """
+    try:
+        raw = _get_redis().get(CONFIG_VERSION_KEY.format(quiz_id=key))
+        return int(raw) if raw else 0
+    except Exception as e:
+        logger.warning(f"Quiz config version store unavailable, relying on cache TTL: {e}")
+        return None
+
+
+def _is_current(cached, key, now):
+    """
+    Whether a cache entry is unexpired and still at the shared version
+    
+    The version is re-read at most every quiz_config_version_check_seconds;
+    without Redis the entry is trusted until its TTL.
+    """
+    if cached is None or cached.expires_at <= now:
+        return False
+    
+    check_interval = settings.AUDIO_CONFIG['processing'].get('quiz_config_version_check_seconds', 1.0)
+    if now - cached.checked_at < check_interval:
+        return True
+    
+    version = _get_config_version(key)
+    if version is not None and version != cached.version:
+        return False
+    
+    cached.checked_at = now
+    return True
+
+
+def get_quiz_audio_config(quiz_id):
+    """
+    Get the audio proctoring config for a quiz, loading it at most once per TTL
+    
+    A hit is also checked against the quiz's shared version, so an edit in
+    any process (invalidate_quiz_audio_config) reaches every web and Celery
+    process within quiz_config_version_check_seconds.
+    
+    Missing quizzes are cached too. Database errors are raised to the caller
+    and nothing is cached.
+    
+    Args:
+        quiz_id (str): Quiz ID
+    
+    Returns:
+        QuizAudioConfig: Cached config
+    """
+    key = str(quiz_id)
+    now = time.monotonic()
+    
+    cached = _quiz_configs.get(key)
+    if _is_current(cached, key, now):
+        return cached.config
+    
+    # Version first: an edit landing during the read then triggers another reload
+    version = _get_config_version(key)
+    
+    quiz = quizzes_collection.find_one(
+        {'_id': ObjectId(key)},
+        {'is_active': 1, 'teacher_id': 1, 'end_time': 1, 'audio_proctoring': 1}
+    )
+    config = QuizAudioConfig(key, quiz)
+    
+    ttl = settings.AUDIO_CONFIG['processing'].get('quiz_config_cache_seconds', 60)
+    with _quiz_configs_lock:
+        _quiz_configs[key] = _CachedConfig(config, version, now + ttl, now)
+    
+    return config
+
+
+def get_cached_quiz_audio_config(quiz_id):
+    """
+    Get a quiz's config only if it is cached and its version was confirmed recently
+    
+    Never touches the network, so async views can call it on the event loop
+    and only hop to a thread (get_quiz_audio_config) when it returns None.
+    
+    Args:
+        quiz_id (str): Quiz ID
+    
+    Returns:
+        QuizAudioConfig or None: Cached config
+    """
+    cached = _quiz_configs.get(str(quiz_id))
+    now = time.monotonic()
+    check_interval = settings.AUDIO_CONFIG['processing'].get('quiz_config_version_check_seconds', 1.0)
+    
+    if cached is not None and cached.expires_at > now and now - cached.checked_at < check_interval:
+        return cached.config
+    return None
+
+
+def invalidate_quiz_audio_config(quiz_id):
+    """
+    Invalidate a quiz's cached config and keyword matcher in every process (e.g. after the quiz is edited)
+    
+    Bumps the quiz's shared version, which other processes compare on their
+    next cache hit, and drops the local entries right away.
+    
+    Args:
+        quiz_id (str): Quiz ID
+    """
+    from api.utils.keyword_matcher import invalidate_keyword_matcher
+    
+    key = str(quiz_id)
+    
+    try:
+        version_key = CONFIG_VERSION_KEY.format(quiz_id=key)
+        with _get_redis().pipeline() as pipe:
+            pipe.incr(version_key)
+            pipe.expire(version_key, 30 * 24 * 3600)
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish config change for quiz {key}; other processes refresh on TTL: {e}")
+    
+    with _quiz_configs_lock:
+        _quiz_configs.pop(key, None)
+    
+    invalidate_keyword_matcher(key)
+
+
 def get_quiz_keywords(quiz_id):
     """
     Get suspicious keywords for a specific quiz (default + custom)
     
     Args:
         quiz_id (str): Quiz ID
-        
+    
     Returns:
         list: List of suspicious keywords
     """
     try:
-        quiz = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
+        config = get_quiz_audio_config(quiz_id)
         
-        if not quiz:
+        if not config.exists:
             logger.warning(f"Quiz {quiz_id} not found, using default keywords")
-            return _flatten_keywords(DEFAULT_KEYWORDS)
-        
-        # Get custom keywords if audio proctoring is enabled
-        audio_settings = quiz.get('audio_proctoring', {})
-        custom_keywords = audio_settings.get('custom_keywords', [])
-        
-        # Combine default and custom keywords
-        all_keywords = _flatten_keywords(DEFAULT_KEYWORDS)
-        
-        if custom_keywords:
-            all_keywords.extend(custom_keywords)
-        
-        # Remove duplicates and convert to lowercase
-        return list(set([kw.lower() for kw in all_keywords]))
         
+        return list(config.keywords)
+    
     except Exception as e:
         logger.error(f"Error getting quiz keywords: {e}")
         return _flatten_keywords(DEFAULT_KEYWORDS)
 
 
+def get_quiz_keyword_matcher(quiz_id):
+    """
+    Get the compiled keyword matcher for a quiz
+    
+    The automaton is cached per quiz and only rebuilt when the quiz's
+    keyword list changes or the cache entry is invalidated.
+    
+    Args:
+        quiz_id (str): Quiz ID
+    
+    Returns:
+        KeywordMatcher: Matcher over default + custom keywords
+    """
+    from api.utils.keyword_matcher import get_keyword_matcher
+    
+    try:
+        return get_quiz_audio_config(quiz_id).keyword_matcher
+    except Exception as e:
+        logger.error(f"Error getting quiz keywords: {e}")
+        return get_keyword_matcher('__default__', _flatten_keywords(DEFAULT_KEYWORDS))
+
+
 def get_suspicion_threshold(quiz_id):
     """
     Get suspicion threshold for a specific quiz
     
     Args:
         quiz_id (str): Quiz ID
-        
+    
     Returns:
         float: Suspicion threshold (0.0 - 1.0)
     """
     try:
-        quiz = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
-        
-        if not quiz:
-            return settings.AUDIO_CONFIG['processing']['suspicion_threshold']
-        
-        audio_settings = quiz.get('audio_proctoring', {})
-        return audio_settings.get(
-            'suspicion_threshold',
-            settings.AUDIO_CONFIG['processing']['suspicion_threshold']
-        )
-        
+        return get_quiz_audio_config(quiz_id).suspicion_threshold
     except Exception as e:
         logger.error(f"Error getting suspicion threshold: {e}")
         return settings.AUDIO_CONFIG['processing']['suspicion_threshold']
@@ -95,19 +297,13 @@ def is_audio_proctoring_enabled(quiz_id):
     
     Args:
         quiz_id (str): Quiz ID
-        
+    
     Returns:
         bool: True if enabled, False otherwise
     """
     try:
-        quiz = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
-        
-        if not quiz:
-            return False
-        
-        audio_settings = quiz.get('audio_proctoring', {})
-        return audio_settings.get('enabled', False)
-        
+        config = get_quiz_audio_config(quiz_id)
+        return config.exists and config.enabled
     except Exception as e:
         logger.error(f"Error checking audio proctoring status: {e}")
         return False
@@ -119,19 +315,12 @@ def get_quiz_language(quiz_id):
     
     Args:
         quiz_id (str): Quiz ID
-        
+    
     Returns:
         str: Language code or 'auto' for auto-detection
     """
     try:
-        quiz = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
-        
-        if not quiz:
-            return 'auto'
-        
-        audio_settings = quiz.get('audio_proctoring', {})
-        return audio_settings.get('language', 'auto')
-        
+        return get_quiz_audio_config(quiz_id).language
     except Exception as e:
         logger.error(f"Error getting quiz language: {e}")
         return 'auto'
@@ -143,7 +332,7 @@ def _flatten_keywords(keyword_dict):
     
     Args:
         keyword_dict (dict): Dictionary of keyword categories
-        
+    
     Returns:
         list: Flattened list of keywords
     """
@@ -163,7 +352,7 @@ def calculate_suspicion_score(num_speakers, keyword_matches, total_words, overla
         total_words (int): Total number of words in transcription
         overlap_duration (float): Duration of overlapping speech in seconds
         total_duration (float): Total audio duration in seconds
-        
+    
     Returns:
         float: Suspicion score (0.0 - 1.0)
     """
@@ -192,7 +381,7 @@ def get_severity_level(suspicion_score):
     
     Args:
         suspicion_score (float): Suspicion score (0.0 - 1.0)
-        
+    
     Returns:
         str: Severity level ('low', 'medium', 'high')
     """
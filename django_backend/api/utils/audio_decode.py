@@ -0,0 +1,70 @@
+"""
+In-memory audio decoding utilities
+
+Uploaded chunks (webm/ogg from MediaRecorder, or wav) are decoded straight
+into float32 NumPy buffers without writing temporary files.
+"""
+import io
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Containers soundfile can read from memory without ffmpeg
+_SOUNDFILE_MAGIC = (b'RIFF', b'fLaC')
+
+
+class AudioDecodeError(Exception):
+    """Raised when an audio chunk cannot be decoded"""
+
+
+def decode_audio_bytes(data, sample_rate=16000):
+    """
+    Decode encoded audio bytes into mono float32 samples
+    
+    WAV/FLAC are read in-process with soundfile and resampled in memory.
+    Everything else (webm, ogg, mp3) is piped through ffmpeg, which
+    downmixes and resamples while decoding; nothing touches the disk.
+    
+    Args:
+        data (bytes): Encoded audio
+        sample_rate (int): Target sample rate
+    
+    Returns:
+        np.ndarray: Mono float32 samples at sample_rate
+    """
+    import numpy as np
+    
+    if not data:
+        raise AudioDecodeError('Empty audio data')
+    
+    if data[:4] in _SOUNDFILE_MAGIC:
+        import soundfile as sf
+        
+        y, sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+        y = y.mean(axis=1)
+        
+        if sr != sample_rate:
+            import librosa
+            y = librosa.resample(y, orig_sr=sr, target_sr=sample_rate)
+        
+        return np.ascontiguousarray(y, dtype=np.float32)
+    
+    command = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', '1', '-ar', str(sample_rate),
+        'pipe:1'
+    ]
+    
+    try:
+        process = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise AudioDecodeError('ffmpeg is not installed')
+    
+    if process.returncode != 0:
+        raise AudioDecodeError(process.stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+    
+    # frombuffer is a read-only view; copy once so later stages can modify in place
+    return np.frombuffer(process.stdout, dtype=np.float32).copy()
@@ -0,0 +1,439 @@
+"""
+HTTP playback of stored audio chunks
+
+Builds range-aware responses for a chunk regardless of where its bytes
+live: the session PCM file (served as WAV), a byte range of the session
+segment file, or a file of its own. Single byte ranges are answered with
+206 Partial Content, so seeking in the player fetches only what it needs.
+Chunks with a file of their own can be handed off to the front-end server
+(X-Accel-Redirect / X-Sendfile) instead of streaming through Django.
+
+Playback URLs carry a short-lived signed token (chunk, teacher, expiry and
+where the bytes live), so the player's requests need no database reads.
+"""
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from datetime import datetime, timedelta
+from pathlib import Path
+import calendar
+import jwt
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per streamed block
+PLAYBACK_BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_FORMAT_CONTENT_TYPES = {
+    'webm': 'audio/webm',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+    'opus': 'audio/ogg',
+    'flac': 'audio/flac',
+}
+
+
+# Chunk fields needed to locate and describe its playable bytes
+_LOCATION_FIELDS = (
+    'file_path', 'file_offset', 'file_length', 'file_format',
+    'preprocessed_path', 'preprocessed_offset', 'preprocessed_samples'
+)
+
+PLAYBACK_TOKEN_TYPE = 'audio_playback'
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised for a Range header that cannot be served (416)"""
+
+
+class InvalidPlaybackToken(Exception):
+    """Raised for a playback token that is expired, tampered with or for another chunk"""
+
+
+def get_playback_token_ttl():
+    """Lifetime of playback tokens in seconds"""
+    return int(settings.AUDIO_CONFIG.get('playback', {}).get('token_ttl_seconds', 300))
+
+
+def mint_playback_token(chunk, teacher_id, ttl_seconds=None):
+    """
+    Sign a playback token for one chunk and teacher
+    
+    The token also carries the chunk's storage location (paths relative to
+    AUDIO_STORAGE_ROOT), so playback can be served without reading the chunk.
+    
+    Args:
+        chunk (dict): Audio chunk document
+        teacher_id (str): Teacher allowed to play the chunk
+        ttl_seconds (int, optional): Lifetime (defaults to playback.token_ttl_seconds)
+    
+    Returns:
+        str: Signed token
+    """
+    ttl_seconds = get_playback_token_ttl() if ttl_seconds is None else ttl_seconds
+    storage_root = Path(settings.AUDIO_STORAGE_ROOT)
+    
+    location = {}
+    for field in _LOCATION_FIELDS:
+        value = chunk.get(field)
+        if value is not None and field.endswith('_path'):
+            try:
+                value = Path(value).relative_to(storage_root).as_posix()
+            except ValueError:
+                value = str(value)  # outside storage root; joining below keeps it absolute
+        location[field] = value
+    
+    updated_at = chunk.get('updated_at') or chunk.get('created_at')
+    if updated_at:
+        location['updated_at'] = int(calendar.timegm(updated_at.utctimetuple()))
+    
+    payload = {
+        'typ': PLAYBACK_TOKEN_TYPE,
+        'chunk_id': chunk['chunk_id'],
+        'teacher_id': str(teacher_id),
+        'loc': location,
+        'exp': datetime.utcnow() + timedelta(seconds=ttl_seconds)
+    }
+    
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+
+
+def playback_url(chunk, teacher_id):
+    """
+    Signed playback URL for a chunk
+    
+    Returns:
+        str: URL path with the token as query parameter
+    """
+    token = mint_playback_token(chunk, teacher_id)
+    return f"/api/audio/play/{chunk['chunk_id']}/?token={token}"
+
+
+def attach_playback_urls(flags, teacher_id):
+    """
+    Add freshly minted playback URLs to the audio flags of a teacher's quizzes
+    
+    Tokens are minted as the flags are served, from the chunks' current
+    storage location (one chunk query per call), so a URL is never older
+    than the response carrying it. Flags of other teachers' quizzes and
+    chunks without stored audio get none.
+    
+    Args:
+        flags (list): Flag documents (audio_data.audio_url is set in place)
+        teacher_id (str): Teacher the flags are served to
+    """
+    from api.models import audio_chunks_collection
+    from api.utils.audio_config import get_quiz_audio_config
+    
+    chunk_ids = {
+        flag['audio_data']['chunk_id']
+        for flag in flags
+        if (flag.get('audio_data') or {}).get('chunk_id')
+    }
+    if not chunk_ids:
+        return
+    
+    projection = {field: 1 for field in _LOCATION_FIELDS + ('chunk_id', 'quiz_id', 'updated_at', 'created_at')}
+    chunks = {
+        chunk['chunk_id']: chunk
+        for chunk in audio_chunks_collection.find({'chunk_id': {'$in': list(chunk_ids)}}, projection)
+    }
+    
+    teacher_id = str(teacher_id)
+    for flag in flags:
+        chunk = chunks.get((flag.get('audio_data') or {}).get('chunk_id'))
+        if not chunk or not (chunk.get('preprocessed_path') or chunk.get('file_path')):
+            continue
+        if get_quiz_audio_config(chunk['quiz_id']).teacher_id != teacher_id:
+            continue
+        flag['audio_data']['audio_url'] = playback_url(chunk, teacher_id)
+
+
+def verify_playback_token(token, chunk_id):
+    """
+    Validate a playback token for a chunk (no database access)
+    
+    Args:
+        token (str): Token from the playback URL
+        chunk_id (str): Chunk requested in the URL
+    
+    Returns:
+        dict: Chunk-like document (chunk_id, teacher_id, storage fields with absolute paths)
+    
+    Raises:
+        InvalidPlaybackToken: If the token is invalid, expired or for another chunk
+    """
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise InvalidPlaybackToken('Playback token has expired')
+    except jwt.InvalidTokenError:
+        raise InvalidPlaybackToken('Invalid playback token')
+    
+    if payload.get('typ') != PLAYBACK_TOKEN_TYPE or payload.get('chunk_id') != chunk_id:
+        raise InvalidPlaybackToken('Playback token is not valid for this chunk')
+    
+    storage_root = Path(settings.AUDIO_STORAGE_ROOT)
+    location = payload.get('loc') or {}
+    
+    chunk = {'chunk_id': chunk_id, 'teacher_id': payload.get('teacher_id')}
+    for field in _LOCATION_FIELDS:
+        value = location.get(field)
+        if value is not None and field.endswith('_path'):
+            value = str(storage_root / value)
+        chunk[field] = value
+    
+    if location.get('updated_at') is not None:
+        chunk['updated_at'] = datetime.utcfromtimestamp(location['updated_at'])
+    
+    return chunk
+
+
+def parse_range_header(header, size):
+    """
+    Parse a Range header for a resource of the given size
+    
+    Only a single byte range is served; multi-range requests are rejected
+    rather than answered with multipart/byteranges. Headers in another
+    unit or with bad syntax are ignored, as RFC 9110 allows.
+    
+    Args:
+        header (str): Range header value (may be empty)
+        size (int): Resource size in bytes
+    
+    Returns:
+        tuple or None: (start, end) inclusive, or None to serve the whole resource
+    
+    Raises:
+        RangeNotSatisfiable: Multiple ranges, or a range outside the resource
+    """
+    if not header:
+        return None
+    
+    header = header.strip()
+    if not header.startswith('bytes='):
+        return None
+    
+    if ',' in header:
+        raise RangeNotSatisfiable('Multiple ranges are not supported')
+    
+    match = _RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable('Empty suffix range')
+        return max(size - length, 0), size - 1
+    
+    start = int(first)
+    end = int(last) if last else size - 1
+    
+    if start >= size or (last and end < start):
+        raise RangeNotSatisfiable(f'Range {header} outside {size} bytes')
+    
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """
+    Whether a conditional range request still refers to the current bytes
+    
+    Returns:
+        bool: True if there is no If-Range or it matches the ETag / Last-Modified
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Weak validators never match for ranges
+        return if_range == etag
+    
+    if last_modified is None:
+        return False
+    
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _iter_file_range(path, start, end, block_size=PLAYBACK_BLOCK_SIZE):
+    """Yield bytes start..end (inclusive) of a file in fixed-size blocks"""
+    remaining = end - start + 1
+    
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class PlaybackSource:
+    """
+    Where a chunk's playable bytes come from
+    
+    Attributes:
+        size (int): Bytes in the playable resource
+        content_type (str): MIME type
+        file_path (Path or None): Whole-file path, when the resource is exactly one file
+    """
+    
+    def __init__(self, size, content_type, iter_range, file_path=None):
+        self.size = size
+        self.content_type = content_type
+        self.iter_range = iter_range
+        self.file_path = file_path
+
+
+def get_playback_source(chunk):
+    """
+    Resolve the playable bytes of a chunk (preprocessed audio preferred)
+    
+    Args:
+        chunk (dict): Audio chunk document
+    
+    Returns:
+        PlaybackSource or None: None if the chunk has no audio on disk
+    """
+    if chunk.get('preprocessed_path') and chunk.get('preprocessed_offset') is not None:
+        from api.utils.pcm_store import iter_pcm_wav, pcm_wav_size
+        
+        if not Path(chunk['preprocessed_path']).exists():
+            return None
+        
+        return PlaybackSource(
+            pcm_wav_size(chunk),
+            'audio/wav',
+            lambda start, end: iter_pcm_wav(chunk, start, end, PLAYBACK_BLOCK_SIZE)
+        )
+    
+    if not chunk.get('preprocessed_path') and chunk.get('file_offset') is not None:
+        segment_path = Path(chunk['file_path'])
+        if not segment_path.exists():
+            return None
+        
+        offset = chunk['file_offset']
+        return PlaybackSource(
+            chunk['file_length'],
+            _FORMAT_CONTENT_TYPES.get(chunk.get('file_format'), 'audio/webm'),
+            lambda start, end: _iter_file_range(segment_path, offset + start, offset + end)
+        )
+    
+    file_path = chunk.get('preprocessed_path') or chunk.get('file_path')
+    if not file_path or not Path(file_path).exists():
+        return None
+    
+    file_path = Path(file_path)
+    return PlaybackSource(
+        file_path.stat().st_size,
+        _FORMAT_CONTENT_TYPES.get(file_path.suffix.lstrip('.'), 'audio/webm'),
+        lambda start, end: _iter_file_range(file_path, start, end),
+        file_path=file_path
+    )
+
+
+def _offload_response(source):
+    """
+    Response that lets nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) send the file
+    
+    The front-end server handles Range itself, so Django only resolves the path.
+    
+    Returns:
+        HttpResponse or None: None when offload is disabled or the file is outside storage
+    """
+    playback_config = settings.AUDIO_CONFIG.get('playback', {})
+    mode = playback_config.get('offload')
+    if not mode:
+        return None
+    
+    response = HttpResponse(content_type=source.content_type)
+    
+    if mode == 'x-accel-redirect':
+        try:
+            relative_path = source.file_path.resolve().relative_to(Path(settings.AUDIO_STORAGE_ROOT).resolve())
+        except ValueError:
+            logger.warning(f"Not offloading {source.file_path}: outside AUDIO_STORAGE_ROOT")
+            return None
+        
+        prefix = playback_config.get('internal_prefix', '/protected-audio/').rstrip('/')
+        response['X-Accel-Redirect'] = f"{prefix}/{relative_path.as_posix()}"
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = str(source.file_path.resolve())
+    else:
+        logger.warning(f"Unknown playback offload mode: {mode}")
+        return None
+    
+    return response
+
+
+def build_playback_response(request, chunk):
+    """
+    Range-aware playback response for a chunk
+    
+    Args:
+        request: Django/DRF request (Range and If-Range headers are honoured)
+        chunk (dict): Audio chunk document
+    
+    Returns:
+        HttpResponse or None: 200/206/416 response, or None if the audio is missing
+    """
+    source = get_playback_source(chunk)
+    if source is None:
+        return None
+    
+    if source.file_path is not None:
+        offloaded = _offload_response(source)
+        if offloaded is not None:
+            return offloaded
+    
+    # Stored chunk bytes never change once written, so chunk + size identifies them
+    variant = 'pcm' if chunk.get('preprocessed_offset') is not None else 'file'
+    etag = f'"{chunk["chunk_id"]}-{variant}-{source.size}"'
+    
+    updated_at = chunk.get('updated_at') or chunk.get('created_at')
+    last_modified = int(calendar.timegm(updated_at.utctimetuple())) if updated_at else None
+    
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), source.size)
+        except RangeNotSatisfiable as e:
+            logger.info(f"Unsatisfiable range for chunk {chunk['chunk_id']}: {e}")
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{source.size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    
+    if byte_range is None:
+        start, end = 0, source.size - 1
+        response = StreamingHttpResponse(source.iter_range(start, end), content_type=source.content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            source.iter_range(start, end),
+            content_type=source.content_type,
+            status=206
+        )
+        response['Content-Range'] = f"bytes {start}-{end}/{source.size}"
+    
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    
+    return response
@@ -0,0 +1,298 @@
+"""
+Retention engine for expired audio
+
+Expired chunks are walked in (created_at, _id) order in pages of
+batch_size using the created_at index. Each page's files are wiped and
+deleted on a bounded thread pool and the documents are removed with one
+delete_many. Progress is checkpointed after every page, so a run that
+crashes resumes where it stopped with the same cutoff. Storage counters
+are decremented per page for what was actually removed.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import time
+import logging
+
+from django.conf import settings
+
+from api.models import audio_chunks_collection, task_checkpoints_collection
+from api.utils.audio_storage import delete_audio_file
+from api.utils.storage_accounting import record_storage
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ID = 'cleanup_expired_audio'
+
+# Only what is needed to delete a chunk's files
+_CHUNK_PROJECTION = {
+    '_id': 1,
+    'created_at': 1,
+    'quiz_id': 1,
+    'student_id': 1,
+    'file_path': 1,
+    'file_offset': 1,
+    'preprocessed_path': 1,
+    'preprocessed_offset': 1,
+    'storage_tier': 1
+}
+
+# (path field, offset field, tier of own files, tier of shared files);
+# own files of archived chunks are counted in the 'archived' tier
+_FILE_FIELDS = (
+    ('file_path', 'file_offset', 'raw', 'segments'),
+    ('preprocessed_path', 'preprocessed_offset', 'preprocessed', 'preprocessed')
+)
+
+
+def _retention_config():
+    return settings.AUDIO_CONFIG['storage'].get('cleanup', {})
+
+
+def _expired_page(cutoff, after, batch_size):
+    """
+    Next page of expired chunks after the (created_at, _id) key
+    
+    Returns:
+        list: Chunk documents (projected), oldest first
+    """
+    query = {'created_at': {'$lt': cutoff}}
+    
+    if after is not None:
+        last_created_at, last_id = after
+        query = {
+            '$and': [
+                query,
+                {'$or': [
+                    {'created_at': {'$gt': last_created_at}},
+                    {'created_at': last_created_at, '_id': {'$gt': last_id}}
+                ]}
+            ]
+        }
+    
+    return list(
+        audio_chunks_collection.find(query, _CHUNK_PROJECTION)
+        .sort([('created_at', 1), ('_id', 1)])
+        .limit(batch_size)
+    )
+
+
+def _wipe(path):
+    """
+    Wipe and delete one file
+    
+    Returns:
+        tuple: (path, bytes deleted, ok) where ok is False only if the file is still there
+    """
+    deleted = delete_audio_file(path)
+    if deleted:
+        return path, int(deleted), True
+    
+    return path, 0, not Path(path).exists()
+
+
+def delete_unreferenced_shared(shared_files, pool):
+    """
+    Delete session segment / PCM files that no remaining chunk refers to
+    
+    Args:
+        shared_files (set): (field, quiz_id, student_id, path) tuples
+        pool (ThreadPoolExecutor): Pool used for the wipes
+    
+    Returns:
+        list: (quiz_id, student_id, tier, bytes) for each file deleted
+    """
+    from api.utils.pcm_store import forget_pcm_map
+    
+    unreferenced = {}
+    for field, quiz_id, student_id, path in shared_files:
+        if audio_chunks_collection.count_documents(
+            {'quiz_id': quiz_id, 'student_id': student_id, field: path},
+            limit=1
+        ):
+            continue
+        
+        if field == 'preprocessed_path':
+            forget_pcm_map(path)
+        tier = 'segments' if field == 'file_path' else 'preprocessed'
+        unreferenced[path] = (quiz_id, student_id, tier)
+    
+    deleted = []
+    for path, size, ok in pool.map(_wipe, list(unreferenced)):
+        if ok and size:
+            deleted.append(unreferenced[path] + (size,))
+    
+    return deleted
+
+
+def _record_deletions(deltas):
+    """Apply accumulated (quiz_id, student_id, tier) -> [bytes, files, chunks] decrements"""
+    for (quiz_id, student_id, tier), (size, files, chunks) in deltas.items():
+        record_storage(quiz_id, student_id, tier, bytes_delta=-size, files_delta=-files, chunks_delta=-chunks)
+
+
+def _start_or_resume(retention_days):
+    """
+    Load an unfinished checkpoint, or start a new run
+    
+    Returns:
+        dict: Checkpoint document
+    """
+    checkpoint = task_checkpoints_collection.find_one({'_id': CHECKPOINT_ID})
+    
+    if checkpoint and checkpoint.get('status') == 'running':
+        logger.info(
+            f"Resuming audio cleanup from {checkpoint.get('last_created_at')} "
+            f"(cutoff {checkpoint['cutoff']}, {checkpoint.get('deleted_count', 0)} chunks already deleted)"
+        )
+        checkpoint['resumed'] = True
+        return checkpoint
+    
+    checkpoint = {
+        '_id': CHECKPOINT_ID,
+        'status': 'running',
+        'cutoff': datetime.utcnow() - timedelta(days=retention_days),
+        'started_at': datetime.utcnow(),
+        'last_created_at': None,
+        'last_id': None,
+        'deleted_count': 0,
+        'failed_count': 0,
+        'deleted_segments': 0,
+        'bytes_deleted': 0,
+        'elapsed_seconds': 0.0
+    }
+    task_checkpoints_collection.replace_one({'_id': CHECKPOINT_ID}, checkpoint, upsert=True)
+    checkpoint['resumed'] = False
+    return checkpoint
+
+
+def run_audio_retention(retention_days=None, batch_size=None, workers=None, max_batches=None):
+    """
+    Delete audio chunks older than the retention period
+    
+    Args:
+        retention_days (int, optional): Defaults to storage.retention_days
+        batch_size (int, optional): Chunks per page (defaults to storage.cleanup.batch_size)
+        workers (int, optional): File deletion threads (defaults to storage.cleanup.workers)
+        max_batches (int, optional): Stop after this many pages (the checkpoint stays open)
+    
+    Returns:
+        dict: Totals for the run, including throughput
+    """
+    cleanup_config = _retention_config()
+    retention_days = retention_days or settings.AUDIO_CONFIG['storage']['retention_days']
+    batch_size = batch_size or cleanup_config.get('batch_size', 500)
+    workers = workers or cleanup_config.get('workers', 4)
+    
+    checkpoint = _start_or_resume(retention_days)
+    cutoff = checkpoint['cutoff']
+    after = None
+    if checkpoint.get('last_created_at') is not None:
+        after = (checkpoint['last_created_at'], checkpoint['last_id'])
+    
+    started = time.monotonic()
+    run_totals = {'deleted_count': 0, 'failed_count': 0, 'deleted_segments': 0, 'bytes_deleted': 0}
+    batches = 0
+    finished = False
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while max_batches is None or batches < max_batches:
+            page = _expired_page(cutoff, after, batch_size)
+            if not page:
+                finished = True
+                break
+            
+            # chunk _id -> [(tier, path, shared)]
+            chunk_files = defaultdict(list)
+            shared_files = set()
+            for chunk in page:
+                for field, offset_field, own_tier, shared_tier in _FILE_FIELDS:
+                    path = chunk.get(field)
+                    if not path:
+                        continue
+                    if chunk.get(offset_field) is not None:
+                        # Shared session file; removed once none of its chunks remain
+                        shared_files.add((field, chunk['quiz_id'], chunk['student_id'], path))
+                        chunk_files[chunk['_id']].append((shared_tier, path, True))
+                    elif chunk.get('storage_tier') == 'archived':
+                        chunk_files[chunk['_id']].append(('archived', path, False))
+                    else:
+                        chunk_files[chunk['_id']].append((own_tier, path, False))
+            
+            paths = [path for files in chunk_files.values() for _, path, shared in files if not shared]
+            wiped = {path: (size, ok) for path, size, ok in pool.map(_wipe, paths)}
+            
+            # Keep documents whose files could not be removed, so nothing is orphaned
+            deletable = [
+                chunk for chunk in page
+                if all(shared or wiped[path][1] for _, path, shared in chunk_files[chunk['_id']])
+            ]
+            failed = len(page) - len(deletable)
+            if failed:
+                logger.error(f"Audio cleanup could not remove files for {failed} chunks; they are kept")
+            
+            if deletable:
+                audio_chunks_collection.delete_many({'_id': {'$in': [chunk['_id'] for chunk in deletable]}})
+            
+            shared_deleted = delete_unreferenced_shared(shared_files, pool)
+            
+            # Storage counter decrements: (quiz_id, student_id, tier) -> [bytes, files, chunks]
+            deltas = defaultdict(lambda: [0, 0, 0])
+            for chunk in deletable:
+                for tier in {tier for tier, _, _ in chunk_files[chunk['_id']]}:
+                    deltas[(chunk['quiz_id'], chunk['student_id'], tier)][2] += 1
+                for tier, path, shared in chunk_files[chunk['_id']]:
+                    delta = deltas[(chunk['quiz_id'], chunk['student_id'], tier)]
+                    if not shared and wiped[path][0]:
+                        delta[0] += wiped[path][0]
+                        delta[1] += 1
+            for quiz_id, student_id, tier, size in shared_deleted:
+                delta = deltas[(quiz_id, student_id, tier)]
+                delta[0] += size
+                delta[1] += 1
+            _record_deletions(deltas)
+            
+            page_totals = {
+                'deleted_count': len(deletable),
+                'failed_count': failed,
+                'deleted_segments': len(shared_deleted),
+                'bytes_deleted': sum(size for size, _ in wiped.values()) + sum(item[3] for item in shared_deleted)
+            }
+            for key, value in page_totals.items():
+                run_totals[key] += value
+            
+            after = (page[-1]['created_at'], page[-1]['_id'])
+            batches += 1
+            
+            task_checkpoints_collection.update_one(
+                {'_id': CHECKPOINT_ID},
+                {
+                    '$set': {'last_created_at': after[0], 'last_id': after[1], 'updated_at': datetime.utcnow()},
+                    '$inc': page_totals
+                }
+            )
+    
+    elapsed = time.monotonic() - started
+    update = {'$inc': {'elapsed_seconds': elapsed}}
+    if finished:
+        update['$set'] = {'status': 'completed', 'finished_at': datetime.utcnow()}
+    task_checkpoints_collection.update_one({'_id': CHECKPOINT_ID}, update)
+    
+    result = dict(run_totals)
+    result.update({
+        'batches': batches,
+        'completed': finished,
+        'resumed': checkpoint['resumed'],
+        'cutoff': cutoff.isoformat(),
+        'elapsed_seconds': round(elapsed, 3),
+        'chunks_per_second': round(run_totals['deleted_count'] / elapsed, 1) if elapsed else 0.0,
+        'mb_per_second': round(run_totals['bytes_deleted'] / (1024 * 1024) / elapsed, 2) if elapsed else 0.0
+    })
+    
+    logger.info(
+        f"Audio cleanup {'complete' if finished else 'paused'}: deleted {result['deleted_count']} chunks, "
+        f"{result['deleted_segments']} segment files, {result['failed_count']} failed, "
+        f"{result['chunks_per_second']} chunks/s, {result['mb_per_second']} MB/s"
+    )
+    return result
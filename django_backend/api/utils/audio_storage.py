@@ -4,37 +4,316 @@ Audio file storage utilities
 import os
 import uuid
 import base64
+import shutil
 from pathlib import Path
 from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: appends are not locked across processes
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# Block size for streamed uploads (bytes)
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# Upload content type -> stored file extension
+AUDIO_CONTENT_TYPES = {
+    'audio/webm': 'webm',
+    'video/webm': 'webm',
+    'audio/wav': 'wav',
+    'audio/wave': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/ogg': 'ogg',
+    'audio/mpeg': 'mp3',
+}
+
+
+class AudioChunkTooLarge(Exception):
+    """Raised when an upload exceeds max_chunk_size_mb"""
+
+
+def get_storage_layout():
+    """'segments' (one append-only file per session) or 'files' (one file per chunk)"""
+    return settings.AUDIO_CONFIG['storage'].get('layout', 'files')
+
+
+def get_max_chunk_size():
+    """Maximum accepted chunk size in bytes"""
+    return int(settings.AUDIO_CONFIG['storage']['max_chunk_size_mb'] * 1024 * 1024)
+
+
+def extension_for_content_type(content_type, default='webm'):
+    """
+    Map an upload content type to a stored file extension
+    
+    Args:
+        content_type (str): MIME type, parameters allowed (e.g. 'audio/webm;codecs=opus')
+        default (str): Extension for unknown types
+    
+    Returns:
+        str: File extension
+    """
+    mime = (content_type or '').split(';')[0].strip().lower()
+    return AUDIO_CONTENT_TYPES.get(mime, default)
+
+
+class StagedAudioFile:
+    """
+    Upload being written to the staging area block by block
+    
+    Enforces the size limit as data arrives, so an oversized upload is
+    rejected after at most max_size bytes instead of after buffering it.
+    """
+    
+    def __init__(self, max_size=None):
+        staging_dir = settings.AUDIO_STORAGE_ROOT / 'incoming'
+        os.makedirs(staging_dir, exist_ok=True)
+        
+        self.path = staging_dir / f"{uuid.uuid4()}.part"
+        self.max_size = get_max_chunk_size() if max_size is None else max_size
+        self.size = 0
+        self._file = open(self.path, 'wb')
+    
+    def write(self, block):
+        self.size += len(block)
+        if self.size > self.max_size:
+            self.discard()
+            raise AudioChunkTooLarge(f"Audio chunk exceeds {self.max_size} bytes")
+        self._file.write(block)
+    
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+    
+    def discard(self):
+        """Close and remove the partial file"""
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+    
+    def commit(self, quiz_id, student_id, session_id, file_extension='webm'):
+        """
+        Move the finished upload into raw storage
+        
+        With the 'segments' layout the upload is copied onto the end of the
+        session's segment file and the staged file is removed.
+        
+        Args:
+            quiz_id (str): Quiz ID
+            student_id (str): Student ID
+            session_id (str): Audio session ID
+            file_extension (str): File extension
+        
+        Returns:
+            tuple: (chunk_id, storage) where storage holds the chunk's file fields
+        """
+        self.close()
+        
+        chunk_id = str(uuid.uuid4())
+        
+        if get_storage_layout() == 'segments':
+            with open(self.path, 'rb') as source:
+                storage = append_to_segment(source, quiz_id, student_id, session_id, file_extension)
+            self.discard()
+            _account_raw_chunk(quiz_id, student_id, storage, storage['file_length'])
+            
+            logger.info(f"Appended streamed audio chunk {chunk_id} to {storage['file_path']} ({self.size} bytes)")
+            return chunk_id, storage
+        
+        storage_dir = settings.AUDIO_STORAGE_ROOT / 'raw' / quiz_id / student_id
+        os.makedirs(storage_dir, exist_ok=True)
+        
+        file_path = storage_dir / f"{chunk_id}.{file_extension}"
+        os.replace(self.path, file_path)
+        
+        storage = _file_storage(file_path, file_extension)
+        _account_raw_chunk(quiz_id, student_id, storage, self.size)
+        
+        logger.info(f"Saved streamed audio chunk {chunk_id} to {file_path} ({self.size} bytes)")
+        return chunk_id, storage
+
 
-def save_audio_file(audio_data, quiz_id, student_id, file_extension='webm'):
+def stream_audio_to_staging(stream, max_size=None, block_size=UPLOAD_BLOCK_SIZE):
+    """
+    Copy a file-like request body to the staging area in fixed-size blocks
+    
+    Args:
+        stream: Object with read(n) (e.g. the request body)
+        max_size (int, optional): Size limit in bytes (defaults to max_chunk_size_mb)
+        block_size (int): Bytes read per iteration
+    
+    Returns:
+        StagedAudioFile: Closed staged file, ready to commit()
+    
+    Raises:
+        AudioChunkTooLarge: If the body exceeds max_size (partial file is removed)
+    """
+    staged = StagedAudioFile(max_size)
+    
+    try:
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            staged.write(block)
+    except AudioChunkTooLarge:
+        raise
+    except Exception:
+        staged.discard()
+        raise
+    
+    staged.close()
+    return staged
+
+
+def _account_raw_chunk(quiz_id, student_id, storage, size):
+    """Count a newly stored raw chunk in the storage counters"""
+    from api.utils.storage_accounting import record_storage
+    
+    if storage.get('file_offset') is None:
+        record_storage(quiz_id, student_id, 'raw', bytes_delta=size, files_delta=1, chunks_delta=1)
+    else:
+        # First append creates the session's segment file
+        record_storage(
+            quiz_id, student_id, 'segments',
+            bytes_delta=size,
+            files_delta=1 if storage['file_offset'] == 0 else 0,
+            chunks_delta=1
+        )
+
+
+def _file_storage(file_path, file_extension):
+    """Chunk document file fields for a chunk stored in its own file"""
+    return {
+        'file_path': str(file_path),
+        'file_offset': None,
+        'file_length': None,
+        'file_format': file_extension
+    }
+
+
+def get_segment_path(quiz_id, student_id, session_id):
+    """
+    Path of a session's append-only raw segment file
+    
+    Args:
+        quiz_id (str): Quiz ID
+        student_id (str): Student ID
+        session_id (str): Audio session ID
+    
+    Returns:
+        Path: Segment file path
+    """
+    return settings.AUDIO_STORAGE_ROOT / 'segments' / quiz_id / student_id / f"{session_id}.seg"
+
+
+def append_locked(path, source):
+    """
+    Append bytes to a shared file under an exclusive lock
+    
+    The lock is held for the duration of the append so concurrent writers
+    (several web or Celery workers) get disjoint byte ranges.
+    
+    Args:
+        path (Path): File to append to (parent directories are created)
+        source (bytes or file-like): Data, or an open file to copy from
+    
+    Returns:
+        tuple: (offset, length) of the appended bytes
+    """
+    os.makedirs(Path(path).parent, exist_ok=True)
+    
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            offset = f.seek(0, os.SEEK_END)
+            
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                f.write(source)
+            else:
+                shutil.copyfileobj(source, f, UPLOAD_BLOCK_SIZE)
+            
+            f.flush()
+            length = f.tell() - offset
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    
+    return offset, length
+
+
+def append_to_segment(source, quiz_id, student_id, session_id, file_extension='webm'):
+    """
+    Append one chunk's bytes to the session's segment file
+    
+    Args:
+        source (bytes or file-like): Encoded audio, or an open file to copy from
+        quiz_id (str): Quiz ID
+        student_id (str): Student ID
+        session_id (str): Audio session ID
+        file_extension (str): Encoded format of the chunk
+    
+    Returns:
+        dict: Chunk document file fields (file_path, file_offset, file_length, file_format)
+    """
+    segment_path = get_segment_path(quiz_id, student_id, session_id)
+    offset, length = append_locked(segment_path, source)
+    
+    return {
+        'file_path': str(segment_path),
+        'file_offset': offset,
+        'file_length': length,
+        'file_format': file_extension
+    }
+
+
+def segment_index_entry(chunk_id, chunk_index, storage):
+    """
+    Offset index entry recorded on the audio session for a segment-stored chunk
+    
+    Returns:
+        dict or None: Index entry, or None if the chunk has its own file
+    """
+    if storage.get('file_offset') is None:
+        return None
+    
+    return {
+        'chunk_id': chunk_id,
+        'chunk_index': chunk_index,
+        'offset': storage['file_offset'],
+        'length': storage['file_length'],
+        'format': storage['file_format']
+    }
+
+
+def save_audio_file(audio_data, quiz_id, student_id, session_id, file_extension='webm'):
     """
     Save audio file to storage
     
+    With the 'segments' layout the chunk is appended to the session's
+    segment file; otherwise it gets its own file under raw/.
+    
     Args:
         audio_data (bytes or str): Audio data (bytes or base64 string)
         quiz_id (str): Quiz ID
         student_id (str): Student ID
+        session_id (str): Audio session ID
         file_extension (str): File extension
-        
+    
     Returns:
-        tuple: (chunk_id, file_path) or (None, None) on error
+        tuple: (chunk_id, storage) or (None, None) on error
     """
     try:
         # Generate unique chunk ID
         chunk_id = str(uuid.uuid4())
         
-        # Create directory structure
-        storage_dir = settings.AUDIO_STORAGE_ROOT / 'raw' / quiz_id / student_id
-        os.makedirs(storage_dir, exist_ok=True)
-        
-        # File path
-        file_path = storage_dir / f"{chunk_id}.{file_extension}"
-        
         # Decode base64 if needed
         if isinstance(audio_data, str):
             audio_bytes = base64.b64decode(audio_data)
@@ -47,18 +326,114 @@ def save_audio_file(audio_data, quiz_id, student_id, file_extension='webm'):
             logger.error(f"Audio chunk too large: {len(audio_bytes)} bytes")
             return None, None
         
+        if get_storage_layout() == 'segments':
+            storage = append_to_segment(audio_bytes, quiz_id, student_id, session_id, file_extension)
+            _account_raw_chunk(quiz_id, student_id, storage, storage['file_length'])
+            logger.info(f"Appended audio chunk {chunk_id} to {storage['file_path']} at {storage['file_offset']}")
+            return chunk_id, storage
+        
+        # Create directory structure
+        storage_dir = settings.AUDIO_STORAGE_ROOT / 'raw' / quiz_id / student_id
+        os.makedirs(storage_dir, exist_ok=True)
+        
+        # File path
+        file_path = storage_dir / f"{chunk_id}.{file_extension}"
+        
         # Write file
         with open(file_path, 'wb') as f:
             f.write(audio_bytes)
         
-        logger.info(f"Saved audio chunk {chunk_id} to {file_path}")
-        return chunk_id, str(file_path)
+        storage = _file_storage(file_path, file_extension)
+        _account_raw_chunk(quiz_id, student_id, storage, len(audio_bytes))
         
+        logger.info(f"Saved audio chunk {chunk_id} to {file_path}")
+        return chunk_id, storage
+    
     except Exception as e:
         logger.error(f"Error saving audio file: {e}")
         return None, None
 
 
+def read_audio_chunk(chunk):
+    """
+    Read a chunk's encoded audio, from its own file or its segment byte range
+    
+    Args:
+        chunk (dict): Audio chunk document
+    
+    Returns:
+        bytes: Encoded audio
+    
+    Raises:
+        FileNotFoundError: If the backing file is missing
+    """
+    file_path = Path(chunk['file_path'])
+    if not file_path.exists():
+        raise FileNotFoundError(f"Audio file not found: {file_path}")
+    
+    offset = chunk.get('file_offset')
+    if offset is None:
+        return file_path.read_bytes()
+    
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(chunk['file_length'])
+    
+    if len(data) != chunk['file_length']:
+        raise IOError(f"Segment {file_path} is truncated for chunk {chunk['chunk_id']}")
+    
+    return data
+
+
+class AudioStreamUploadHandler(FileUploadHandler):
+    """
+    Django upload handler that streams one multipart file field to staging
+    
+    Blocks go straight to a StagedAudioFile as the multipart parser reads
+    them, so the chunk is never held in memory or copied from a temp file.
+    Other file fields are dropped.
+    """
+    chunk_size = UPLOAD_BLOCK_SIZE
+    
+    def __init__(self, request=None, field_name='audio'):
+        super().__init__(request)
+        self.audio_field = field_name
+        self.audio_content_type = None
+        self.staged = None
+        self.too_large = False
+        self._receiving = False
+    
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        
+        self._receiving = field_name == self.audio_field and self.staged is None
+        if self._receiving:
+            self.audio_content_type = self.content_type
+            self.staged = StagedAudioFile()
+    
+    def receive_data_chunk(self, raw_data, start):
+        if self._receiving:
+            try:
+                self.staged.write(raw_data)
+            except AudioChunkTooLarge:
+                self.too_large = True
+                self.staged = None
+                self._receiving = False
+                raise StopUpload(connection_reset=False)
+        return None
+    
+    def file_complete(self, file_size):
+        if self._receiving:
+            self.staged.close()
+            self._receiving = False
+        return None
+    
+    def upload_interrupted(self):
+        if self.staged is not None:
+            self.staged.discard()
+            self.staged = None
+
+
 def get_audio_file_path(chunk_id, quiz_id, student_id, audio_type='raw'):
     """
     Get path to audio file
@@ -68,7 +443,7 @@ def get_audio_file_path(chunk_id, quiz_id, student_id, audio_type='raw'):
         quiz_id (str): Quiz ID
         student_id (str): Student ID
         audio_type (str): 'raw' or 'preprocessed'
-        
+    
     Returns:
         Path: Path to audio file or None if not found
     """
@@ -83,21 +458,30 @@ def get_audio_file_path(chunk_id, quiz_id, student_id, audio_type='raw'):
         
         logger.warning(f"Audio file not found for chunk {chunk_id}")
         return None
-        
+    
     except Exception as e:
         logger.error(f"Error getting audio file path: {e}")
         return None
 
 
+# Block size for zero-filling files before deletion (bytes)
+WIPE_BLOCK_SIZE = 1024 * 1024
+
+_ZERO_BLOCK = memoryview(bytes(WIPE_BLOCK_SIZE))
+
+
 def delete_audio_file(file_path):
     """
     Securely delete audio file
     
+    The file is overwritten in place with zeros in WIPE_BLOCK_SIZE blocks
+    (constant memory for any file size) and synced before it is unlinked.
+    
     Args:
         file_path (str or Path): Path to audio file
-        
+    
     Returns:
-        bool: True if deleted, False otherwise
+        int or bool: Bytes deleted (truthy) if deleted, False otherwise
     """
     try:
         file_path = Path(file_path)
@@ -108,53 +492,59 @@ def delete_audio_file(file_path):
         
         # Overwrite with zeros before deletion (secure deletion)
         file_size = file_path.stat().st_size
-        with open(file_path, 'wb') as f:
-            f.write(b'\x00' * file_size)
+        with open(file_path, 'r+b') as f:
+            remaining = file_size
+            while remaining > 0:
+                block = min(WIPE_BLOCK_SIZE, remaining)
+                f.write(_ZERO_BLOCK[:block])
+                remaining -= block
+            f.flush()
+            os.fsync(f.fileno())
         
         # Delete file
         file_path.unlink()
         
         logger.info(f"Deleted audio file: {file_path}")
-        return True
-        
+        return file_size or True
+    
     except Exception as e:
         logger.error(f"Error deleting audio file: {e}")
         return False
 
 
-def get_storage_stats():
+def get_storage_stats(quiz_id=None, student_id=None):
     """
     Get storage statistics
     
+    Read from the incrementally maintained counters (one lookup), not by
+    scanning the storage tree.
+    
+    Args:
+        quiz_id (str, optional): Limit to one quiz
+        student_id (str, optional): Limit to one student in the quiz
+    
     Returns:
         dict: Storage statistics
     """
     try:
+        from api.utils.storage_accounting import get_storage_counters, STORAGE_TIERS
+        
+        counters = get_storage_counters(quiz_id, student_id)
+        total_bytes = sum(counters[tier]['bytes'] for tier in STORAGE_TIERS)
+        
         stats = {
-            'raw_files': 0,
-            'preprocessed_files': 0,
-            'total_size_mb': 0
+            'raw_files': counters['raw']['files'],
+            'segment_files': counters['segments']['files'],
+            'preprocessed_files': counters['preprocessed']['files'],
+            'archived_files': counters['archived']['files'],
+            'total_size_mb': round(total_bytes / (1024 * 1024), 2),
+            'tiers': {tier: counters[tier] for tier in STORAGE_TIERS},
+            'updated_at': counters['updated_at'].isoformat() if counters['updated_at'] else None,
+            'reconciled_at': counters['reconciled_at'].isoformat() if counters['reconciled_at'] else None
         }
         
-        # Count raw files
-        raw_dir = settings.AUDIO_STORAGE_ROOT / 'raw'
-        if raw_dir.exists():
-            for file_path in raw_dir.rglob('*'):
-                if file_path.is_file():
-                    stats['raw_files'] += 1
-                    stats['total_size_mb'] += file_path.stat().st_size / (1024 * 1024)
-        
-        # Count preprocessed files
-        preprocessed_dir = settings.AUDIO_STORAGE_ROOT / 'preprocessed'
-        if preprocessed_dir.exists():
-            for file_path in preprocessed_dir.rglob('*'):
-                if file_path.is_file():
-                    stats['preprocessed_files'] += 1
-                    stats['total_size_mb'] += file_path.stat().st_size / (1024 * 1024)
-        
-        stats['total_size_mb'] = round(stats['total_size_mb'], 2)
         return stats
-        
+    
     except Exception as e:
         logger.error(f"Error getting storage stats: {e}")
         return {'error': str(e)}
@@ -0,0 +1,328 @@
+"""
+Materialized flag counters
+
+Flag counts (total, resolved, per severity, per type) are kept at four
+scopes - all flags, per quiz, per student and per quiz+student - in the
+flag_counters collection and updated with $inc whenever a flag is created,
+escalated, resolved/unresolved or deleted. Dashboards and quiz submission
+read them with a single find_one instead of scanning flags_collection.
+
+A counter document created by an $inc only counts flags written since it
+appeared, so it is trusted once 'seeded': the first read of an unseeded
+scope counts that scope's existing flags into it, and
+reconcile_flag_counters seeds every scope it rebuilds (and corrects drift).
+"""
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+from pymongo import UpdateOne, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from api.models import flag_counters_collection, flags_collection
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_LEVELS = ['low', 'medium', 'high', 'critical']
+
+TOTAL_KEY = 'total'
+
+
+def _scope_keys(quiz_id, student_id):
+    """Counter document IDs a flag for this quiz/student contributes to"""
+    keys = [(TOTAL_KEY, {'scope': 'total'})]
+    
+    if quiz_id:
+        keys.append((f"quiz:{quiz_id}", {'scope': 'quiz', 'quiz_id': quiz_id}))
+    if student_id:
+        keys.append((f"student:{student_id}", {'scope': 'student', 'student_id': student_id}))
+    if quiz_id and student_id:
+        keys.append((
+            f"quiz_student:{quiz_id}:{student_id}",
+            {'scope': 'quiz_student', 'quiz_id': quiz_id, 'student_id': student_id}
+        ))
+    
+    return keys
+
+
+def _counter_key(key):
+    """Flag type / severity as a safe field name ('.' and leading '$' are not allowed)"""
+    return str(key).replace('.', '_').lstrip('$') or 'unknown'
+
+
+def _flag_increments(flag, sign):
+    """$inc document adding (sign=1) or removing (sign=-1) one flag"""
+    inc = {'total': sign}
+    
+    if flag.get('resolved'):
+        inc['resolved'] = sign
+    if flag.get('severity'):
+        inc[f"severity.{_counter_key(flag['severity'])}"] = sign
+    if flag.get('type'):
+        inc[f"type.{_counter_key(flag['type'])}"] = sign
+    
+    return inc
+
+
+def _apply(quiz_id, student_id, inc):
+    """
+    Apply $inc to every scope of a quiz/student (one bulk round-trip)
+    
+    Counting never fails the flag write it describes; errors are logged and
+    left for reconciliation to correct.
+    """
+    inc = {field: value for field, value in inc.items() if value}
+    if not inc:
+        return
+    
+    now = datetime.utcnow()
+    
+    try:
+        flag_counters_collection.bulk_write([
+            UpdateOne(
+                {'_id': key},
+                {'$inc': inc, '$set': {'updated_at': now}, '$setOnInsert': scope},
+                upsert=True
+            )
+            for key, scope in _scope_keys(quiz_id, student_id)
+        ], ordered=False)
+    except Exception as e:
+        logger.error(f"Error updating flag counters for quiz {quiz_id}: {e}")
+
+
+def record_flag_created(flag):
+    """
+    Count a newly inserted flag
+    
+    Args:
+        flag (dict): Flag document as inserted
+    """
+    _apply(flag.get('quiz_id'), flag.get('student_id'), _flag_increments(flag, 1))
+
+
+def record_flag_deleted(flag):
+    """
+    Uncount a deleted flag
+    
+    Args:
+        flag (dict): Flag document as it was before deletion
+    """
+    _apply(flag.get('quiz_id'), flag.get('student_id'), _flag_increments(flag, -1))
+
+
+def record_flag_changed(before, changes):
+    """
+    Apply resolution and severity transitions of an updated flag
+    
+    Args:
+        before (dict): Flag document before the update
+        changes (dict): Fields set by the update
+    """
+    _apply(before.get('quiz_id'), before.get('student_id'), _transition_increments(before, changes))
+
+
+def record_flag_batch(quiz_id, student_id, created, changed):
+    """
+    Count a batch of flag writes for one quiz/student in one update per scope
+    
+    Args:
+        quiz_id (str): Quiz ID
+        student_id (str): Student ID
+        created (list): Newly inserted flag documents
+        changed (list): (before, changes) pairs of updated flags
+    """
+    inc = defaultdict(int)
+    
+    for flag in created:
+        for field, value in _flag_increments(flag, 1).items():
+            inc[field] += value
+    for before, changes in changed:
+        for field, value in _transition_increments(before, changes).items():
+            inc[field] += value
+    
+    _apply(quiz_id, student_id, inc)
+
+
+def _transition_increments(before, changes):
+    """$inc document for resolution and severity transitions of one flag"""
+    inc = defaultdict(int)
+    
+    if 'resolved' in changes and bool(changes['resolved']) != bool(before.get('resolved')):
+        inc['resolved'] += 1 if changes['resolved'] else -1
+    
+    if 'severity' in changes and changes['severity'] != before.get('severity'):
+        if before.get('severity'):
+            inc[f"severity.{_counter_key(before['severity'])}"] -= 1
+        if changes['severity']:
+            inc[f"severity.{_counter_key(changes['severity'])}"] += 1
+    
+    return inc
+
+
+def _seed_counter(key, scope):
+    """
+    Count a scope's existing flags into its counter document and mark it seeded
+    
+    Flags written in the moment between the count and the write can be off
+    by one until the next reconcile_flag_counters run.
+    
+    Args:
+        key (str): Counter document ID
+        scope (dict): Scope fields (quiz_id / student_id filter the flags)
+    
+    Returns:
+        dict: The seeded counter fields
+    """
+    match = {field: scope[field] for field in ('quiz_id', 'student_id') if field in scope}
+    
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {'severity': '$severity', 'type': '$type'},
+            'total': {'$sum': 1},
+            'resolved': {'$sum': {'$cond': [{'$eq': ['$resolved', True]}, 1, 0]}}
+        }}
+    ]
+    
+    counter = {'total': 0, 'resolved': 0, 'severity': defaultdict(int), 'type': defaultdict(int)}
+    for row in flags_collection.aggregate(pipeline, allowDiskUse=True):
+        group = row['_id']
+        counter['total'] += row['total']
+        counter['resolved'] += row['resolved']
+        if group.get('severity'):
+            counter['severity'][_counter_key(group['severity'])] += row['total']
+        if group.get('type'):
+            counter['type'][_counter_key(group['type'])] += row['total']
+    
+    doc = {
+        'total': counter['total'],
+        'resolved': counter['resolved'],
+        'severity': dict(counter['severity']),
+        'type': dict(counter['type']),
+        'seeded': True,
+        'updated_at': datetime.utcnow()
+    }
+    
+    try:
+        flag_counters_collection.update_one(
+            {'_id': key, 'seeded': {'$ne': True}},
+            {'$set': doc, '$setOnInsert': scope},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Seeded concurrently by another reader
+    
+    return doc
+
+
+def get_flag_counters(quiz_id=None, student_id=None):
+    """
+    Read precomputed flag counts for a scope
+    
+    A scope read for the first time (or only counted since its document
+    appeared) is seeded from the existing flags first.
+    
+    Args:
+        quiz_id (str, optional): Quiz ID
+        student_id (str, optional): Student ID
+    
+    Returns:
+        dict or None: total_flags, resolved_flags, unresolved_flags,
+        severity_counts and type_counts; None if the scope could not be counted
+    """
+    key, scope = _scope_keys(quiz_id, student_id)[-1]
+    doc = flag_counters_collection.find_one({'_id': key})
+    
+    if doc is None or not doc.get('seeded'):
+        try:
+            doc = _seed_counter(key, scope)
+        except Exception as e:
+            logger.error(f"Error seeding flag counters for {key}: {e}")
+            return None
+    
+    total_flags = doc.get('total', 0)
+    resolved_flags = doc.get('resolved', 0)
+    
+    severity_counts = {severity: 0 for severity in SEVERITY_LEVELS}
+    for severity, count in (doc.get('severity') or {}).items():
+        if severity in severity_counts:
+            severity_counts[severity] = count
+    
+    type_counts = {
+        flag_type: count
+        for flag_type, count in sorted((doc.get('type') or {}).items(), key=lambda item: -item[1])
+        if count > 0
+    }
+    
+    return {
+        'total_flags': total_flags,
+        'resolved_flags': resolved_flags,
+        'unresolved_flags': total_flags - resolved_flags,
+        'severity_counts': severity_counts,
+        'type_counts': type_counts
+    }
+
+
+def reconcile_flag_counters():
+    """
+    Rebuild all flag counters from flags_collection
+    
+    Flags written while the rebuild runs may be missed until the next run,
+    so it is meant for a quiet-hours maintenance task (and once after deploy).
+    
+    Returns:
+        dict: Number of counter documents written and removed
+    """
+    now = datetime.utcnow()
+    counters = defaultdict(lambda: {'total': 0, 'resolved': 0, 'severity': defaultdict(int), 'type': defaultdict(int)})
+    scopes = {}
+    
+    pipeline = [
+        {'$group': {
+            '_id': {
+                'quiz_id': '$quiz_id',
+                'student_id': '$student_id',
+                'severity': '$severity',
+                'type': '$type'
+            },
+            'total': {'$sum': 1},
+            'resolved': {'$sum': {'$cond': [{'$eq': ['$resolved', True]}, 1, 0]}}
+        }}
+    ]
+    
+    for row in flags_collection.aggregate(pipeline, allowDiskUse=True):
+        group = row['_id']
+        
+        for key, scope in _scope_keys(group.get('quiz_id'), group.get('student_id')):
+            scopes[key] = scope
+            counter = counters[key]
+            counter['total'] += row['total']
+            counter['resolved'] += row['resolved']
+            if group.get('severity'):
+                counter['severity'][_counter_key(group['severity'])] += row['total']
+            if group.get('type'):
+                counter['type'][_counter_key(group['type'])] += row['total']
+    
+    operations = []
+    for key, counter in counters.items():
+        doc = dict(scopes[key])
+        doc.update({
+            '_id': key,
+            'total': counter['total'],
+            'resolved': counter['resolved'],
+            'severity': dict(counter['severity']),
+            'type': dict(counter['type']),
+            'seeded': True,
+            'updated_at': now,
+            'reconciled_at': now
+        })
+        operations.append(ReplaceOne({'_id': key}, doc, upsert=True))
+    
+    if operations:
+        flag_counters_collection.bulk_write(operations, ordered=False)
+    
+    # Scopes without flags any more (not rewritten above)
+    removed = flag_counters_collection.delete_many({'reconciled_at': {'$ne': now}}).deleted_count
+    
+    logger.info(f"Reconciled flag counters: {len(operations)} written, {removed} removed")
+    return {'counters': len(operations), 'removed': removed}
@@ -1,78 +1,312 @@
 """
 Flag utility functions
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 from bson import ObjectId
-from api.models import flags_collection
+from bson.errors import InvalidId
+import base64
+import json
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from api.models import flags_collection, FLAG_LIST_SHAPES
+from api.utils.flag_counters import record_flag_created, record_flag_changed, record_flag_batch, get_flag_counters
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def should_aggregate_flag(student_id, quiz_id, flag_type):
+# Events of the same type from one student within one window are merged into one flag
+AGGREGATION_WINDOW_SECONDS = 30
+
+# Events accepted in one batched flag request
+MAX_FLAG_EVENTS_PER_BATCH = 500
+
+# Oldest event time accepted in a batch (a few client flush intervals plus retries);
+# older timestamps are clamped so events cannot be back-dated into earlier windows
+MAX_FLAG_EVENT_AGE_SECONDS = 120
+
+# Flag list page sizes
+DEFAULT_FLAG_PAGE_SIZE = 100
+MAX_FLAG_PAGE_SIZE = 500
+
+# Characters of an audio flag's transcript kept in the compact list view
+TRANSCRIPTION_PREVIEW_CHARS = 120
+
+# Fields returned by the flag list views ('full' returns whole documents)
+FLAG_LIST_PROJECTIONS = {
+    'compact': {
+        '_id': 1,
+        'student_id': 1,
+        'quiz_id': 1,
+        'type': 1,
+        'description': 1,
+        'timestamp': 1,
+        'severity': 1,
+        'resolved': 1,
+        'resolved_by': 1,
+        'count': 1,
+        'detection_type': 1,
+        'audio_data.chunk_id': 1,
+        'audio_data.num_speakers': 1,
+        'audio_data.keywords_found': 1,
+        # Short preview instead of the transcript (omitted for non-audio flags)
+        'transcription_preview': {
+            '$cond': [
+                {'$ifNull': ['$audio_data.transcription', False]},
+                {'$substrCP': ['$audio_data.transcription', 0, TRANSCRIPTION_PREVIEW_CHARS]},
+                '$$REMOVE'
+            ]
+        }
+    },
+    'full': None
+}
+
+SEVERITY_ESCALATION = {
+    'low': 'medium',
+    'medium': 'high',
+    'high': 'critical'
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def escalate_severity(severity, steps=1):
+    """Severity steps levels above the given one (critical stays critical)"""
+    for _ in range(steps):
+        severity = SEVERITY_ESCALATION.get(severity or 'low', 'critical')
+    return severity
+
+
+def _escalated_severity_expr(steps=1):
+    """Aggregation expression: the stored flag's severity raised steps levels"""
+    return {
+        '$switch': {
+            'branches': [
+                {'case': {'$eq': ['$severity', current]}, 'then': escalate_severity(current, steps)}
+                for current in SEVERITY_ESCALATION
+            ],
+            'default': 'critical'
+        }
+    }
+
+
+def get_aggregation_bucket(timestamp):
     """
-    Check if a similar flag exists within the last 30 seconds.
-    If yes, return the existing flag for aggregation.
+    Fixed 30-second window a flag event falls into
+    
+    Args:
+        timestamp (datetime): Event time (naive UTC)
+        
+    Returns:
+        int: Bucket number
+    """
+    return int((timestamp - _EPOCH).total_seconds() // AGGREGATION_WINDOW_SECONDS)
+
+
+def aggregation_key(student_id, quiz_id, flag_type, timestamp):
+    """Filter identifying the open flag an event aggregates into"""
+    return {
+        'student_id': student_id,
+        'quiz_id': quiz_id,
+        'type': flag_type,
+        'aggregation_bucket': get_aggregation_bucket(timestamp)
+    }
+
+
+def aggregation_update(flag_fields, now=None, events=1):
+    """
+    Pipeline update that creates the bucket's flag or escalates it
+    
+    On insert the flag gets flag_fields with count 1; an existing flag gets
+    its count incremented and its severity raised one level, keeping the
+    old level in previous_severity. Several events of one window apply as
+    if sent one by one. Values are wrapped in $literal so user text is
+    never read as a field path.
+    
+    Args:
+        flag_fields (dict): Fields of a new flag (description, timestamp, severity, ...)
+        now (datetime, optional): Update time
+        events (int): Number of events applied
+        
+    Returns:
+        list: Update pipeline
+    """
+    now = now or datetime.utcnow()
+    is_new = {'$eq': [{'$type': '$timestamp'}, 'missing']}
+    
+    fields = {
+        field: {'$cond': [is_new, {'$literal': value}, f'${field}']}
+        for field, value in flag_fields.items()
+        if field != 'severity'
+    }
+    fields.update({
+        'severity': {'$cond': [
+            is_new,
+            {'$literal': escalate_severity(flag_fields['severity'], events - 1)},
+            _escalated_severity_expr(events)
+        ]},
+        'previous_severity': {'$cond': [is_new, '$$REMOVE', '$severity']},
+        'resolved': {'$cond': [is_new, False, '$resolved']},
+        'count': {'$add': [{'$ifNull': ['$count', 0]}, events]},
+        'updated_at': now
+    })
+    
+    return [{'$set': fields}]
+
+
+def _upsert_window_flag(query, update):
+    """
+    Apply an aggregation update to a window's flag, creating it if needed
+    
+    Returns:
+        dict: Flag document after the update
+    """
+    for attempt in range(2):
+        try:
+            return flags_collection.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another event created the bucket's flag first; now it matches
+            if attempt:
+                raise
+
+
+def aggregate_flag(student_id, quiz_id, flag_type, description='', severity=None, timestamp=None, extra_fields=None):
+    """
+    Record a flag event, merging it into the flag of its 30-second window
+    
+    One find_one_and_update with upsert on (student, quiz, type, bucket)
+    returning the flag after the event: the first event in a window creates
+    the flag (count 1), later ones raise its count and severity. A unique
+    index on the key makes concurrent events resolve to one flag; the loser
+    of an insert race retries as an update.
     
     Args:
         student_id (str): Student ID
         quiz_id (str): Quiz ID
         flag_type (str): Type of flag
+        description (str): Description for a new flag
+        severity (str, optional): Severity for a new flag (defaults by type)
+        timestamp (datetime, optional): Event time (defaults to now)
+        extra_fields (dict, optional): Further fields for a new flag
         
     Returns:
-        dict or None: Existing flag if found, None otherwise
+        tuple: (flag document after the event, True if aggregated into an existing flag)
     """
-    thirty_seconds_ago = datetime.utcnow() - timedelta(seconds=30)
+    timestamp = timestamp or datetime.utcnow()
+    query = aggregation_key(student_id, quiz_id, flag_type, timestamp)
     
-    existing_flag = flags_collection.find_one({
-        'student_id': student_id,
-        'quiz_id': quiz_id,
-        'type': flag_type,
-        'timestamp': {'$gte': thirty_seconds_ago},
-        'resolved': False
+    flag_fields = dict(extra_fields or {})
+    flag_fields.update({
+        'description': description,
+        'timestamp': timestamp,
+        'severity': severity or get_severity_for_type(flag_type)
     })
+    flag = _upsert_window_flag(query, aggregation_update(flag_fields))
     
-    return existing_flag
+    if flag['count'] == 1:
+        record_flag_created(flag)
+        return flag, False
+    
+    record_flag_changed(dict(flag, severity=flag.get('previous_severity')), {'severity': flag['severity']})
+    return flag, True
+
+
+def aggregate_flag_events(student_id, quiz_id, events):
+    """
+    Record a batch of flag events from one student with 30-second aggregation
+    
+    Events are grouped by (type, window) in memory and each group is one
+    upsert of all its events; the result is the same as sending the events
+    one by one to aggregate_flag. As there, counter transitions come from
+    the flag each upsert returns (count and previous_severity), so writes
+    racing the batch are counted correctly. The counters of the whole batch
+    are applied in one update.
+    
+    Args:
+        student_id (str): Student ID
+        quiz_id (str): Quiz ID
+        events (list): Dicts with type, timestamp (naive UTC datetime) and
+            optional description / severity
+        
+    Returns:
+        list: Per flag written: type, flag_id, events, severity, aggregated
+    """
+    groups = {}
+    for event in sorted(events, key=lambda event: event['timestamp']):
+        key = (event['type'], get_aggregation_bucket(event['timestamp']))
+        groups.setdefault(key, []).append(event)
+    
+    now = datetime.utcnow()
+    results = []
+    created = []
+    changed = []
+    
+    for (flag_type, _), group in groups.items():
+        first = group[0]
+        count = len(group)
+        flag_fields = {
+            'description': first.get('description', ''),
+            'timestamp': first['timestamp'],
+            'severity': first.get('severity') or get_severity_for_type(flag_type)
+        }
+        
+        flag = _upsert_window_flag(
+            aggregation_key(student_id, quiz_id, flag_type, first['timestamp']),
+            aggregation_update(flag_fields, now, events=count)
+        )
+        
+        # The flag was inserted by this upsert iff it holds only these events
+        aggregated = flag['count'] > count
+        if aggregated:
+            changed.append((dict(flag, severity=flag.get('previous_severity')), {'severity': flag['severity']}))
+        else:
+            created.append(flag)
+        
+        results.append({
+            'type': flag_type,
+            'flag_id': str(flag['_id']),
+            'events': count,
+            'severity': flag['severity'],
+            'aggregated': aggregated
+        })
+    
+    if results:
+        record_flag_batch(quiz_id, student_id, created, changed)
+    
+    return results
 
 
 def increase_flag_severity(flag_id):
     """
     Increase the severity of an existing flag.
     
+    Single pipeline update (no read-modify-write race).
+    
     Args:
         flag_id (ObjectId): Flag ID
         
     Returns:
         str: New severity level
     """
-    severity_map = {
-        'low': 'medium',
-        'medium': 'high',
-        'high': 'critical'
-    }
-    
-    flag = flags_collection.find_one({'_id': flag_id})
+    before = flags_collection.find_one_and_update(
+        {'_id': flag_id},
+        [{'$set': {
+            'severity': _escalated_severity_expr(),
+            'count': {'$add': [{'$ifNull': ['$count', 1]}, 1]},
+            'updated_at': datetime.utcnow()
+        }}],
+        return_document=ReturnDocument.BEFORE
+    )
     
-    if not flag:
+    if not before:
         return None
     
-    current_severity = flag.get('severity', 'low')
-    new_severity = severity_map.get(current_severity, 'critical')
-    current_count = flag.get('count', 1)
-    
-    # Update flag
-    flags_collection.update_one(
-        {'_id': flag_id},
-        {
-            '$set': {
-                'severity': new_severity,
-                'count': current_count + 1,
-                'updated_at': datetime.utcnow()
-            }
-        }
-    )
+    new_severity = escalate_severity(before.get('severity'))
+    record_flag_changed(before, {'severity': new_severity})
     
-    logger.info(f"Flag {flag_id} severity increased to {new_severity}, count: {current_count + 1}")
+    logger.info(f"Flag {flag_id} severity increased to {new_severity}, count: {before.get('count', 1) + 1}")
     
     return new_severity
 
@@ -116,7 +350,7 @@ def create_audio_flag(student_id, quiz_id, flag_type, severity, description, aud
         flag_type (str): Type of audio flag ('audio_multiple_speakers' or 'audio_keywords')
         severity (str): Severity level ('low', 'medium', 'high')
         description (str): Flag description
-        audio_data (dict): Audio-specific data (chunk_id, transcription, num_speakers, keywords_found, audio_url)
+        audio_data (dict): Audio-specific data (chunk_id, transcription, num_speakers, keywords_found)
         
     Returns:
         str: Created flag ID
@@ -135,6 +369,7 @@ def create_audio_flag(student_id, quiz_id, flag_type, severity, description, aud
     
     result = flags_collection.insert_one(flag_data)
     flag_id = str(result.inserted_id)
+    record_flag_created(flag_data)
     
     logger.info(f"Audio flag created: {flag_type} for student {student_id} in quiz {quiz_id}, severity: {severity}")
     
@@ -145,6 +380,12 @@ def get_flag_statistics(quiz_id=None, student_id=None):
     """
     Get flag statistics.
     
+    Read from the materialized flag counters (one lookup, seeded from the
+    flags on a scope's first read). If the counters cannot be read, fall
+    back to a single $facet aggregation over the flags (totals, resolution,
+    severity and type histograms in one round-trip, with types discovered
+    from the data).
+    
     Args:
         quiz_id (str, optional): Filter by quiz ID
         student_id (str, optional): Filter by student ID
@@ -152,6 +393,10 @@ def get_flag_statistics(quiz_id=None, student_id=None):
     Returns:
         dict: Statistics
     """
+    counters = get_flag_counters(quiz_id, student_id)
+    if counters is not None:
+        return counters
+    
     query = {}
     
     if quiz_id:
@@ -160,23 +405,44 @@ def get_flag_statistics(quiz_id=None, student_id=None):
     if student_id:
         query['student_id'] = student_id
     
-    total_flags = flags_collection.count_documents(query)
+    pipeline = [
+        {'$match': query},
+        {'$facet': {
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'total': {'$sum': 1},
+                    'resolved': {'$sum': {'$cond': [{'$eq': ['$resolved', True]}, 1, 0]}}
+                }}
+            ],
+            'by_severity': [
+                {'$group': {'_id': '$severity', 'count': {'$sum': 1}}}
+            ],
+            'by_type': [
+                {'$group': {'_id': '$type', 'count': {'$sum': 1}}}
+            ]
+        }}
+    ]
     
-    resolved_flags = flags_collection.count_documents({**query, 'resolved': True})
+    facets = next(flags_collection.aggregate(pipeline), {})
+    
+    totals = (facets.get('totals') or [{}])[0]
+    total_flags = totals.get('total', 0)
+    resolved_flags = totals.get('resolved', 0)
     unresolved_flags = total_flags - resolved_flags
     
-    # Count by severity
-    severity_counts = {}
-    for severity in ['low', 'medium', 'high', 'critical']:
-        count = flags_collection.count_documents({**query, 'severity': severity})
-        severity_counts[severity] = count
+    # Count by severity (standard levels always present)
+    severity_counts = {severity: 0 for severity in ['low', 'medium', 'high', 'critical']}
+    for row in facets.get('by_severity', []):
+        if row['_id'] in severity_counts:
+            severity_counts[row['_id']] = row['count']
     
     # Count by type
-    type_counts = {}
-    for flag_type in ['multiple_faces', 'no_face', 'looking_away', 'high_audio', 'tab_switch', 'screen_share', 'audio_multiple_speakers', 'audio_keywords', 'dev_tools_attempt', 'dev_tools_open', 'screenshot_attempt', 'window_resize']:
-        count = flags_collection.count_documents({**query, 'type': flag_type})
-        if count > 0:
-            type_counts[flag_type] = count
+    type_counts = {
+        row['_id']: row['count']
+        for row in sorted(facets.get('by_type', []), key=lambda row: -row['count'])
+        if row['_id']
+    }
     
     return {
         'total_flags': total_flags,
@@ -185,3 +451,118 @@ def get_flag_statistics(quiz_id=None, student_id=None):
         'severity_counts': severity_counts,
         'type_counts': type_counts
     }
+
+
+def encode_flag_cursor(flag):
+    """
+    Opaque cursor for the page after this flag (last flag of a page)
+    
+    Args:
+        flag (dict): Flag document with timestamp and _id
+        
+    Returns:
+        str: URL-safe cursor
+    """
+    payload = json.dumps({'t': flag['timestamp'].isoformat(), 'id': str(flag['_id'])})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_flag_cursor(cursor):
+    """
+    Query continuing after a cursor in (timestamp, _id) descending order
+    
+    Args:
+        cursor (str): Cursor from encode_flag_cursor
+        
+    Returns:
+        dict: Filter matching flags after the cursor
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        timestamp = datetime.fromisoformat(payload['t'])
+        flag_id = ObjectId(payload['id'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError('Invalid cursor')
+    
+    return {
+        '$or': [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': flag_id}}
+        ]
+    }
+
+
+def flag_list_index(query):
+    """
+    Key pattern of the list index serving a filter set
+    
+    Args:
+        query (dict): Equality filters of a flag list
+        
+    Returns:
+        list: (field, direction) pairs of the FLAG_LIST_SHAPES index with
+        the longest leading run of filtered fields, preferring an index
+        whose equality fields are all filtered (it also provides the sort)
+    """
+    def score(shape):
+        prefix = 0
+        while prefix < len(shape) and shape[prefix] in query:
+            prefix += 1
+        return prefix, prefix == len(shape)
+    
+    shape = max(FLAG_LIST_SHAPES, key=score)
+    return [(field, 1) for field in shape] + [('timestamp', -1), ('_id', -1)]
+
+
+def list_flags(query, cursor=None, limit=DEFAULT_FLAG_PAGE_SIZE, view='compact'):
+    """
+    One page of flags, newest first, keyset-paginated on (timestamp, _id)
+    
+    Each page walks the FLAG_LIST_SHAPES index with the most equality
+    fields in the query: filter sets with their own index need no sort,
+    others use the closest index prefix and apply the remaining filters
+    (and a bounded top-limit sort) on the matching range.
+    
+    Args:
+        query (dict): Equality filters (any of quiz_id, student_id, resolved, severity)
+        cursor (str, optional): next_cursor of the previous page
+        limit (int): Page size (capped at MAX_FLAG_PAGE_SIZE)
+        view (str): 'compact' (no transcripts) or 'full'
+        
+    Returns:
+        tuple: (flags, next_cursor or None)
+        
+    Raises:
+        ValueError: For a malformed cursor, limit or unknown view
+    """
+    if view not in FLAG_LIST_PROJECTIONS:
+        raise ValueError(f"Unknown view: {view}")
+    
+    try:
+        limit = max(1, min(int(limit), MAX_FLAG_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    
+    index = flag_list_index(query)
+    
+    if cursor:
+        query = {'$and': [query, decode_flag_cursor(cursor)]} if query else decode_flag_cursor(cursor)
+    
+    # One extra document tells whether another page exists
+    flags = list(
+        flags_collection.find(query, FLAG_LIST_PROJECTIONS[view])
+        .sort([('timestamp', -1), ('_id', -1)])
+        .hint(index)
+        .limit(limit + 1)
+    )
+    
+    next_cursor = None
+    if len(flags) > limit:
+        flags = flags[:limit]
+        next_cursor = encode_flag_cursor(flags[-1])
+    
+    return flags, next_cursor
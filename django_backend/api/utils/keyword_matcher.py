@@ -0,0 +1,221 @@
+"""
+Multi-keyword matching for transcriptions
+
+Keywords are compiled into a word-level Aho-Corasick automaton, so a
+transcript is scanned once regardless of how many keywords a quiz has,
+and matches always fall on word boundaries ("you" does not match "your").
+"""
+import re
+import threading
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _combining_mark_class():
+    """
+    Regex character ranges of the Basic Multilingual Plane's combining marks
+    
+    \\w stops at combining marks, which would split Devanagari and other
+    Indic words at every vowel sign or virama ("उत्तर" -> "उत", "तर").
+    """
+    ranges = []
+    for code in range(0x10000):
+        if unicodedata.category(chr(code)).startswith('M'):
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    return ''.join(f'\\u{start:04x}-\\u{end:04x}' for start, end in ranges)
+
+
+# Word characters are \w plus combining marks; words keep inner apostrophes so "what's" stays one token
+_WORD_CHAR = f'[\\w{_combining_mark_class()}]'
+WORD_PATTERN = re.compile(f"{_WORD_CHAR}+(?:'{_WORD_CHAR}+)*")
+
+# quiz_id -> compiled matcher
+_matchers = {}
+
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Split text into lowercase words with character offsets
+    
+    Args:
+        text (str): Input text
+    
+    Returns:
+        list: (word, start, end) tuples
+    """
+    return [(m.group().lower(), m.start(), m.end()) for m in WORD_PATTERN.finditer(text)]
+
+
+class KeywordMatcher:
+    """
+    Word-level Aho-Corasick automaton over a keyword list
+    
+    Build once per keyword list; match() is O(words in text + matches).
+    """
+    
+    def __init__(self, keywords):
+        self.keywords = []
+        
+        # Per state: word -> next state, failure link, (keyword index, word count) outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        
+        seen = set()
+        for keyword in keywords:
+            words = tuple(word for word, _, _ in tokenize(keyword))
+            if not words or words in seen:
+                continue
+            seen.add(words)
+            
+            self.keywords.append(' '.join(words))
+            self._add(words, len(self.keywords) - 1)
+        
+        self._build_failure_links()
+    
+    def __len__(self):
+        return len(self.keywords)
+    
+    def _add(self, words, keyword_index):
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword_index, len(words)))
+    
+    def _build_failure_links(self):
+        # Breadth-first so every failure target is finished before it is used
+        queue = list(self._goto[0].values())
+        head = 0
+        
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+    
+    def find_all(self, text):
+        """
+        Find every keyword occurrence in text
+        
+        Args:
+            text (str): Text to scan
+        
+        Returns:
+            list: Matches ({keyword, start, end}) in order of their end position
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Rare case-mappings change length; keep offsets aligned with the original text
+            lowered = ''.join(char.lower()[:1] for char in text)
+        
+        matches = []
+        starts = []
+        state = 0
+        
+        for token in WORD_PATTERN.finditer(lowered):
+            word = token.group()
+            starts.append(token.start())
+            
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            
+            if output[state]:
+                for keyword_index, length in output[state]:
+                    matches.append({
+                        'keyword': self.keywords[keyword_index],
+                        'start': starts[-length],
+                        'end': token.end()
+                    })
+        
+        return matches
+    
+    def match(self, text):
+        """
+        Scan text and summarise keyword hits
+        
+        Args:
+            text (str): Text to scan
+        
+        Returns:
+            dict: keywords_found (unique, first-seen order), keyword_matches
+                  (positions) and keyword_counts ([{keyword, count}])
+        """
+        matches = self.find_all(text)
+        
+        counts = {}
+        for match in matches:
+            counts[match['keyword']] = counts.get(match['keyword'], 0) + 1
+        
+        return {
+            'keywords_found': list(counts),
+            'keyword_matches': matches,
+            'keyword_counts': [{'keyword': keyword, 'count': count} for keyword, count in counts.items()]
+        }
+
+
+def get_keyword_matcher(quiz_id, keywords):
+    """
+    Get the compiled matcher for a quiz, rebuilding it if its keywords changed
+    
+    Args:
+        quiz_id (str): Quiz ID (cache key)
+        keywords (list): Current keyword list for the quiz
+    
+    Returns:
+        KeywordMatcher: Compiled matcher
+    """
+    key = str(quiz_id)
+    fingerprint = frozenset(keywords)
+    
+    cached = _matchers.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    
+    with _lock:
+        cached = _matchers.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        
+        matcher = KeywordMatcher(keywords)
+        _matchers[key] = (fingerprint, matcher)
+        logger.debug(f"Compiled keyword matcher for quiz {key} ({len(matcher)} keywords)")
+        
+        return matcher
+
+
+def invalidate_keyword_matcher(quiz_id):
+    """
+    Drop a quiz's compiled matcher (e.g. after its keywords are edited)
+    
+    Args:
+        quiz_id (str): Quiz ID
+    """
+    _matchers.pop(str(quiz_id), None)
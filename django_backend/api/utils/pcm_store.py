@@ -0,0 +1,198 @@
+"""
+Memory-mapped store for preprocessed audio
+
+Preprocessed samples for a session are appended as raw float32 PCM to one
+file per session. Readers map the file once per process and get zero-copy
+NumPy views of a chunk's samples, so pipeline stages and playback never
+re-open or re-parse WAV files and hot sessions are served from the page cache.
+
+A chunk is addressed by preprocessed_offset (bytes) and
+preprocessed_samples on its document.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import struct
+import threading
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from api.utils.audio_storage import append_locked
+
+logger = logging.getLogger(__name__)
+
+PCM_DTYPE = np.dtype('<f4')
+PCM_SAMPLE_RATE = 16000
+
+# WAV header for IEEE float mono PCM (RIFF + fmt + data chunk headers)
+WAV_HEADER_SIZE = 44
+
+# Mapped files kept open per process
+MAX_OPEN_MAPS = 64
+
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def get_pcm_path(quiz_id, student_id, session_id):
+    """
+    Path of a session's preprocessed PCM file
+    
+    Args:
+        quiz_id (str): Quiz ID
+        student_id (str): Student ID
+        session_id (str): Audio session ID
+    
+    Returns:
+        Path: PCM file path
+    """
+    return settings.AUDIO_STORAGE_ROOT / 'preprocessed' / quiz_id / student_id / f"{session_id}.f32"
+
+
+def append_pcm(chunk, y):
+    """
+    Append a chunk's preprocessed samples to its session's PCM file
+    
+    Args:
+        chunk (dict): Audio chunk document
+        y (np.ndarray): Preprocessed 16kHz mono samples
+    
+    Returns:
+        dict: Chunk document fields (preprocessed_path, preprocessed_offset, preprocessed_samples)
+    """
+    samples = np.ascontiguousarray(y, dtype=PCM_DTYPE)
+    pcm_path = get_pcm_path(chunk['quiz_id'], chunk['student_id'], chunk['session_id'])
+    
+    offset, _ = append_locked(pcm_path, memoryview(samples).cast('B'))
+    
+    return {
+        'preprocessed_path': str(pcm_path),
+        'preprocessed_offset': offset,
+        'preprocessed_samples': int(samples.shape[0])
+    }
+
+
+def _get_map(path, min_size):
+    """
+    Read-only mapping of a PCM file covering at least min_size bytes
+    
+    Mappings are cached per process and re-created when the file has grown
+    past the mapped size (new chunks appended since it was mapped).
+    """
+    key = str(path)
+    
+    with _maps_lock:
+        mapped = _maps.get(key)
+        if mapped is not None and mapped.nbytes >= min_size:
+            _maps.move_to_end(key)
+            return mapped
+        
+        file_size = Path(path).stat().st_size
+        if file_size < min_size:
+            raise IOError(f"PCM file {path} is truncated ({file_size} < {min_size} bytes)")
+        
+        mapped = np.memmap(path, dtype=PCM_DTYPE, mode='r', shape=(file_size // PCM_DTYPE.itemsize,))
+        _maps[key] = mapped
+        _maps.move_to_end(key)
+        
+        while len(_maps) > MAX_OPEN_MAPS:
+            _maps.popitem(last=False)
+        
+        return mapped
+
+
+def forget_pcm_map(path):
+    """Drop a cached mapping (e.g. before the file is deleted)"""
+    with _maps_lock:
+        _maps.pop(str(path), None)
+
+
+def load_pcm(chunk):
+    """
+    Zero-copy view of a chunk's preprocessed samples
+    
+    The view is read-only; stages that modify samples must copy first.
+    
+    Args:
+        chunk (dict): Audio chunk document with preprocessed_offset set
+    
+    Returns:
+        np.ndarray: float32 samples at PCM_SAMPLE_RATE
+    """
+    path = Path(chunk['preprocessed_path'])
+    if not path.exists():
+        raise FileNotFoundError(f"Preprocessed audio not found: {path}")
+    
+    start = chunk['preprocessed_offset'] // PCM_DTYPE.itemsize
+    end = start + chunk['preprocessed_samples']
+    
+    mapped = _get_map(path, end * PCM_DTYPE.itemsize)
+    return mapped[start:end]
+
+
+def wav_header(num_samples, sample_rate=PCM_SAMPLE_RATE):
+    """
+    44-byte WAV header for mono IEEE float32 samples
+    
+    Args:
+        num_samples (int): Number of samples in the data chunk
+        sample_rate (int): Sample rate
+    
+    Returns:
+        bytes: Header
+    """
+    data_size = num_samples * PCM_DTYPE.itemsize
+    
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16,
+        3,  # WAVE_FORMAT_IEEE_FLOAT
+        1,  # mono
+        sample_rate,
+        sample_rate * PCM_DTYPE.itemsize,
+        PCM_DTYPE.itemsize,
+        PCM_DTYPE.itemsize * 8,
+        b'data', data_size
+    )
+
+
+def pcm_wav_size(chunk):
+    """Size in bytes of a chunk served as WAV (header + samples)"""
+    return WAV_HEADER_SIZE + chunk['preprocessed_samples'] * PCM_DTYPE.itemsize
+
+
+def iter_pcm_wav(chunk, start=0, end=None, block_size=64 * 1024):
+    """
+    Yield bytes start..end (inclusive) of a chunk served as a WAV file
+    
+    Sample data comes straight from the mapped buffer in block_size slices.
+    
+    Args:
+        chunk (dict): Audio chunk document with preprocessed_offset set
+        start (int): First byte of the virtual WAV file
+        end (int, optional): Last byte (defaults to the end of the file)
+        block_size (int): Bytes per yielded block
+    
+    Yields:
+        bytes: Response body blocks
+    """
+    total = pcm_wav_size(chunk)
+    end = total - 1 if end is None else min(end, total - 1)
+    
+    if start < WAV_HEADER_SIZE:
+        yield wav_header(chunk['preprocessed_samples'])[start:end + 1]
+        start = WAV_HEADER_SIZE
+    
+    if start > end:
+        return
+    
+    data = memoryview(load_pcm(chunk)).cast('B')
+    
+    position = start - WAV_HEADER_SIZE
+    stop = end - WAV_HEADER_SIZE + 1
+    while position < stop:
+        next_position = min(position + block_size, stop)
+        yield bytes(data[position:next_position])
+        position = next_position
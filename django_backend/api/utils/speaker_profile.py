@@ -0,0 +1,287 @@
+"""
+Streaming per-session speaker profiles for diarization
+
+Each audio session keeps running MFCC statistics (Welford mean/M2) of the
+student's own voice. Early speech enrolls the profile; every later chunk
+is scored frame-by-frame against it, so diarization costs O(chunk) and
+never re-analyses earlier audio.
+
+State lives in Redis so all Celery workers share it, with an in-process
+fallback when Redis is unreachable.
+"""
+from django.conf import settings
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY = 'audio:speaker_profile:{session_id}'
+
+# In-process fallback (per worker) when Redis is not available
+_local_profiles = {}
+
+_redis_client = None
+
+
+def _get_redis():
+    """Lazily create the Redis client used for session state"""
+    global _redis_client
+    
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(settings.AUDIO_STATE_REDIS_URL)
+    
+    return _redis_client
+
+
+def _profile_config():
+    return settings.AUDIO_CONFIG['processing'].get('speaker_profile', {})
+
+
+def _empty_profile(n_features):
+    return {
+        'n': 0,
+        'mean': [0.0] * n_features,
+        'm2': [0.0] * n_features,
+        'enrolled_seconds': 0.0,
+        'merged_through': -1,  # every chunk index up to here is folded in
+        'merged_ahead': []  # folded-in indexes past merged_through (out of order)
+    }
+
+
+def _mark_merged(profile, chunk_index, window):
+    """
+    Record a chunk as folded in; False if it already was
+    
+    Keeps a high-water mark plus the few indexes merged ahead of a gap, so
+    the de-dup state stays bounded however long the session runs. When more
+    than window chunks are ahead, the oldest gap is given up on: a chunk
+    that late is not folded in (it is still labelled).
+    
+    Args:
+        profile (dict): Profile state (modified in place)
+        chunk_index (int): Position of the chunk within the session
+        window (int): Indexes kept past the high-water mark
+    
+    Returns:
+        bool: True if the chunk should be merged now
+    """
+    ahead = profile.setdefault('merged_ahead', [])
+    if chunk_index <= profile.setdefault('merged_through', -1) or chunk_index in ahead:
+        return False
+    
+    ahead.append(chunk_index)
+    ahead.sort()
+    
+    while ahead and (ahead[0] == profile['merged_through'] + 1 or len(ahead) > window):
+        profile['merged_through'] = ahead.pop(0)
+    
+    return True
+
+
+def get_speaker_profile(session_id):
+    """
+    Get the stored speaker profile for a session
+    
+    Args:
+        session_id (str): Audio session ID
+    
+    Returns:
+        dict or None: Profile state
+    """
+    key = PROFILE_KEY.format(session_id=session_id)
+    
+    try:
+        raw = _get_redis().get(key)
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        logger.warning(f"Speaker profile store unavailable, using local state: {e}")
+        return _local_profiles.get(key)
+
+
+def delete_speaker_profile(session_id):
+    """Drop a session's profile (e.g. when the session ends)"""
+    key = PROFILE_KEY.format(session_id=session_id)
+    _local_profiles.pop(key, None)
+    
+    try:
+        _get_redis().delete(key)
+    except Exception as e:
+        logger.warning(f"Could not delete speaker profile {session_id}: {e}")
+
+
+def _merge_frames(profile, frames):
+    """
+    Fold new MFCC frames into the running statistics (Chan et al. parallel Welford)
+    
+    Args:
+        profile (dict): Profile state (modified in place)
+        frames (np.ndarray): Frames x coefficients
+    """
+    n_new = len(frames)
+    if n_new == 0:
+        return
+    
+    n_old = profile['n']
+    mean_old = np.asarray(profile['mean'])
+    m2_old = np.asarray(profile['m2'])
+    
+    mean_new = frames.mean(axis=0)
+    m2_new = ((frames - mean_new) ** 2).sum(axis=0)
+    
+    n = n_old + n_new
+    delta = mean_new - mean_old
+    
+    profile['n'] = n
+    profile['mean'] = (mean_old + delta * n_new / n).tolist()
+    profile['m2'] = (m2_old + m2_new + delta ** 2 * n_old * n_new / n).tolist()
+
+
+def _frame_distances(profile, frames):
+    """Per-frame RMS z-score distance from the enrolled voice"""
+    mean = np.asarray(profile['mean'])
+    std = np.sqrt(np.asarray(profile['m2']) / max(profile['n'] - 1, 1))
+    std = np.maximum(std, 1e-3)
+    
+    return np.sqrt((((frames - mean) / std) ** 2).mean(axis=1))
+
+
+def _update_profile(session_id, apply):
+    """
+    Read-modify-write a profile atomically
+    
+    Uses WATCH/MULTI so concurrent workers on the same session do not lose
+    updates; falls back to the local store without Redis.
+    
+    Args:
+        session_id (str): Audio session ID
+        apply (callable): Receives the current profile (or None), returns the new one
+    """
+    key = PROFILE_KEY.format(session_id=session_id)
+    ttl = _profile_config().get('ttl_seconds', 6 * 3600)
+    
+    try:
+        import redis
+        client = _get_redis()
+        
+        with client.pipeline() as pipe:
+            for _ in range(5):
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    profile = apply(json.loads(raw) if raw else None)
+                    
+                    pipe.multi()
+                    pipe.set(key, json.dumps(profile), ex=ttl)
+                    pipe.execute()
+                    return profile
+                except redis.WatchError:
+                    continue
+        
+        logger.warning(f"Speaker profile update for {session_id} kept conflicting, skipped")
+        return None
+    
+    except Exception as e:
+        logger.warning(f"Speaker profile store unavailable, using local state: {e}")
+        profile = apply(_local_profiles.get(key))
+        _local_profiles[key] = profile
+        return profile
+
+
+def diarize_with_profile(session_id, chunk_index, mfccs, frame_times, speech_segments):
+    """
+    Label a chunk's speech segments against the session's speaker profile
+    
+    Until enroll_seconds of speech have been seen, speech is attributed to the
+    student and enrolled. After that each frame is compared with the profile;
+    a segment whose frames mostly fall outside distance_threshold is labelled
+    as another speaker. Only the student's own frames update the profile.
+    Chunks are merged in whatever order workers finish them (the merge is
+    order-independent), and a chunk_index already merged is never folded in
+    twice (see _mark_merged for the bounded de-dup state).
+    
+    Args:
+        session_id (str): Audio session ID
+        chunk_index (int): Position of the chunk within the session
+        mfccs (np.ndarray): Coefficients x frames
+        frame_times (np.ndarray): Start time of each MFCC frame (seconds)
+        speech_segments (list): VAD segments ({start, end})
+    
+    Returns:
+        dict: Diarization results (num_speakers, speaker_segments, speaker_durations, profile)
+    """
+    config = _profile_config()
+    enroll_seconds = config.get('enroll_seconds', 10.0)
+    distance_threshold = config.get('distance_threshold', 2.5)
+    min_foreign_seconds = config.get('min_foreign_seconds', 0.5)
+    
+    frames = np.asarray(mfccs, dtype=np.float64).T
+    frame_times = np.asarray(frame_times)
+    frame_seconds = float(np.median(np.diff(frame_times))) if len(frame_times) > 1 else 0.0
+    
+    starts = np.array([seg['start'] for seg in speech_segments], dtype=np.float64)
+    ends = np.array([seg['end'] for seg in speech_segments], dtype=np.float64)
+    
+    # Map each frame to the VAD segment that contains it (-1 = non-speech)
+    segment_of_frame = np.searchsorted(starts, frame_times, side='right') - 1
+    in_speech = segment_of_frame >= 0
+    in_speech[in_speech] = frame_times[in_speech] < ends[segment_of_frame[in_speech]]
+    segment_of_frame[~in_speech] = -1
+    
+    profile = get_speaker_profile(session_id)
+    enrolled = bool(profile) and profile['enrolled_seconds'] >= enroll_seconds
+    
+    foreign_frames = np.zeros(len(frames), dtype=bool)
+    if enrolled:
+        foreign_frames = in_speech & (_frame_distances(profile, frames) > distance_threshold)
+    
+    # Fraction of foreign frames per segment
+    n_segments = len(speech_segments)
+    speech_idx = segment_of_frame[in_speech]
+    frames_per_segment = np.bincount(speech_idx, minlength=n_segments)
+    foreign_per_segment = np.bincount(speech_idx, weights=foreign_frames[in_speech], minlength=n_segments)
+    foreign_ratio = foreign_per_segment / np.maximum(frames_per_segment, 1)
+    
+    foreign_segment = foreign_ratio > 0.5
+    foreign_seconds = float(np.sum((ends - starts)[foreign_segment])) if n_segments else 0.0
+    num_speakers = 2 if foreign_seconds >= min_foreign_seconds else 1
+    
+    speaker_segments = []
+    speaker_durations = {}
+    for i, segment in enumerate(speech_segments):
+        speaker_label = 'SPEAKER_01' if num_speakers > 1 and foreign_segment[i] else 'SPEAKER_00'
+        speaker_segments.append({
+            'speaker': speaker_label,
+            'start': segment['start'],
+            'end': segment['end']
+        })
+        duration = segment['end'] - segment['start']
+        speaker_durations[speaker_label] = speaker_durations.get(speaker_label, 0) + duration
+    
+    own_frames = frames[in_speech & ~foreign_frames]
+    
+    merge_window = config.get('merge_window_chunks', 32)
+    
+    def apply(current):
+        current = current or _empty_profile(frames.shape[1])
+        if not _mark_merged(current, chunk_index, merge_window):
+            # Already folded in (task retry or duplicate delivery)
+            return current
+        _merge_frames(current, own_frames)
+        current['enrolled_seconds'] += len(own_frames) * frame_seconds
+        return current
+    
+    if chunk_index is not None:
+        _update_profile(session_id, apply)
+    
+    return {
+        'num_speakers': num_speakers,
+        'speaker_segments': speaker_segments,
+        'speaker_durations': {k: round(v, 2) for k, v in speaker_durations.items()},
+        'profile': {
+            'enrolled': enrolled,
+            'foreign_speech_seconds': round(foreign_seconds, 2)
+        }
+    }
@@ -0,0 +1,200 @@
+"""
+Incremental audio storage accounting
+
+Byte, file and chunk counters are kept per tier at three scopes (all
+storage, per quiz, per quiz+student) in the storage_stats collection and
+updated with $inc whenever audio is written or deleted, so statistics are
+read with a single find_one instead of walking the storage tree.
+reconcile_storage_stats recounts from disk to correct any drift.
+
+Tiers match the top-level storage directories: 'raw' (one file per chunk),
+'segments' (per-session raw files), 'preprocessed' and 'archived'
+(compressed files of closed quizzes; an archived chunk counts once there).
+"""
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+from django.conf import settings
+from pymongo import UpdateOne, ReplaceOne
+
+from api.models import storage_stats_collection, audio_chunks_collection
+
+logger = logging.getLogger(__name__)
+
+STORAGE_TIERS = ('raw', 'segments', 'preprocessed', 'archived')
+
+TOTAL_KEY = 'total'
+
+
+def _scope_keys(quiz_id, student_id):
+    """Counter document IDs a write for this quiz/student contributes to"""
+    return [
+        (TOTAL_KEY, {'scope': 'total'}),
+        (f"quiz:{quiz_id}", {'scope': 'quiz', 'quiz_id': quiz_id}),
+        (f"student:{quiz_id}:{student_id}", {'scope': 'student', 'quiz_id': quiz_id, 'student_id': student_id}),
+    ]
+
+
+def record_storage(quiz_id, student_id, tier, bytes_delta=0, files_delta=0, chunks_delta=0):
+    """
+    Apply a storage change to the counters (one bulk round-trip)
+    
+    Accounting never fails the write it describes; errors are logged and
+    left for reconciliation to correct.
+    
+    Args:
+        quiz_id (str): Quiz ID
+        student_id (str): Student ID
+        tier (str): One of STORAGE_TIERS
+        bytes_delta (int): Bytes added (negative when deleting)
+        files_delta (int): Files created (negative when deleting)
+        chunks_delta (int): Chunks stored (negative when deleting)
+    """
+    inc = {}
+    if bytes_delta:
+        inc[f'{tier}.bytes'] = int(bytes_delta)
+    if files_delta:
+        inc[f'{tier}.files'] = int(files_delta)
+    if chunks_delta:
+        inc[f'{tier}.chunks'] = int(chunks_delta)
+    if not inc:
+        return
+    
+    now = datetime.utcnow()
+    
+    try:
+        storage_stats_collection.bulk_write([
+            UpdateOne(
+                {'_id': key},
+                {'$inc': inc, '$set': {'updated_at': now}, '$setOnInsert': scope},
+                upsert=True
+            )
+            for key, scope in _scope_keys(quiz_id, student_id)
+        ], ordered=False)
+    except Exception as e:
+        logger.error(f"Error recording storage change for quiz {quiz_id}: {e}")
+
+
+def _tier_summary(doc):
+    summary = {}
+    for tier in STORAGE_TIERS:
+        counters = (doc or {}).get(tier) or {}
+        summary[tier] = {
+            'files': counters.get('files', 0),
+            'chunks': counters.get('chunks', 0),
+            'bytes': counters.get('bytes', 0)
+        }
+    return summary
+
+
+def get_storage_counters(quiz_id=None, student_id=None):
+    """
+    Read precomputed counters for all storage, a quiz, or one student in a quiz
+    
+    Args:
+        quiz_id (str, optional): Quiz ID
+        student_id (str, optional): Student ID (requires quiz_id)
+    
+    Returns:
+        dict: tier -> {files, chunks, bytes}, plus updated_at / reconciled_at
+    """
+    if quiz_id and student_id:
+        key = f"student:{quiz_id}:{student_id}"
+    elif quiz_id:
+        key = f"quiz:{quiz_id}"
+    else:
+        key = TOTAL_KEY
+    
+    doc = storage_stats_collection.find_one({'_id': key})
+    
+    counters = _tier_summary(doc)
+    counters['updated_at'] = (doc or {}).get('updated_at')
+    counters['reconciled_at'] = (doc or {}).get('reconciled_at')
+    return counters
+
+
+def reconcile_storage_stats():
+    """
+    Recount storage from disk and the chunk collection, replacing all counters
+    
+    Expensive (walks every tier); meant for an occasional maintenance run.
+    
+    Returns:
+        dict: Number of counter documents written and the drift corrected in the totals
+    """
+    now = datetime.utcnow()
+    storage_root = settings.AUDIO_STORAGE_ROOT
+    
+    counters = defaultdict(lambda: defaultdict(lambda: {'files': 0, 'chunks': 0, 'bytes': 0}))
+    scopes = {}
+    
+    def add(quiz_id, student_id, tier, files=0, chunks=0, size=0):
+        for key, scope in _scope_keys(quiz_id, student_id):
+            scopes[key] = scope
+            counters[key][tier]['files'] += files
+            counters[key][tier]['chunks'] += chunks
+            counters[key][tier]['bytes'] += size
+    
+    # Files and bytes from disk: <tier>/<quiz_id>/<student_id>/<file>
+    for tier in STORAGE_TIERS:
+        tier_dir = storage_root / tier
+        if not tier_dir.exists():
+            continue
+        
+        for file_path in tier_dir.glob('*/*/*'):
+            if file_path.is_file():
+                quiz_id, student_id = file_path.parent.parent.name, file_path.parent.name
+                add(quiz_id, student_id, tier, files=1, size=file_path.stat().st_size)
+    
+    # Chunks per tier from the chunk documents
+    pipeline = [
+        {'$group': {
+            '_id': {
+                'quiz_id': '$quiz_id',
+                'student_id': '$student_id',
+                'segmented': {'$ne': [{'$ifNull': ['$file_offset', None]}, None]},
+                'archived': {'$eq': ['$storage_tier', 'archived']}
+            },
+            'chunks': {'$sum': 1},
+            'raw_chunks': {'$sum': {'$cond': [{'$ifNull': ['$file_path', False]}, 1, 0]}},
+            'preprocessed_chunks': {'$sum': {'$cond': [{'$ifNull': ['$preprocessed_path', False]}, 1, 0]}}
+        }}
+    ]
+    for row in audio_chunks_collection.aggregate(pipeline, allowDiskUse=True):
+        group = row['_id']
+        if group['archived']:
+            add(group['quiz_id'], group['student_id'], 'archived', chunks=row['chunks'])
+            continue
+        
+        raw_tier = 'segments' if group['segmented'] else 'raw'
+        
+        add(group['quiz_id'], group['student_id'], raw_tier, chunks=row['raw_chunks'])
+        add(group['quiz_id'], group['student_id'], 'preprocessed', chunks=row['preprocessed_chunks'])
+    
+    previous_total = _tier_summary(storage_stats_collection.find_one({'_id': TOTAL_KEY}))
+    
+    operations = []
+    for key, tiers in counters.items():
+        doc = dict(scopes[key])
+        doc.update({tier: dict(values) for tier, values in tiers.items()})
+        doc.update({'_id': key, 'updated_at': now, 'reconciled_at': now})
+        operations.append(ReplaceOne({'_id': key}, doc, upsert=True))
+    
+    if operations:
+        storage_stats_collection.bulk_write(operations, ordered=False)
+    
+    # Scopes with nothing left (not rewritten above)
+    removed = storage_stats_collection.delete_many({'reconciled_at': {'$ne': now}}).deleted_count
+    
+    current_total = _tier_summary(counters.get(TOTAL_KEY))
+    drift = {
+        tier: {
+            field: current_total[tier][field] - previous_total[tier][field]
+            for field in ('files', 'chunks', 'bytes')
+        }
+        for tier in STORAGE_TIERS
+    }
+    
+    logger.info(f"Reconciled storage stats: {len(operations)} counters written, {removed} removed, drift {drift}")
+    return {'counters': len(operations), 'removed': removed, 'drift': drift}
@@ -0,0 +1,320 @@
+"""
+Voice activity detection utilities
+
+Speech segmentation is vectorized with NumPy (edge detection on a frame mask
+instead of a per-frame Python loop). Frame classification is pluggable:
+register a backend in VAD_BACKENDS and select it with
+AUDIO_CONFIG['processing']['vad']['backend'].
+"""
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the mean frame RMS used as the speech threshold, per
+# vad_aggressiveness level (0 = most permissive, 3 = most aggressive).
+# Level 2 matches the original fixed 0.5 * mean threshold.
+ENERGY_THRESHOLD_RATIOS = {0: 0.3, 1: 0.4, 2: 0.5, 3: 0.65}
+
+# Minimum speech required for a chunk to count as containing speech (seconds)
+MIN_TOTAL_SPEECH = 0.5
+
+
+def frame_rms(y, frame_length, hop_length):
+    """
+    Compute centered per-frame RMS energy
+    
+    Uses a cumulative sum of squares so the cost is O(samples) regardless of
+    frame length. Frames are centered like librosa.feature.rms.
+    
+    Args:
+        y (np.ndarray): Mono samples
+        frame_length (int): Frame size in samples
+        hop_length (int): Hop size in samples
+    
+    Returns:
+        np.ndarray: RMS value per frame
+    """
+    y = np.asarray(y, dtype=np.float64)
+    padded = np.pad(y, frame_length // 2)
+    
+    n_frames = 1 + (len(padded) - frame_length) // hop_length
+    if n_frames <= 0:
+        return np.zeros(0)
+    
+    squares = np.concatenate(([0.0], np.cumsum(padded * padded)))
+    starts = np.arange(n_frames) * hop_length
+    energy = (squares[starts + frame_length] - squares[starts]) / frame_length
+    
+    return np.sqrt(np.maximum(energy, 0.0))
+
+
+def hysteresis_mask(values, high, low):
+    """
+    Two-threshold frame classification
+    
+    A run of frames above `low` counts as speech only if it reaches `high`
+    somewhere, so segments start on clear speech and are not chopped up
+    by brief dips.
+    
+    Args:
+        values (np.ndarray): Per-frame score (e.g. RMS)
+        high (float): Threshold to enter speech
+        low (float): Threshold to stay in speech
+    
+    Returns:
+        np.ndarray: Boolean speech mask
+    """
+    above_low = values > low
+    above_high = values > high
+    
+    starts, ends = _runs(above_low)
+    if len(starts) == 0:
+        return np.zeros(len(values), dtype=bool)
+    
+    # above_high is a subset of above_low, so sums across gaps are zero
+    reached_high = np.add.reduceat(above_high.astype(np.int32), starts) > 0
+    
+    delta = np.zeros(len(values) + 1, dtype=np.int32)
+    np.add.at(delta, starts[reached_high], 1)
+    np.add.at(delta, ends[reached_high], -1)
+    
+    return np.cumsum(delta[:-1]) > 0
+
+
+def mask_to_segments(mask, hop_seconds, total_duration, min_speech=0.0, min_silence=0.0):
+    """
+    Convert a frame mask into speech segments
+    
+    Gaps shorter than min_silence are merged, then segments shorter than
+    min_speech are dropped.
+    
+    Args:
+        mask (np.ndarray): Boolean speech mask per frame
+        hop_seconds (float): Time between frame starts
+        total_duration (float): Audio duration (end of a trailing segment)
+        min_speech (float): Minimum segment length in seconds
+        min_silence (float): Minimum gap length in seconds
+    
+    Returns:
+        tuple: (start_times, end_times) as float arrays
+    """
+    starts, ends = _runs(np.asarray(mask, dtype=bool))
+    
+    start_times = starts * hop_seconds
+    end_times = ends * hop_seconds
+    if len(ends) and ends[-1] == len(mask):
+        end_times[-1] = total_duration
+    
+    if len(start_times) > 1 and min_silence > 0:
+        keep_gap = (start_times[1:] - end_times[:-1]) >= min_silence
+        start_times = start_times[np.concatenate(([True], keep_gap))]
+        end_times = end_times[np.concatenate((keep_gap, [True]))]
+    
+    if min_speech > 0:
+        long_enough = (end_times - start_times) >= min_speech
+        start_times = start_times[long_enough]
+        end_times = end_times[long_enough]
+    
+    return start_times, end_times
+
+
+def _runs(mask):
+    """Start (inclusive) and end (exclusive) indices of True runs"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def silence_gate(y, sr, max_rms_dbfs=-50.0, noise_rms_dbfs=-40.0, noise_min_zcr=0.3):
+    """
+    Cheap check for chunks with nothing worth analysing
+    
+    Looks at the loudest 100 ms window of the raw (un-normalized) signal.
+    A chunk is silent when that window is below max_rms_dbfs, or when it is
+    below noise_rms_dbfs and the zero-crossing rate is noise-like (hiss,
+    fan noise) rather than voiced speech.
+    
+    Args:
+        y (np.ndarray): Raw mono samples in [-1, 1]
+        sr (int): Sample rate
+        max_rms_dbfs (float): Below this the chunk is silent
+        noise_rms_dbfs (float): Below this, a high ZCR also counts as silent
+        noise_min_zcr (float): Zero crossings per sample that indicate noise
+    
+    Returns:
+        tuple: (is_silent, stats)
+    """
+    window = max(int(0.1 * sr), 1)
+    rms = frame_rms(y, window, window)
+    
+    peak_rms = float(rms.max()) if len(rms) else 0.0
+    peak_dbfs = float(20 * np.log10(max(peak_rms, 1e-10)))
+    
+    signs = np.signbit(y)
+    zcr = float(np.count_nonzero(signs[1:] != signs[:-1]) / max(len(y) - 1, 1))
+    
+    is_silent = bool(peak_dbfs < max_rms_dbfs or (peak_dbfs < noise_rms_dbfs and zcr >= noise_min_zcr))
+    
+    return is_silent, {
+        'peak_rms_dbfs': round(peak_dbfs, 1),
+        'zero_crossing_rate': round(zcr, 3)
+    }
+
+
+class EnergyVAD:
+    """
+    RMS energy VAD with hysteresis
+    
+    The speech threshold is a fraction of the chunk's mean frame energy,
+    chosen by vad_aggressiveness.
+    """
+    name = 'energy'
+    
+    def __init__(self, aggressiveness=2, frame_ms=30, hysteresis_ratio=0.8):
+        self.aggressiveness = int(aggressiveness)
+        self.threshold_ratio = ENERGY_THRESHOLD_RATIOS.get(self.aggressiveness, 0.5)
+        self.frame_ms = frame_ms
+        self.hysteresis_ratio = hysteresis_ratio
+    
+    def speech_mask(self, y, sr):
+        """
+        Classify frames as speech
+        
+        Returns:
+            tuple: (mask, hop_seconds)
+        """
+        frame_length = int(self.frame_ms / 1000 * sr)
+        hop_length = frame_length // 2
+        
+        rms = frame_rms(y, frame_length, hop_length)
+        if len(rms) == 0:
+            return np.zeros(0, dtype=bool), hop_length / sr
+        
+        high = np.mean(rms) * self.threshold_ratio
+        low = high * self.hysteresis_ratio
+        
+        return hysteresis_mask(rms, high, low), hop_length / sr
+
+
+class WebRtcVAD:
+    """
+    Google WebRTC VAD (requires the optional webrtcvad package)
+    
+    vad_aggressiveness is passed straight through (0-3).
+    """
+    name = 'webrtc'
+    
+    SUPPORTED_RATES = (8000, 16000, 32000, 48000)
+    
+    def __init__(self, aggressiveness=2, frame_ms=30, **kwargs):
+        import webrtcvad
+        
+        self.vad = webrtcvad.Vad(int(aggressiveness))
+        self.frame_ms = frame_ms
+    
+    def speech_mask(self, y, sr):
+        """
+        Classify frames as speech
+        
+        Returns:
+            tuple: (mask, hop_seconds)
+        """
+        if sr not in self.SUPPORTED_RATES:
+            raise ValueError(f"webrtcvad does not support {sr}Hz audio")
+        
+        frame_length = int(self.frame_ms / 1000 * sr)
+        pcm = (np.clip(y, -1.0, 1.0) * 32767).astype('<i2')
+        
+        n_frames = len(pcm) // frame_length
+        frames = pcm[:n_frames * frame_length].reshape(n_frames, frame_length)
+        
+        mask = np.fromiter(
+            (self.vad.is_speech(frame.tobytes(), sr) for frame in frames),
+            dtype=bool,
+            count=n_frames
+        )
+        
+        return mask, frame_length / sr
+
+
+VAD_BACKENDS = {
+    EnergyVAD.name: EnergyVAD,
+    WebRtcVAD.name: WebRtcVAD,
+}
+
+
+def get_vad_backend(name=None, aggressiveness=None):
+    """
+    Build the configured VAD backend
+    
+    Falls back to the energy backend when the requested backend's optional
+    dependency is missing.
+    
+    Args:
+        name (str, optional): Backend name (defaults to AUDIO_CONFIG setting)
+        aggressiveness (int, optional): 0-3 (defaults to vad_aggressiveness)
+    
+    Returns:
+        object: Backend with a speech_mask(y, sr) method
+    """
+    from django.conf import settings
+    
+    processing = settings.AUDIO_CONFIG['processing']
+    vad_config = processing.get('vad', {})
+    
+    name = name or vad_config.get('backend', 'energy')
+    if aggressiveness is None:
+        aggressiveness = processing.get('vad_aggressiveness', 2)
+    
+    backend_class = VAD_BACKENDS.get(name)
+    if backend_class is None:
+        logger.warning(f"Unknown VAD backend '{name}', using energy")
+        backend_class = EnergyVAD
+    
+    try:
+        return backend_class(aggressiveness=aggressiveness)
+    except ImportError as e:
+        logger.warning(f"VAD backend '{name}' unavailable ({e}), using energy")
+        return EnergyVAD(aggressiveness=aggressiveness)
+
+
+def detect_speech_segments(y, sr, backend=None, min_speech=None, min_silence=None):
+    """
+    Run VAD on a chunk and build the vad_results document
+    
+    Args:
+        y (np.ndarray): Mono samples
+        sr (int): Sample rate
+        backend (object, optional): VAD backend (defaults to get_vad_backend())
+        min_speech (float, optional): Minimum segment length in seconds
+        min_silence (float, optional): Minimum gap length in seconds
+    
+    Returns:
+        dict: VAD results (has_speech, speech_segments, total_speech_duration)
+    """
+    if backend is None or min_speech is None or min_silence is None:
+        from django.conf import settings
+        vad_config = settings.AUDIO_CONFIG['processing'].get('vad', {})
+        
+        backend = backend or get_vad_backend()
+        min_speech = vad_config.get('min_speech_seconds', 0.1) if min_speech is None else min_speech
+        min_silence = vad_config.get('min_silence_seconds', 0.15) if min_silence is None else min_silence
+    
+    mask, hop_seconds = backend.speech_mask(y, sr)
+    starts, ends = mask_to_segments(
+        mask, hop_seconds, len(y) / sr,
+        min_speech=min_speech, min_silence=min_silence
+    )
+    
+    starts = np.round(starts, 2)
+    ends = np.round(ends, 2)
+    total_speech_duration = float(np.sum(ends - starts))
+    
+    return {
+        'has_speech': total_speech_duration > MIN_TOTAL_SPEECH,
+        'speech_segments': [
+            {'start': float(start), 'end': float(end)}
+            for start, end in zip(starts, ends)
+        ],
+        'total_speech_duration': round(total_speech_duration, 2)
+    }
@@ -0,0 +1,135 @@
+"""
+Async audio ingestion views (ASGI)
+
+Plain async Django views rather than DRF (DRF views are sync-only). Mongo
+calls go through motor and the file write runs off the event loop, so one
+process can hold many in-flight uploads without tying up a thread each.
+"""
+from django.http import JsonResponse
+from rest_framework import exceptions
+from bson import ObjectId
+from bson.errors import InvalidId
+import asyncio
+import json
+import logging
+
+from api.authentication import authenticate_request_async
+from api.models import get_async_db
+from api.utils.audio_config import get_cached_quiz_audio_config, get_quiz_audio_config
+from api.utils.audio_storage import save_audio_file
+from api.views.audio_views import _build_chunk_doc, _session_chunks_update
+
+logger = logging.getLogger(__name__)
+
+
+def _error(message, status_code):
+    return JsonResponse({'success': False, 'error': message}, status=status_code)
+
+
+async def upload_audio_chunk_async(request):
+    """
+    Upload audio chunk for processing (async)
+    
+    POST /api/audio/upload/async
+    Same request and response as /api/audio/upload:
+    {
+        "quiz_id": "string",
+        "student_id": "string",
+        "session_id": "string",
+        "chunk_index": integer,
+        "timestamp": "ISO8601",
+        "audio_data": "base64 encoded audio"
+    }
+    """
+    if request.method != 'POST':
+        return _error('Method not allowed', 405)
+    
+    try:
+        try:
+            user = await authenticate_request_async(request)
+        except exceptions.AuthenticationFailed as e:
+            return _error(str(e.detail), 401)
+        
+        if user is None:
+            return _error('Authentication credentials were not provided.', 401)
+        
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return _error('Invalid JSON body', 400)
+        
+        # Extract data
+        quiz_id = data.get('quiz_id')
+        student_id = data.get('student_id')
+        session_id = data.get('session_id')
+        chunk_index = data.get('chunk_index')
+        timestamp = data.get('timestamp')
+        audio_data = data.get('audio_data')
+        
+        # Validate required fields
+        if not all([quiz_id, student_id, session_id, chunk_index is not None, timestamp, audio_data]):
+            return _error('Missing required fields', 400)
+        
+        # Verify user is the student
+        if str(user.get('_id')) != student_id:
+            return _error('Unauthorized: Can only upload your own audio', 403)
+        
+        # Quiz config is normally cached; only a miss needs the blocking lookup
+        quiz_config = get_cached_quiz_audio_config(quiz_id)
+        if quiz_config is None:
+            quiz_config = await asyncio.to_thread(get_quiz_audio_config, quiz_id)
+        
+        if not quiz_config.exists:
+            return _error('Quiz not found', 404)
+        
+        if not quiz_config.is_active:
+            return _error('Quiz is not active', 403)
+        
+        if not quiz_config.enabled:
+            return _error('Audio proctoring not enabled for this quiz', 403)
+        
+        db = get_async_db()
+        
+        # Verify student exists
+        try:
+            student = await db['students'].find_one({'_id': ObjectId(student_id)}, {'_id': 1})
+        except InvalidId:
+            student = None
+        if not student:
+            return _error('Student not found', 404)
+        
+        # Decode and write the file off the event loop
+        chunk_id, storage = await asyncio.to_thread(save_audio_file, audio_data, quiz_id, student_id, session_id)
+        
+        if not chunk_id:
+            return _error('Failed to save audio file', 500)
+        
+        chunk_doc = _build_chunk_doc(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp)
+        
+        await db['audio_chunks'].insert_one(chunk_doc)
+        logger.info(f"Created audio chunk document: {chunk_id}")
+        
+        # Update session statistics (and segment offset index)
+        await db['audio_sessions'].update_one(
+            {'session_id': session_id},
+            _session_chunks_update([chunk_doc])
+        )
+        
+        # Enqueue preprocessing task
+        # Temporarily disabled until audio processing libraries are installed
+        # await asyncio.to_thread(enqueue_audio_chunk, chunk_id, quiz_id)
+        logger.info(f"Audio chunk uploaded (processing disabled): {chunk_id}")
+        
+        return JsonResponse({
+            'success': True,
+            'chunk_id': chunk_id,
+            'processing_status': 'queued'
+        }, status=201)
+    
+    except Exception as e:
+        logger.error(f"Error uploading audio chunk (async): {e}")
+        return _error('Internal server error', 500)
+
+
+# Token-authenticated JSON API, no session cookies
+upload_audio_chunk_async.csrf_exempt = True
@@ -1,11 +1,14 @@
 """
 Audio proctoring API views
 """
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from datetime import datetime
+from io import BytesIO
 from bson import ObjectId
 import uuid
 import logging
@@ -13,17 +16,198 @@ import logging
 from api.models import (
     audio_chunks_collection,
     audio_sessions_collection,
-    quizzes_collection,
     students_collection
 )
-from api.utils.audio_storage import save_audio_file, get_audio_file_path
-from api.utils.audio_config import is_audio_proctoring_enabled
+from api.utils.audio_storage import (
+    save_audio_file,
+    get_audio_file_path,
+    get_max_chunk_size,
+    extension_for_content_type,
+    stream_audio_to_staging,
+    segment_index_entry,
+    get_storage_stats,
+    AudioStreamUploadHandler,
+    AudioChunkTooLarge,
+    AUDIO_CONTENT_TYPES
+)
+from api.utils.audio_config import get_quiz_audio_config
+from api.utils.audio_playback import (
+    build_playback_response,
+    verify_playback_token,
+    InvalidPlaybackToken
+)
 # Temporarily disabled until audio processing libraries are installed
-# from api.tasks.audio_tasks import preprocess_audio_chunk
+# from api.tasks.audio_tasks import enqueue_audio_chunk, enqueue_audio_chunks
 
 logger = logging.getLogger(__name__)
 
 
+def _check_upload_access(request, quiz_id, student_id):
+    """
+    Verify the caller may upload audio for this quiz and student
+    
+    Returns:
+        Response or None: Error response, or None if the upload is allowed
+    """
+    # Verify user is the student
+    user_id = str(request.user.get('_id'))
+    if user_id != student_id:
+        return Response({
+            'success': False,
+            'error': 'Unauthorized: Can only upload your own audio'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Verify quiz exists and is active (cached, no quiz lookup in steady state)
+    quiz_config = get_quiz_audio_config(quiz_id)
+    if not quiz_config.exists:
+        return Response({
+            'success': False,
+            'error': 'Quiz not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    if not quiz_config.is_active:
+        return Response({
+            'success': False,
+            'error': 'Quiz is not active'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Verify audio proctoring is enabled
+    if not quiz_config.enabled:
+        return Response({
+            'success': False,
+            'error': 'Audio proctoring not enabled for this quiz'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Verify student exists
+    student = students_collection.find_one({'_id': ObjectId(student_id)})
+    if not student:
+        return Response({
+            'success': False,
+            'error': 'Student not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return None
+
+
+def _check_chunk_teacher(request, chunk):
+    """
+    Verify the caller is the teacher of the chunk's quiz
+    
+    Returns:
+        Response or None: Error response, or None if access is allowed
+    """
+    user_id = str(request.user.get('_id'))
+    
+    if request.user.get('role') != 'teacher':
+        return Response({
+            'success': False,
+            'error': 'Only teachers can play audio'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    quiz_config = get_quiz_audio_config(chunk['quiz_id'])
+    if not quiz_config.exists or quiz_config.teacher_id != user_id:
+        return Response({
+            'success': False,
+            'error': 'Unauthorized access'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return None
+
+
+def _build_chunk_doc(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp):
+    """
+    Build a new audio chunk document in 'queued' state
+    
+    Args:
+        storage (dict): File fields from save_audio_file / StagedAudioFile.commit
+    
+    Returns:
+        dict: Chunk document
+    """
+    now = datetime.utcnow()
+    
+    return {
+        'chunk_id': chunk_id,
+        'quiz_id': quiz_id,
+        'student_id': student_id,
+        'session_id': session_id,
+        'chunk_index': chunk_index,
+        'timestamp': datetime.fromisoformat(timestamp.replace('Z', '+00:00')),
+        'duration': 5.0,  # Default 5 seconds
+        'file_path': storage['file_path'],
+        'file_offset': storage.get('file_offset'),
+        'file_length': storage.get('file_length'),
+        'file_format': storage.get('file_format'),
+        'preprocessed_path': None,
+        'storage_tier': 'hot',
+        'processing_status': 'queued',
+        'created_at': now,
+        'updated_at': now,
+        'vad_results': None,
+        'diarization_results': None,
+        'transcriptions': None,
+        'suspicion_results': None,
+        'error_message': None
+    }
+
+
+def _session_chunks_update(chunk_docs):
+    """
+    Session update counting new chunks and indexing their segment byte ranges
+    
+    Args:
+        chunk_docs (list): Chunk documents just inserted for one session
+    
+    Returns:
+        dict: Update document for audio_sessions_collection
+    """
+    update = {
+        '$inc': {'total_chunks': len(chunk_docs)},
+        '$set': {'updated_at': datetime.utcnow()}
+    }
+    
+    index_entries = [
+        entry for entry in (
+            segment_index_entry(doc['chunk_id'], doc['chunk_index'], doc) for doc in chunk_docs
+        ) if entry
+    ]
+    if index_entries:
+        update['$set']['segment_path'] = chunk_docs[0]['file_path']
+        update['$push'] = {'segment_index': {'$each': index_entries}}
+    
+    return update
+
+
+def _register_chunk(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp):
+    """
+    Create the chunk document, count it on the session and queue processing
+    
+    Returns:
+        Response: 201 response for the uploader
+    """
+    chunk_doc = _build_chunk_doc(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp)
+    
+    audio_chunks_collection.insert_one(chunk_doc)
+    logger.info(f"Created audio chunk document: {chunk_id}")
+    
+    # Update session statistics (and segment offset index)
+    audio_sessions_collection.update_one(
+        {'session_id': session_id},
+        _session_chunks_update([chunk_doc])
+    )
+    
+    # Enqueue preprocessing task
+    # Temporarily disabled until audio processing libraries are installed
+    # enqueue_audio_chunk(chunk_id, quiz_id)
+    logger.info(f"Audio chunk uploaded (processing disabled): {chunk_id}")
+    
+    return Response({
+        'success': True,
+        'chunk_id': chunk_id,
+        'processing_status': 'queued'
+    }, status=status.HTTP_201_CREATED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_audio_chunk(request):
@@ -39,6 +223,8 @@ def upload_audio_chunk(request):
         "timestamp": "ISO8601",
         "audio_data": "base64 encoded audio"
     }
+    
+    Prefer /api/audio/upload/stream for new clients (no base64 overhead).
     """
     try:
         # Extract data
@@ -56,102 +242,266 @@ def upload_audio_chunk(request):
                 'error': 'Missing required fields'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verify user is the student
-        user_id = str(request.user.get('_id'))
-        if user_id != student_id:
-            return Response({
-                'success': False,
-                'error': 'Unauthorized: Can only upload your own audio'
-            }, status=status.HTTP_403_FORBIDDEN)
+        error_response = _check_upload_access(request, quiz_id, student_id)
+        if error_response:
+            return error_response
         
-        # Verify quiz exists and is active
-        quiz = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
-        if not quiz:
-            return Response({
-                'success': False,
-                'error': 'Quiz not found'
-            }, status=status.HTTP_404_NOT_FOUND)
+        # Save audio file
+        chunk_id, storage = save_audio_file(audio_data, quiz_id, student_id, session_id)
         
-        if not quiz.get('is_active', False):
+        if not chunk_id:
             return Response({
                 'success': False,
-                'error': 'Quiz is not active'
-            }, status=status.HTTP_403_FORBIDDEN)
+                'error': 'Failed to save audio file'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Verify audio proctoring is enabled
-        if not is_audio_proctoring_enabled(quiz_id):
+        return _register_chunk(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp)
+    
+    except Exception as e:
+        logger.error(f"Error uploading audio chunk: {e}")
+        return Response({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_audio_chunks_batch(request):
+    """
+    Upload several audio chunks for one session in a single request
+    
+    POST /api/audio/upload/batch
+    {
+        "quiz_id": "string",
+        "student_id": "string",
+        "session_id": "string",
+        "chunks": [
+            {"chunk_index": integer, "timestamp": "ISO8601", "audio_data": "base64 encoded audio"}
+        ]
+    }
+    
+    Access is checked once, documents are written with one insert_many,
+    the session is updated with one $inc and processing is queued with a
+    single broker message. Chunks whose audio cannot be saved are reported
+    in "failed" and the rest are accepted.
+    """
+    try:
+        quiz_id = request.data.get('quiz_id')
+        student_id = request.data.get('student_id')
+        session_id = request.data.get('session_id')
+        chunks = request.data.get('chunks')
+        
+        # Validate required fields
+        if not all([quiz_id, student_id, session_id]) or not isinstance(chunks, list) or not chunks:
             return Response({
                 'success': False,
-                'error': 'Audio proctoring not enabled for this quiz'
-            }, status=status.HTTP_403_FORBIDDEN)
+                'error': 'Missing required fields'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verify student exists
-        student = students_collection.find_one({'_id': ObjectId(student_id)})
-        if not student:
+        max_batch_chunks = settings.AUDIO_CONFIG['storage'].get('max_batch_chunks', 24)
+        if len(chunks) > max_batch_chunks:
             return Response({
                 'success': False,
-                'error': 'Student not found'
-            }, status=status.HTTP_404_NOT_FOUND)
-        
-        # Save audio file
-        chunk_id, file_path = save_audio_file(audio_data, quiz_id, student_id)
+                'error': f'Too many chunks in one batch (max {max_batch_chunks})'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        if not chunk_id:
+        # Validate every chunk before writing anything
+        for chunk in chunks:
+            if not isinstance(chunk, dict) or not all([
+                chunk.get('chunk_index') is not None,
+                chunk.get('timestamp'),
+                chunk.get('audio_data')
+            ]):
+                return Response({
+                    'success': False,
+                    'error': 'Each chunk needs chunk_index, timestamp and audio_data'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                datetime.fromisoformat(chunk['timestamp'].replace('Z', '+00:00'))
+            except (AttributeError, ValueError):
+                return Response({
+                    'success': False,
+                    'error': f"Invalid timestamp for chunk {chunk['chunk_index']}"
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        error_response = _check_upload_access(request, quiz_id, student_id)
+        if error_response:
+            return error_response
+        
+        # Save audio files
+        chunk_docs = []
+        failed = []
+        for chunk in chunks:
+            chunk_id, storage = save_audio_file(chunk['audio_data'], quiz_id, student_id, session_id)
+            
+            if not chunk_id:
+                failed.append(chunk['chunk_index'])
+                continue
+            
+            chunk_docs.append(_build_chunk_doc(
+                chunk_id, storage, quiz_id, student_id, session_id,
+                chunk['chunk_index'], chunk['timestamp']
+            ))
+        
+        if not chunk_docs:
             return Response({
                 'success': False,
-                'error': 'Failed to save audio file'
+                'error': 'Failed to save audio files',
+                'failed': failed
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Create audio chunk document
-        chunk_doc = {
-            'chunk_id': chunk_id,
-            'quiz_id': quiz_id,
-            'student_id': student_id,
-            'session_id': session_id,
-            'chunk_index': chunk_index,
-            'timestamp': datetime.fromisoformat(timestamp.replace('Z', '+00:00')),
-            'duration': 5.0,  # Default 5 seconds
-            'file_path': file_path,
-            'preprocessed_path': None,
-            'processing_status': 'queued',
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'vad_results': None,
-            'diarization_results': None,
-            'transcriptions': None,
-            'suspicion_results': None,
-            'error_message': None
-        }
+        audio_chunks_collection.insert_many(chunk_docs, ordered=False)
+        chunk_ids = [doc['chunk_id'] for doc in chunk_docs]
+        logger.info(f"Created {len(chunk_docs)} audio chunk documents for session {session_id}")
         
-        audio_chunks_collection.insert_one(chunk_doc)
-        logger.info(f"Created audio chunk document: {chunk_id}")
-        
-        # Update session statistics
+        # Update session statistics once for the whole batch
         audio_sessions_collection.update_one(
             {'session_id': session_id},
-            {
-                '$inc': {'total_chunks': 1},
-                '$set': {'updated_at': datetime.utcnow()}
-            }
+            _session_chunks_update(chunk_docs)
         )
         
-        # Enqueue preprocessing task
+        # Enqueue processing with one broker message
         # Temporarily disabled until audio processing libraries are installed
-        # preprocess_audio_chunk.delay(chunk_id)
-        logger.info(f"Audio chunk uploaded (processing disabled): {chunk_id}")
+        # enqueue_audio_chunks.delay(chunk_ids, quiz_id)
+        logger.info(f"Audio chunk batch uploaded (processing disabled): {len(chunk_ids)} chunks")
         
         return Response({
             'success': True,
-            'chunk_id': chunk_id,
+            'chunks': [
+                {'chunk_index': doc['chunk_index'], 'chunk_id': doc['chunk_id']}
+                for doc in chunk_docs
+            ],
+            'failed': failed,
             'processing_status': 'queued'
         }, status=status.HTTP_201_CREATED)
+    
+    except Exception as e:
+        logger.error(f"Error uploading audio chunk batch: {e}")
+        return Response({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def upload_audio_chunk_stream(request):
+    """
+    Upload a binary audio chunk, streamed to disk in fixed-size blocks
+    
+    POST /api/audio/upload/stream
+    
+    Either a raw body:
+        Content-Type: audio/webm (or application/octet-stream)
+        ?quiz_id=&student_id=&session_id=&chunk_index=&timestamp=[&audio_format=webm]
+        (not "format", which DRF reserves for renderer selection)
+    
+    or multipart/form-data with the same fields (format instead of
+    audio_format) and the audio in an "audio" file part.
+    max_chunk_size_mb is enforced while receiving.
+    """
+    staged = None
+    
+    try:
+        content_type = request.content_type or ''
+        is_multipart = content_type.startswith('multipart/form-data')
+        max_size = get_max_chunk_size()
+        
+        if is_multipart:
+            # Must be installed before the body is parsed
+            handler = AudioStreamUploadHandler(request._request)
+            request._request.upload_handlers = [handler]
+            
+            fields = request.data
+            staged = handler.staged
+            
+            if handler.too_large:
+                return Response({
+                    'success': False,
+                    'error': f'Audio chunk exceeds {max_size} bytes'
+                }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            
+            upload_content_type = handler.audio_content_type
+            requested_format = fields.get('format')
+        else:
+            fields = request.query_params
+            upload_content_type = content_type
+            requested_format = fields.get('audio_format')
+        
+        quiz_id = fields.get('quiz_id')
+        student_id = fields.get('student_id')
+        session_id = fields.get('session_id')
+        chunk_index = fields.get('chunk_index')
+        timestamp = fields.get('timestamp')
+        
+        # Validate required fields
+        if not all([quiz_id, student_id, session_id, chunk_index is not None, timestamp]):
+            return Response({
+                'success': False,
+                'error': 'Missing required fields'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            chunk_index = int(chunk_index)
+        except (TypeError, ValueError):
+            return Response({
+                'success': False,
+                'error': 'chunk_index must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        error_response = _check_upload_access(request, quiz_id, student_id)
+        if error_response:
+            return error_response
+        
+        if not is_multipart:
+            # Reject early when the client announces an oversized body
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if content_length > max_size:
+                return Response({
+                    'success': False,
+                    'error': f'Audio chunk exceeds {max_size} bytes'
+                }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            
+            try:
+                staged = stream_audio_to_staging(request.stream or BytesIO(), max_size)
+            except AudioChunkTooLarge:
+                return Response({
+                    'success': False,
+                    'error': f'Audio chunk exceeds {max_size} bytes'
+                }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        if staged is None or staged.size == 0:
+            return Response({
+                'success': False,
+                'error': 'Missing audio data'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_extension = requested_format or extension_for_content_type(upload_content_type)
+        if file_extension not in AUDIO_CONTENT_TYPES.values():
+            return Response({
+                'success': False,
+                'error': f'Unsupported audio format: {file_extension}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        chunk_id, storage = staged.commit(quiz_id, student_id, session_id, file_extension)
+        staged = None
         
+        return _register_chunk(chunk_id, storage, quiz_id, student_id, session_id, chunk_index, timestamp)
+    
     except Exception as e:
-        logger.error(f"Error uploading audio chunk: {e}")
+        logger.error(f"Error streaming audio chunk upload: {e}")
         return Response({
             'success': False,
             'error': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    finally:
+        # Anything still staged was rejected
+        if staged is not None:
+            staged.discard()
 
 
 @api_view(['POST'])
@@ -205,6 +555,7 @@ def start_audio_session(request):
             'total_chunks': 0,
             'processed_chunks': 0,
             'failed_chunks': 0,
+            'gated_chunks': 0,
             'total_flags': 0,
             'consent_given': consent_given,
             'consent_timestamp': datetime.utcnow(),
@@ -218,7 +569,7 @@ def start_audio_session(request):
             'success': True,
             'session_id': session_id
         }, status=status.HTTP_201_CREATED)
-        
+    
     except Exception as e:
         logger.error(f"Error starting audio session: {e}")
         return Response({
@@ -288,7 +639,9 @@ def flag_suspicious_audio(request):
         
         # Insert flag into flags collection (reusing existing collection)
         from api.models import flags_collection
+        from api.utils.flag_counters import record_flag_created
         flags_collection.insert_one(flag_doc)
+        record_flag_created(flag_doc)
         
         # Update session statistics
         audio_sessions_collection.update_one(
@@ -306,7 +659,7 @@ def flag_suspicious_audio(request):
             'flag_id': flag_doc['flag_id'],
             'message': 'Suspicious activity flagged'
         }, status=status.HTTP_201_CREATED)
-        
+    
     except Exception as e:
         logger.error(f"Error flagging suspicious audio: {e}")
         return Response({
@@ -369,13 +722,17 @@ def end_audio_session(request):
                 'error': 'Session not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
+        # Streaming diarization state is no longer needed
+        from api.utils.speaker_profile import delete_speaker_profile
+        delete_speaker_profile(session_id)
+        
         logger.info(f"Ended audio session: {session_id} with {total_flags} flags")
         
         return Response({
             'success': True,
             'message': 'Session ended successfully'
         }, status=status.HTTP_200_OK)
-        
+    
     except Exception as e:
         logger.error(f"Error ending audio session: {e}")
         return Response({
@@ -416,7 +773,7 @@ def get_session_status(request, session_id):
             'success': True,
             'session': session
         }, status=status.HTTP_200_OK)
-        
+    
     except Exception as e:
         logger.error(f"Error getting session status: {e}")
         return Response({
@@ -426,18 +783,48 @@ def get_session_status(request, session_id):
 
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def play_audio_chunk(request, chunk_id):
     """
     Stream audio file for playback
     
-    GET /api/audio/play/{chunk_id}
+    GET /api/audio/play/{chunk_id}?token=<playback token>
+    
+    A valid playback token (minted when the flag is shown) authorizes the
+    request and locates the audio without any database reads. Without a
+    token the caller must be the quiz's teacher (bearer auth).
+    
+    Honours Range / If-Range: a single byte range gets 206 Partial Content,
+    multiple ranges get 416. With AUDIO_CONFIG['playback']['offload'] set,
+    chunks stored in their own file are sent by nginx (X-Accel-Redirect) or
+    the X-Sendfile module instead.
     """
     try:
-        from django.http import FileResponse, HttpResponse
-        from pathlib import Path
+        token = request.query_params.get('token')
         
-        chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
+        if token:
+            try:
+                chunk = verify_playback_token(token, chunk_id)
+            except InvalidPlaybackToken as e:
+                return Response({
+                    'success': False,
+                    'error': str(e)
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            response = build_playback_response(request, chunk)
+            if response is not None:
+                return response
+            
+            # Audio moved since the token was minted (e.g. archived); locate it again
+            chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
+        else:
+            if not getattr(request.user, 'is_authenticated', False):
+                return Response({
+                    'success': False,
+                    'error': 'Authentication credentials were not provided.'
+                }, status=status.HTTP_401_UNAUTHORIZED)
+            
+            chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
         
         if not chunk:
             return Response({
@@ -445,55 +832,30 @@ def play_audio_chunk(request, chunk_id):
                 'error': 'Chunk not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Verify access control (teacher of quiz only)
-        user_id = str(request.user.get('_id'))
-        user_role = request.user.get('role')
-        
-        if user_role == 'teacher':
-            quiz = quizzes_collection.find_one({'_id': ObjectId(chunk['quiz_id'])})
-            if not quiz or str(quiz['teacher_id']) != user_id:
-                return Response({
-                    'success': False,
-                    'error': 'Unauthorized access'
-                }, status=status.HTTP_403_FORBIDDEN)
-        else:
-            return Response({
-                'success': False,
-                'error': 'Only teachers can play audio'
-            }, status=status.HTTP_403_FORBIDDEN)
+        if not token:
+            # Verify access control (teacher of quiz only)
+            error_response = _check_chunk_teacher(request, chunk)
+            if error_response:
+                return error_response
         
         # Get audio file path (prefer preprocessed)
-        file_path = chunk.get('preprocessed_path') or chunk.get('file_path')
-        
-        if not file_path:
+        if not (chunk.get('preprocessed_path') or chunk.get('file_path')):
             return Response({
                 'success': False,
                 'error': 'Audio file not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        file_path = Path(file_path)
+        # Range-aware stream (206 for seeks), or offloaded to nginx when configured
+        response = build_playback_response(request, chunk)
         
-        if not file_path.exists():
+        if response is None:
             return Response({
                 'success': False,
                 'error': 'Audio file not found on disk'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Determine content type
-        content_type = 'audio/wav' if file_path.suffix == '.wav' else 'audio/webm'
-        
-        # Stream the file
-        response = FileResponse(
-            open(file_path, 'rb'),
-            content_type=content_type
-        )
-        
-        # Support range requests for seeking
-        response['Accept-Ranges'] = 'bytes'
-        response['Content-Length'] = file_path.stat().st_size
-        
         return response
-        
+    
     except Exception as e:
         logger.error(f"Error playing audio chunk: {e}")
         return Response({
@@ -508,7 +870,10 @@ def get_chunk_details(request, chunk_id):
     """
     Get audio chunk processing details
     
-    GET /api/audio/chunk/{chunk_id}
+    GET /api/audio/chunk/{chunk_id}[?token=<playback token>]
+    
+    A playback token issued to the requesting teacher stands in for the
+    quiz ownership check.
     """
     try:
         chunk = audio_chunks_collection.find_one({'chunk_id': chunk_id})
@@ -522,14 +887,26 @@ def get_chunk_details(request, chunk_id):
         # Verify access control (teacher of quiz only)
         user_id = str(request.user.get('_id'))
         user_role = request.user.get('role')
+        token = request.query_params.get('token')
         
-        if user_role == 'teacher':
-            quiz = quizzes_collection.find_one({'_id': ObjectId(chunk['quiz_id'])})
-            if not quiz or str(quiz['teacher_id']) != user_id:
+        if user_role == 'teacher' and token:
+            try:
+                token_chunk = verify_playback_token(token, chunk_id)
+            except InvalidPlaybackToken as e:
+                return Response({
+                    'success': False,
+                    'error': str(e)
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            if token_chunk['teacher_id'] != user_id:
                 return Response({
                     'success': False,
                     'error': 'Unauthorized access'
                 }, status=status.HTTP_403_FORBIDDEN)
+        elif user_role == 'teacher':
+            error_response = _check_chunk_teacher(request, chunk)
+            if error_response:
+                return error_response
         elif user_role == 'student':
             if chunk['student_id'] != user_id:
                 return Response({
@@ -540,7 +917,9 @@ def get_chunk_details(request, chunk_id):
         # Remove MongoDB _id and file paths
         chunk.pop('_id', None)
         chunk.pop('file_path', None)
+        chunk.pop('file_offset', None)
         chunk.pop('preprocessed_path', None)
+        chunk.pop('preprocessed_offset', None)
         
         # Convert datetime to ISO format
         if chunk.get('timestamp'):
@@ -554,10 +933,65 @@ def get_chunk_details(request, chunk_id):
             'success': True,
             'chunk': chunk
         }, status=status.HTTP_200_OK)
-        
+    
     except Exception as e:
         logger.error(f"Error getting chunk details: {e}")
         return Response({
             'success': False,
             'error': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_audio_storage_stats(request):
+    """
+    Get audio storage usage by tier
+    
+    GET /api/audio/storage/stats/[?quiz_id=<quiz>[&student_id=<student>]]
+    
+    Read from precomputed counters. Teachers only; with quiz_id the caller
+    must own the quiz.
+    """
+    try:
+        if request.user.get('role') != 'teacher':
+            return Response({
+                'success': False,
+                'error': 'Only teachers can view storage statistics'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        quiz_id = request.query_params.get('quiz_id')
+        student_id = request.query_params.get('student_id')
+        
+        if student_id and not quiz_id:
+            return Response({
+                'success': False,
+                'error': 'student_id requires quiz_id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if quiz_id:
+            quiz_config = get_quiz_audio_config(quiz_id)
+            if not quiz_config.exists or quiz_config.teacher_id != str(request.user.get('_id')):
+                return Response({
+                    'success': False,
+                    'error': 'Unauthorized access'
+                }, status=status.HTTP_403_FORBIDDEN)
+        
+        stats = get_storage_stats(quiz_id, student_id)
+        if 'error' in stats:
+            return Response({
+                'success': False,
+                'error': 'Internal server error'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return Response({
+            'success': True,
+            'stats': stats
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        logger.error(f"Error getting storage stats: {e}")
+        return Response({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
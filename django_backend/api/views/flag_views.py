@@ -5,11 +5,21 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from api.models import flags_collection
-from api.utils.flag_utils import should_aggregate_flag, increase_flag_severity, get_severity_for_type, get_flag_statistics
+from api.utils.flag_utils import (
+    aggregate_flag,
+    aggregate_flag_events,
+    get_flag_statistics,
+    list_flags,
+    DEFAULT_FLAG_PAGE_SIZE,
+    MAX_FLAG_EVENTS_PER_BATCH,
+    MAX_FLAG_EVENT_AGE_SECONDS
+)
+from api.utils.flag_counters import record_flag_changed, record_flag_deleted
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +31,12 @@ def flag_list_create(request):
     """
     GET: List flags (filtered by role and query params)
     POST: Create a new flag (students only, auto-created during quiz)
+    
+    GET pages newest first: pass the response's next_cursor as ?cursor= for
+    the next page (?limit=, up to 500). ?view=compact (default) omits
+    audio transcripts and returns a short transcription_preview;
+    ?view=full returns whole flag documents. Any combination of quiz_id,
+    student_id, resolved and severity can be filtered.
     """
     if request.method == 'GET':
         try:
@@ -49,8 +65,19 @@ def flag_list_create(request):
             if severity:
                 query['severity'] = severity.lower()
             
-            # Get flags
-            flags = list(flags_collection.find(query).sort('timestamp', -1).limit(100))
+            # Get flags (one keyset page)
+            try:
+                flags, next_cursor = list_flags(
+                    query,
+                    cursor=request.GET.get('cursor'),
+                    limit=request.GET.get('limit', DEFAULT_FLAG_PAGE_SIZE),
+                    view=request.GET.get('view', 'compact').lower()
+                )
+            except ValueError as e:
+                return Response({
+                    'error': True,
+                    'message': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
             
             # Convert ObjectId to string
             for flag in flags:
@@ -58,9 +85,18 @@ def flag_list_create(request):
                 if 'resolved_by' in flag and flag['resolved_by']:
                     flag['resolved_by'] = str(flag['resolved_by'])
             
+            # Playback URLs are short-lived, so they are minted now rather than stored
+            if user['role'] == 'teacher':
+                from api.utils.audio_playback import attach_playback_urls
+                attach_playback_urls(flags, user['_id'])
+            
             # Get statistics if requested
             include_stats = request.GET.get('include_stats', 'false').lower() == 'true'
-            response_data = {'flags': flags}
+            response_data = {
+                'flags': flags,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
             
             if include_stats:
                 stats = get_flag_statistics(quiz_id=quiz_id, student_id=student_id)
@@ -90,38 +126,24 @@ def flag_list_create(request):
                     'message': 'quiz_id and type are required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Check if should aggregate with existing flag
-            existing_flag = should_aggregate_flag(user['_id'], quiz_id, flag_type)
+            # Create the flag, or aggregate into this 30-second window's flag (one atomic upsert)
+            flag_data, aggregated = aggregate_flag(
+                user['_id'], quiz_id, flag_type,
+                description=description,
+                severity=request.data.get('severity')
+            )
             
-            if existing_flag:
-                # Increase severity of existing flag
-                new_severity = increase_flag_severity(existing_flag['_id'])
-                
-                logger.info(f"Flag aggregated: {existing_flag['_id']}, new severity: {new_severity}")
+            if aggregated:
+                logger.info(f"Flag aggregated: {flag_data['_id']}, new severity: {flag_data['severity']}")
                 
                 return Response({
                     'message': 'Flag aggregated with existing flag',
-                    'flag_id': str(existing_flag['_id']),
-                    'severity': new_severity,
+                    'flag_id': str(flag_data['_id']),
+                    'severity': flag_data['severity'],
                     'aggregated': True
                 }, status=status.HTTP_200_OK)
             
-            # Create new flag
-            severity = request.data.get('severity') or get_severity_for_type(flag_type)
-            
-            flag_data = {
-                'student_id': user['_id'],
-                'quiz_id': quiz_id,
-                'type': flag_type,
-                'description': description,
-                'timestamp': datetime.utcnow(),
-                'severity': severity,
-                'resolved': False,
-                'count': 1
-            }
-            
-            result = flags_collection.insert_one(flag_data)
-            flag_data['_id'] = str(result.inserted_id)
+            flag_data['_id'] = str(flag_data['_id'])
             
             logger.info(f"Flag created: {flag_type} for student {user['_id']} in quiz {quiz_id}")
             
@@ -140,6 +162,121 @@ def flag_list_create(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _parse_event_timestamp(value, now):
+    """
+    Event time as naive UTC, clamped to [now - MAX_FLAG_EVENT_AGE_SECONDS, now]
+    
+    Client clocks are not trusted: a batch can neither date events into the
+    future nor back into earlier windows of the exam timeline.
+    """
+    if not value:
+        return now
+    
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    oldest = now - timedelta(seconds=MAX_FLAG_EVENT_AGE_SECONDS)
+    return max(min(timestamp, now), oldest)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def flag_batch_create(request):
+    """
+    POST: Record a batch of flag events (students only)
+    
+    Browsers queue proctoring events (tab switches, resizes, focus changes)
+    and send them together:
+    
+    {
+        "quiz_id": "<quiz>",
+        "events": [
+            {"type": "tab_switch", "timestamp": "2024-01-01T10:00:00Z", "description": "...", "severity": "high"},
+            ...
+        ]
+    }
+    
+    Events are merged with the same 30-second aggregation as single flags
+    and written in one bulk operation. Timestamps later than now, or older
+    than MAX_FLAG_EVENT_AGE_SECONDS, are clamped into that range.
+    """
+    try:
+        user = request.user
+        
+        if user['role'] != 'student':
+            return Response({
+                'error': True,
+                'message': 'Only students can report flag events'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        quiz_id = request.data.get('quiz_id')
+        raw_events = request.data.get('events')
+        
+        if not quiz_id or not isinstance(raw_events, list) or not raw_events:
+            return Response({
+                'error': True,
+                'message': 'quiz_id and a non-empty events list are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(raw_events) > MAX_FLAG_EVENTS_PER_BATCH:
+            return Response({
+                'error': True,
+                'message': f'At most {MAX_FLAG_EVENTS_PER_BATCH} events per batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        now = datetime.utcnow()
+        events = []
+        
+        for index, raw_event in enumerate(raw_events):
+            if not isinstance(raw_event, dict):
+                raw_event = {}
+            
+            # 'flag_type' is what the exam dashboards send for single flags
+            flag_type = raw_event.get('type') or raw_event.get('flag_type')
+            if not flag_type:
+                return Response({
+                    'error': True,
+                    'message': f'Event {index}: type is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                timestamp = _parse_event_timestamp(raw_event.get('timestamp'), now)
+            except (TypeError, ValueError):
+                return Response({
+                    'error': True,
+                    'message': f'Event {index}: invalid timestamp'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            severity = str(raw_event.get('severity') or '').lower()
+            
+            events.append({
+                'type': str(flag_type),
+                'timestamp': timestamp,
+                'description': str(raw_event.get('description', '')),
+                'severity': severity if severity in ['low', 'medium', 'high', 'critical'] else None
+            })
+        
+        flags = aggregate_flag_events(user['_id'], quiz_id, events)
+        
+        logger.info(f"Flag batch: {len(events)} events -> {len(flags)} flags for student {user['_id']} in quiz {quiz_id}")
+        
+        return Response({
+            'message': 'Flag events recorded',
+            'events': len(events),
+            'flags_created': sum(1 for flag in flags if not flag['aggregated']),
+            'flags_aggregated': sum(1 for flag in flags if flag['aggregated']),
+            'flags': flags
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        logger.error(f"Error recording flag batch: {e}")
+        return Response({
+            'error': True,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def flag_detail(request, flag_id):
@@ -207,11 +344,19 @@ def flag_detail(request, flag_id):
             
             update_data['updated_at'] = datetime.utcnow()
             
-            # Update flag
-            flags_collection.update_one(
+            update = {'$set': update_data}
+            if update_data.get('resolved'):
+                # Close the flag's aggregation window; later events open a new flag
+                update['$unset'] = {'aggregation_bucket': ''}
+            
+            # Update flag (pre-image drives the resolution/severity counter transitions)
+            before = flags_collection.find_one_and_update(
                 {'_id': ObjectId(flag_id)},
-                {'$set': update_data}
+                update,
+                return_document=ReturnDocument.BEFORE
             )
+            if before:
+                record_flag_changed(before, update_data)
             
             logger.info(f"Flag updated: {flag_id} by teacher {user['_id']}")
             
@@ -228,7 +373,9 @@ def flag_detail(request, flag_id):
                 }, status=status.HTTP_403_FORBIDDEN)
             
             # Delete flag
-            flags_collection.delete_one({'_id': ObjectId(flag_id)})
+            deleted = flags_collection.find_one_and_delete({'_id': ObjectId(flag_id)})
+            if deleted:
+                record_flag_deleted(deleted)
             
             logger.info(f"Flag deleted: {flag_id} by teacher {user['_id']}")
             
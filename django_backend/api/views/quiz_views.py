@@ -11,6 +11,7 @@ from bson import ObjectId
 from api.models import quizzes_collection, submissions_collection, flags_collection
 from api.utils.quiz_utils import generate_quiz_code, calculate_score, validate_quiz_data, shuffle_quiz_questions
 from api.utils.validators import validate_quiz_code
+from api.utils.audio_config import invalidate_quiz_audio_config
 import logging
 
 logger = logging.getLogger(__name__)
@@ -278,6 +279,8 @@ def quiz_detail(request, quiz_id):
                 {'$set': update_data}
             )
             
+            invalidate_quiz_audio_config(quiz_id)
+            
             logger.info(f"Quiz updated: {quiz_id} by teacher {user['_id']}")
             
             return Response({
@@ -294,6 +297,7 @@ def quiz_detail(request, quiz_id):
             
             # Delete quiz
             quizzes_collection.delete_one({'_id': ObjectId(quiz_id)})
+            invalidate_quiz_audio_config(quiz_id)
             
             logger.info(f"Quiz deleted: {quiz_id} by teacher {user['_id']}")
             
@@ -352,11 +356,17 @@ def submit_quiz(request, quiz_id):
         # Calculate score
         score_details = calculate_score(quiz, answers)
         
-        # Count flags for this student and quiz
-        total_flags = flags_collection.count_documents({
-            'student_id': user['_id'],
-            'quiz_id': quiz_id
-        })
+        # Count flags for this student and quiz (precomputed counter; count directly if it is unavailable)
+        from api.utils.flag_counters import get_flag_counters
+        
+        flag_counts = get_flag_counters(quiz_id=quiz_id, student_id=user['_id'])
+        if flag_counts is not None:
+            total_flags = flag_counts['total_flags']
+        else:
+            total_flags = flags_collection.count_documents({
+                'student_id': user['_id'],
+                'quiz_id': quiz_id
+            })
         
         # Create submission
         submission_data = {
@@ -0,0 +1,152 @@
+"""
+Burst benchmark: flag aggregation under thousands of events per second from one student
+Run against a MongoDB instance (point DB_NAME at a scratch database):
+
+    DB_NAME=ASR_EXAM_bench python benchmarks/bench_flag_burst.py --events 5000 --threads 32
+
+The same burst of tab_switch events is sent through the original
+find_one -> find_one + update_one / insert_one sequence and through the
+single atomic upsert (aggregate_flag). Events/sec, latency percentiles and
+the number of flags created per 30-second window are reported; more than
+one flag per window means concurrent events were not merged.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'exam_proctoring.settings')
+
+import django
+
+django.setup()
+
+from api.models import flags_collection, create_indexes
+from api.utils.flag_counters import record_flag_deleted
+from api.utils.flag_utils import aggregate_flag, get_aggregation_bucket, get_severity_for_type, escalate_severity
+
+FLAG_TYPE = 'tab_switch'
+
+
+def legacy_flag_event(student_id, quiz_id, flag_type):
+    """Aggregation as it was in flag_list_create (up to three round-trips, racy)"""
+    existing_flag = flags_collection.find_one({
+        'student_id': student_id,
+        'quiz_id': quiz_id,
+        'type': flag_type,
+        'timestamp': {'$gte': datetime.utcnow() - timedelta(seconds=30)},
+        'resolved': False
+    })
+    
+    if existing_flag:
+        flag = flags_collection.find_one({'_id': existing_flag['_id']})
+        flags_collection.update_one(
+            {'_id': flag['_id']},
+            {'$set': {
+                'severity': escalate_severity(flag.get('severity')),
+                'count': flag.get('count', 1) + 1,
+                'updated_at': datetime.utcnow()
+            }}
+        )
+        return
+    
+    flags_collection.insert_one({
+        'student_id': student_id,
+        'quiz_id': quiz_id,
+        'type': flag_type,
+        'description': 'burst benchmark',
+        'timestamp': datetime.utcnow(),
+        'severity': get_severity_for_type(flag_type),
+        'resolved': False,
+        'count': 1
+    })
+
+
+def atomic_flag_event(student_id, quiz_id, flag_type):
+    aggregate_flag(student_id, quiz_id, flag_type, description='burst benchmark')
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def run_burst(handler, events, threads):
+    quiz_id = f"bench-{uuid.uuid4().hex[:12]}"
+    student_id = f"bench-student-{uuid.uuid4().hex[:8]}"
+    
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(events))
+    
+    def worker():
+        local = []
+        for _ in counter:
+            started = time.perf_counter()
+            try:
+                handler(student_id, quiz_id, FLAG_TYPE)
+            except Exception as e:
+                errors.append(e)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+    
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    flags = list(flags_collection.find({'quiz_id': quiz_id}))
+    per_window = Counter(get_aggregation_bucket(flag['timestamp']) for flag in flags)
+    
+    # Leave the database (and the flag counters) as they were
+    for flag in flags:
+        if 'aggregation_bucket' in flag:
+            record_flag_deleted(flag)
+    flags_collection.delete_many({'quiz_id': quiz_id})
+    
+    return {
+        'eps': events / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'flags': len(flags),
+        'windows': len(per_window),
+        'events_counted': sum(flag.get('count', 1) for flag in flags),
+        'errors': len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+    
+    # Unique aggregation index must exist for the atomic path
+    create_indexes()
+    
+    print(f"{args.events} {FLAG_TYPE} events from one student on {args.threads} threads")
+    print(f"{'method':>8} {'events/s':>9} {'p50 ms':>7} {'p99 ms':>7} {'flags':>6} {'windows':>8} {'counted':>8} {'errors':>7}")
+    
+    for label, handler in [('legacy', legacy_flag_event), ('atomic', atomic_flag_event)]:
+        result = run_burst(handler, args.events, args.threads)
+        print(
+            f"{label:>8} {result['eps']:>9.0f} {result['p50']:>7.2f} {result['p99']:>7.2f} "
+            f"{result['flags']:>6} {result['windows']:>8} {result['events_counted']:>8} {result['errors']:>7}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark: compiled keyword matcher vs the original substring loop
+Run: python benchmarks/bench_keywords.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.utils.keyword_matcher import KeywordMatcher
+
+DEFAULT_KEYWORDS = [
+    'help', 'tell me', "what's the answer", 'give me', 'you', 'your answer',
+    'same as', 'copy', 'answer key', 'solution', 'cheat sheet', 'cheat',
+    'question', 'problem', 'which one', 'answer'
+]
+KEYWORD_COUNTS = [16, 500, 2000]
+TRANSCRIPTS = [('5 s chunk', 15), ('60 s batch', 180)]
+
+
+def make_vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def make_keywords(count, vocabulary, seed=1):
+    rng = random.Random(seed)
+    keywords = list(DEFAULT_KEYWORDS)
+    while len(keywords) < count:
+        keywords.append(' '.join(rng.sample(vocabulary, rng.randint(1, 3))))
+    return keywords
+
+
+def make_transcript(words, vocabulary, seed=2):
+    rng = random.Random(seed)
+    pool = vocabulary + ['you', 'your', 'young', 'the', 'answer', 'tell', 'me', 'is']
+    return ' '.join(rng.choice(pool) for _ in range(words))
+
+
+def legacy_match(keywords, text):
+    """Keyword scan as it was in detect_suspicion"""
+    full_text = text.lower()
+    return [keyword for keyword in keywords if keyword.lower() in full_text]
+
+
+def main():
+    vocabulary = make_vocabulary(5000)
+    
+    print(f"{'keywords':>9} {'transcript':>12} {'legacy (us)':>12} {'matcher (us)':>13} {'speedup':>8} {'compile (ms)':>13}")
+    
+    for count in KEYWORD_COUNTS:
+        keywords = make_keywords(count, vocabulary)
+        
+        compile_seconds = min(timeit.repeat(lambda: KeywordMatcher(keywords), number=1, repeat=5))
+        matcher = KeywordMatcher(keywords)
+        
+        for label, words in TRANSCRIPTS:
+            text = make_transcript(words, vocabulary)
+            
+            # Whole-word hits must be a subset of the substring hits
+            assert set(matcher.match(text)['keywords_found']) <= set(legacy_match(keywords, text))
+            
+            runs = 200
+            legacy = min(timeit.repeat(lambda: legacy_match(keywords, text), number=runs, repeat=5)) / runs
+            compiled = min(timeit.repeat(lambda: matcher.match(text), number=runs, repeat=5)) / runs
+            
+            print(
+                f"{count:>9} {label:>12} {legacy * 1e6:>12.1f} {compiled * 1e6:>13.1f} "
+                f"{legacy / compiled:>7.1f}x {compile_seconds * 1e3:>13.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
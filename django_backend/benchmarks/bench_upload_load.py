@@ -0,0 +1,105 @@
+"""
+Load test: sync vs async audio chunk upload views
+Run against a live server (e.g. `daphne exam_proctoring.asgi:application`):
+
+    python benchmarks/bench_upload_load.py --base-url http://localhost:8000 \
+        --token <student JWT> --quiz-id <id> --student-id <id> --session-id <id>
+
+Each endpoint gets the same number of uploads at the same concurrency;
+requests/sec and latency percentiles are reported side by side.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+from datetime import datetime
+
+import httpx
+
+ENDPOINTS = [
+    ('sync (DRF)', '/api/audio/upload/'),
+    ('async (motor)', '/api/audio/upload/async/'),
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def run_endpoint(client, path, args, audio_data):
+    latencies = []
+    errors = 0
+    counter = iter(range(args.requests))
+    
+    async def worker():
+        nonlocal errors
+        for chunk_index in counter:
+            payload = {
+                'quiz_id': args.quiz_id,
+                'student_id': args.student_id,
+                'session_id': args.session_id,
+                'chunk_index': chunk_index,
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'audio_data': audio_data
+            }
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                if response.status_code != 201:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'errors': errors
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--quiz-id', required=True)
+    parser.add_argument('--student-id', required=True)
+    parser.add_argument('--session-id', required=True)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--chunk-kb', type=int, default=80, help='size of each fake audio chunk')
+    args = parser.parse_args()
+    
+    audio_data = base64.b64encode(os.urandom(args.chunk_kb * 1024)).decode()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={'Authorization': f'Bearer {args.token}'},
+        limits=limits,
+        timeout=60.0
+    ) as client:
+        print(f"{args.requests} uploads of {args.chunk_kb} KB at concurrency {args.concurrency}")
+        print(f"{'endpoint':>14} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        
+        for label, path in ENDPOINTS:
+            result = await run_endpoint(client, path, args, audio_data)
+            print(
+                f"{label:>14} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+                f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
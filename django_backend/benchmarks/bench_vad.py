@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: vectorized VAD segmentation vs the original per-frame loop
+Run: python benchmarks/bench_vad.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.utils.vad import frame_rms, hysteresis_mask, mask_to_segments
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = int(0.03 * SAMPLE_RATE)
+HOP_LENGTH = FRAME_LENGTH // 2
+DURATIONS = [('5 s', 5), ('60 s', 60), ('10 min', 600)]
+
+
+def make_signal(seconds, seed=0):
+    """Noise floor with bursts of louder 'speech' every few hundred ms"""
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 0.01, seconds * SAMPLE_RATE).astype(np.float32)
+    
+    burst = int(0.4 * SAMPLE_RATE)
+    for start in range(0, len(y) - burst, int(0.9 * SAMPLE_RATE)):
+        y[start:start + burst] += rng.normal(0, 0.2, burst).astype(np.float32)
+    
+    return y
+
+
+def legacy_segments(speech_frames, total_duration):
+    """Segmentation loop as it was in detect_voice_activity"""
+    speech_segments = []
+    in_speech = False
+    start_time = 0
+    
+    for i, is_speech in enumerate(speech_frames):
+        time = i * HOP_LENGTH / SAMPLE_RATE
+        
+        if is_speech and not in_speech:
+            start_time = time
+            in_speech = True
+        elif not is_speech and in_speech:
+            speech_segments.append({'start': round(start_time, 2), 'end': round(time, 2)})
+            in_speech = False
+    
+    if in_speech:
+        speech_segments.append({'start': round(start_time, 2), 'end': round(total_duration, 2)})
+    
+    return speech_segments
+
+
+def vectorized_segments(speech_frames, total_duration):
+    """Segmentation with api.utils.vad (no merging, same output as legacy)"""
+    starts, ends = mask_to_segments(speech_frames, HOP_LENGTH / SAMPLE_RATE, total_duration)
+    return [
+        {'start': float(s), 'end': float(e)}
+        for s, e in zip(np.round(starts, 2), np.round(ends, 2))
+    ]
+
+
+def best_of(func, repeat=5):
+    """Best wall time of `repeat` runs, in milliseconds"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+def main():
+    print(f"{'input':>8} {'frames':>8} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8} {'hyst ms':>8}")
+    
+    for label, seconds in DURATIONS:
+        y = make_signal(seconds)
+        total = len(y) / SAMPLE_RATE
+        rms = frame_rms(y, FRAME_LENGTH, HOP_LENGTH)
+        mask = rms > np.mean(rms) * 0.5
+        
+        assert legacy_segments(mask, total) == vectorized_segments(mask, total)
+        
+        legacy_ms = best_of(lambda: legacy_segments(mask, total))
+        vector_ms = best_of(lambda: vectorized_segments(mask, total))
+        hysteresis_ms = best_of(lambda: hysteresis_mask(rms, np.mean(rms) * 0.5, np.mean(rms) * 0.4))
+        
+        print(f"{label:>8} {len(mask):>8} {legacy_ms:>10.3f} {vector_ms:>10.3f} {legacy_ms / vector_ms:>7.1f}x {hysteresis_ms:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ Celery configuration for audio processing tasks
 """
 import os
 from celery import Celery
+from celery.signals import celeryd_init, celeryd_after_setup, worker_process_init
+from kombu import Exchange, Queue
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'exam_proctoring.settings')
@@ -15,8 +17,99 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from all registered Django apps
 app.autodiscover_tasks()
 
+# Audio pipeline queues:
+# - cpu-light: preprocessing, VAD, diarization and suspicion/flagging for live exams
+# - asr-heavy: Whisper transcription (single tasks and batches)
+# - maintenance: retention cleanup and other housekeeping
+QUEUE_CPU_LIGHT = 'cpu-light'
+QUEUE_ASR_HEAVY = 'asr-heavy'
+QUEUE_MAINTENANCE = 'maintenance'
+
+app.conf.task_queues = (
+    Queue(QUEUE_CPU_LIGHT, Exchange(QUEUE_CPU_LIGHT), routing_key=QUEUE_CPU_LIGHT),
+    Queue(QUEUE_ASR_HEAVY, Exchange(QUEUE_ASR_HEAVY), routing_key=QUEUE_ASR_HEAVY),
+    Queue(QUEUE_MAINTENANCE, Exchange(QUEUE_MAINTENANCE), routing_key=QUEUE_MAINTENANCE),
+)
+app.conf.task_default_queue = QUEUE_CPU_LIGHT
+
+AUDIO_TASK_ROUTES = {
+    'api.tasks.audio_tasks.preprocess_audio_chunk': QUEUE_CPU_LIGHT,
+    'api.tasks.audio_tasks.detect_voice_activity': QUEUE_CPU_LIGHT,
+    'api.tasks.audio_tasks.diarize_speakers': QUEUE_CPU_LIGHT,
+    'api.tasks.audio_tasks.detect_suspicion': QUEUE_CPU_LIGHT,
+    'api.tasks.audio_tasks.enqueue_audio_chunks': QUEUE_CPU_LIGHT,
+    'api.tasks.audio_tasks.transcribe_audio': QUEUE_ASR_HEAVY,
+    'api.tasks.audio_tasks.transcribe_pending_batch': QUEUE_ASR_HEAVY,
+    'api.tasks.audio_tasks.get_asr_model_stats': QUEUE_ASR_HEAVY,
+    'api.tasks.audio_tasks.cleanup_expired_audio': QUEUE_MAINTENANCE,
+    'api.tasks.audio_tasks.reconcile_storage_stats': QUEUE_MAINTENANCE,
+    'api.tasks.audio_tasks.reconcile_flag_counters': QUEUE_MAINTENANCE,
+    'api.tasks.audio_tasks.archive_closed_quiz_audio': QUEUE_MAINTENANCE,
+    'api.tasks.audio_tasks.reclaim_stale_asr_batches': QUEUE_MAINTENANCE,
+}
+
+
+def route_audio_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Route audio tasks to their stage queue
+    
+    The fused task only needs Whisper when ASR batching is off; with batching
+    on it stops before transcription and can run on the light queue.
+    """
+    if name == 'api.tasks.audio_tasks.process_audio_chunk':
+        from django.conf import settings
+        batching = settings.AUDIO_CONFIG['processing'].get('asr_batching', {})
+        queue = QUEUE_CPU_LIGHT if batching.get('enabled', False) else QUEUE_ASR_HEAVY
+        return {'queue': queue}
+    
+    queue = AUDIO_TASK_ROUTES.get(name)
+    if queue:
+        return {'queue': queue}
+    return None
+
+
+app.conf.task_routes = (route_audio_task,)
+
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     """Debug task for testing Celery setup"""
     print(f'Request: {self.request!r}')
+
+
+@celeryd_init.connect
+def apply_queue_concurrency(sender, instance, conf, options, **kwargs):
+    """
+    Size the pool from AUDIO_WORKER_CONCURRENCY when a worker serves one queue
+    
+    An explicit --concurrency always wins. Run one worker per queue, e.g.
+    `celery -A exam_proctoring worker -Q asr-heavy -n asr@%h`.
+    """
+    from django.conf import settings
+    
+    if options.get('concurrency'):
+        return
+    
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    queues = [queue.strip() for queue in queues if queue.strip()]
+    
+    concurrency_by_queue = getattr(settings, 'AUDIO_WORKER_CONCURRENCY', {})
+    sizes = [concurrency_by_queue[queue] for queue in queues if queue in concurrency_by_queue]
+    if sizes:
+        conf.worker_concurrency = max(sizes)
+
+
+@celeryd_after_setup.connect
+def record_worker_queues(sender, instance, **kwargs):
+    """Remember the worker's queues before the pool forks so children pick the right ASR model"""
+    from api.utils.asr_models import set_worker_queues
+    set_worker_queues(instance.app.amqp.queues.consume_from.keys())
+
+
+@worker_process_init.connect
+def warm_start_asr_model(**kwargs):
+    """Load the ASR model once per worker process instead of once per chunk"""
+    from api.utils.asr_models import preload_asr_models
+    preload_asr_models()
@@ -210,6 +210,20 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
 CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 25 minutes
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # don't hoard long tasks, so priorities take effect
+CELERY_TASK_DEFAULT_PRIORITY = 3
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),  # 0 (most urgent) - 9
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Worker pool size per queue (see exam_proctoring/celery.py); run one worker per queue
+AUDIO_WORKER_CONCURRENCY = {
+    'cpu-light': int(os.getenv('AUDIO_CPU_LIGHT_CONCURRENCY', 4)),
+    'asr-heavy': int(os.getenv('AUDIO_ASR_HEAVY_CONCURRENCY', 1)),
+    'maintenance': int(os.getenv('AUDIO_MAINTENANCE_CONCURRENCY', 1)),
+}
 
 # Celery Beat Schedule (Periodic Tasks)
 from celery.schedules import crontab
@@ -217,10 +231,27 @@ CELERY_BEAT_SCHEDULE = {
     'cleanup-expired-audio': {
         'task': 'api.tasks.audio_tasks.cleanup_expired_audio',
         'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM
+        'options': {'priority': 9},
+    },
+    'archive-closed-quiz-audio': {
+        'task': 'api.tasks.audio_tasks.archive_closed_quiz_audio',
+        'schedule': crontab(minute=15),  # Run hourly
+        'options': {'priority': 9},
+    },
+    'reconcile-flag-counters': {
+        'task': 'api.tasks.audio_tasks.reconcile_flag_counters',
+        'schedule': crontab(hour=4, minute=0),  # Run daily at 4 AM
+        'options': {'priority': 9},
+    },
+    'reconcile-storage-stats': {
+        'task': 'api.tasks.audio_tasks.reconcile_storage_stats',
+        'schedule': crontab(hour=3, minute=30, day_of_week=0),  # Weekly, Sunday 3:30 AM
+        'options': {'priority': 9},
     },
 }
 
 # Audio Processing Configuration
+AUDIO_STATE_REDIS_URL = os.getenv('AUDIO_STATE_REDIS_URL', CELERY_BROKER_URL)  # streaming per-session state
 AUDIO_STORAGE_ROOT = BASE_DIR / 'storage' / 'audio'
 AUDIO_CONFIG = {
     'recording': {
@@ -230,16 +261,73 @@ AUDIO_CONFIG = {
         'format': 'wav'
     },
     'processing': {
-        'vad_aggressiveness': 2,
+        'pipeline_mode': 'fused',  # 'fused' (single task per chunk) or 'chained' (one task per stage)
+        'vad_aggressiveness': 2,  # 0-3, higher rejects more non-speech
+        'silence_gate': {
+            'enabled': True,  # skip denoise/VAD/ASR for chunks that are plainly silent
+            'max_rms_dbfs': -50.0,  # loudest 100 ms window below this is silence
+            'noise_rms_dbfs': -40.0,  # below this, noise-like zero-crossing rate also counts as silence
+            'noise_min_zcr': 0.3
+        },
+        'speaker_profile': {
+            'enabled': True,  # compare each chunk against the session's enrolled voice
+            'enroll_seconds': 10.0,  # speech attributed to the student before comparisons start
+            'distance_threshold': 2.5,  # per-frame MFCC z-distance beyond which a frame is another voice
+            'min_foreign_seconds': 0.5,  # other-voice speech needed to report multiple speakers
+            'merge_window_chunks': 32,  # chunks that may merge ahead of a missing earlier chunk
+            'ttl_seconds': 6 * 3600
+        },
+        'vad': {
+            'backend': 'energy',  # 'energy' or 'webrtc' (needs webrtcvad)
+            'min_speech_seconds': 0.1,  # drop speech segments shorter than this
+            'min_silence_seconds': 0.15  # merge segments separated by shorter gaps
+        },
         'diarization_model': 'pyannote/speaker-diarization-3.1',
         'asr_model': 'base',  # whisper model size
+        'asr_models_by_queue': {},  # queue name -> whisper model size preloaded by workers on that queue
+        'asr_batching': {
+            'enabled': False,  # transcribe queued chunks across students in one batched inference
+            'batch_size': 8,
+            'max_wait_seconds': 2.0,  # upper bound on how long a chunk waits for a batch to fill
+            'claim_timeout_minutes': 10,  # batch claims older than this are assumed lost and re-queued
+            'max_attempts': 4,  # batched transcription attempts per chunk (first run + 3 retries)
+            'retry_delay_seconds': 60  # wait before a chunk from a failed batch is batched again
+        },
         'suspicion_threshold': 0.5,
+        'quiz_config_cache_seconds': 60,  # per-process cache of quiz audio settings
+        'quiz_config_version_check_seconds': 1.0,  # how often a cached quiz config is checked against the shared version
+        'priority': {
+            'urgent_minutes': 15,  # quiz ends within this window -> 'urgent'
+            'soon_minutes': 60,  # ends within this window (or no end_time) -> 'live'
+            'urgent': 0,
+            'live': 3,
+            'background': 6  # ended, or ends later than soon_minutes
+        },
         'max_processing_time': 30  # seconds
     },
     'storage': {
         'retention_days': 90,
+        'cleanup': {
+            'batch_size': 500,  # expired chunks per delete_many
+            'workers': 4  # threads wiping files in parallel
+        },
         'max_chunk_size_mb': 5,
-        'compression_enabled': True
+        'max_batch_chunks': 24,  # chunks accepted per batch upload (2 minutes of backlog)
+        'layout': 'segments',  # 'segments' (one append-only raw file per session) or 'files' (one file per chunk)
+        'compression_enabled': True,  # move audio of closed quizzes to the compressed 'archived' tier
+        'archive': {
+            'codec': 'opus',  # 'opus' (smallest) or 'flac' (lossless 16-bit) for re-encoded audio
+            'delay_hours': 1,  # wait this long after a quiz's end_time
+            'batch_size': 200,  # chunks per page
+            'workers': 4  # encoding threads
+        },
+        'preprocessed_format': 'pcm',  # 'pcm' (per-session memory-mapped float32 file) or 'wav' (one file per chunk)
+        'persist_preprocessed': 'flagged'  # 'always' or 'flagged' (fused pipeline keeps clean chunks in memory only)
+    },
+    'playback': {
+        'offload': os.getenv('AUDIO_PLAYBACK_OFFLOAD') or None,  # None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+        'internal_prefix': '/protected-audio/',  # nginx internal location aliased to AUDIO_STORAGE_ROOT
+        'token_ttl_seconds': 300  # lifetime of signed playback URLs
     },
     'keywords': {
         'default': [
@@ -251,5 +339,20 @@ AUDIO_CONFIG = {
 
 # Create audio storage directories
 os.makedirs(AUDIO_STORAGE_ROOT / 'raw', exist_ok=True)
+os.makedirs(AUDIO_STORAGE_ROOT / 'incoming', exist_ok=True)  # streamed uploads before they are committed
+os.makedirs(AUDIO_STORAGE_ROOT / 'segments', exist_ok=True)  # per-session append-only raw audio
 os.makedirs(AUDIO_STORAGE_ROOT / 'preprocessed', exist_ok=True)
 os.makedirs(AUDIO_STORAGE_ROOT / 'archived', exist_ok=True)
+
+# Batched ASR worker is polled by beat when batching is enabled
+if AUDIO_CONFIG['processing']['asr_batching']['enabled']:
+    from datetime import timedelta
+    CELERY_BEAT_SCHEDULE['transcribe-audio-batches'] = {
+        'task': 'api.tasks.audio_tasks.transcribe_pending_batch',
+        'schedule': timedelta(seconds=AUDIO_CONFIG['processing']['asr_batching']['max_wait_seconds']),
+    }
+    CELERY_BEAT_SCHEDULE['reclaim-stale-asr-batches'] = {
+        'task': 'api.tasks.audio_tasks.reclaim_stale_asr_batches',
+        'schedule': timedelta(minutes=5),
+        'options': {'priority': 9},
+    }
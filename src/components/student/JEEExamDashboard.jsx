@@ -13,6 +13,7 @@ import CameraProctor from './CameraProctor'
 import SimpleAudioRecorder from './SimpleAudioRecorder'
 import { playQuizStart, playViolation, playWarning, playTimeWarning, playQuizSubmit } from '../../utils/soundUtils'
 import apiService from '../../services/api'
+import { createFlagBatcher } from '../../utils/flagBatcher'
 import '../../styles/jee-exam-dashboard.css'
 import '../../styles/exam-notifications.css'
 
@@ -91,22 +92,24 @@ export default function JEEExamDashboard({ quiz, onComplete, onCancel }) {
 
   // Security measures
   useEffect(() => {
-    const handleVisibilityChange = async () => {
+    // Flag events queue hote hain aur batch mein jaate hain (har event par alag request nahi)
+    const flagBatcher = createFlagBatcher(apiService.createFlagBatch, {
+      quizId: quiz._id,
+      sendOnExit: apiService.sendFlagBatchOnExit, // Tab hide / page close par bhi events na khoyein
+    })
+
+    const handleVisibilityChange = () => {
       if (document.hidden) {
         playViolation()
         examToast.error("⚠️ Tab switching detected!")
         setViolationCount(prev => prev + 1)
         
-        try {
-          await apiService.createFlag({
-            quiz_id: quiz._id,
-            flag_type: "tab_switch",
-            description: "Student switched tabs during exam",
-            severity: "high",
-          })
-        } catch (error) {
-          console.error("Failed to create flag:", error)
-        }
+        flagBatcher.add({
+          type: "tab_switch",
+          description: "Student switched tabs during exam",
+          severity: "high",
+        })
+        flagBatcher.flushOnExit() // Hidden tab kabhi bhi band ho sakta hai - abhi bhej do
       }
     }
 
@@ -122,12 +125,11 @@ export default function JEEExamDashboard({ quiz, onComplete, onCancel }) {
         playViolation()
         examToast.warning("⚠️ This action is disabled during exam")
         
-        apiService.createFlag({
-          quiz_id: quiz._id,
-          flag_type: "security_violation",
+        flagBatcher.add({
+          type: "security_violation",
           description: `Attempted to use ${e.key}`,
           severity: "high",
-        }).catch(err => console.error("Failed to create flag:", err))
+        })
         
         return false
       }
@@ -157,6 +159,7 @@ export default function JEEExamDashboard({ quiz, onComplete, onCancel }) {
       document.removeEventListener("visibilitychange", handleVisibilityChange)
       document.removeEventListener("keydown", handleKeyDown)
       document.removeEventListener("contextmenu", handleContextMenu)
+      flagBatcher.stop() // Bache hue flag events bhej do
     }
   }, [quiz._id])
 
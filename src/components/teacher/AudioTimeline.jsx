@@ -161,10 +161,10 @@ export default function AudioTimeline({ flags, quizDuration, onFlagClick }) {
                           {flag.severity.toUpperCase()}
                         </span>
                       </div>
-                      {flag.audio_data?.transcription && (
+                      {(flag.audio_data?.transcription || flag.transcription_preview) && (
                         <div className="pt-2 border-t border-border">
                           <p className="text-text line-clamp-2">
-                            {flag.audio_data.transcription.split('\n')[0]}
+                            {(flag.audio_data?.transcription || flag.transcription_preview).split('\n')[0]}
                           </p>
                         </div>
                       )}
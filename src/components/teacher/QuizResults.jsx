@@ -43,7 +43,7 @@ export default function QuizResults() {
       setSubmissions(submissionsData)
 
       // Fetch flags for this quiz
-      const flagsData = await apiService.getFlags({ quiz_id: quizId })
+      const flagsData = await apiService.getFlags({ quiz_id: quizId, view: 'full' })  // Transcripts bhi chahiye
       setFlags(flagsData.flags || flagsData)
     } catch (error) {
       toast.error('Failed to load quiz results')
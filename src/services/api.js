@@ -134,6 +134,27 @@ const apiService = {
     return response.data
   },
 
+  // Kai flag events ek request mein (server 30-second windows mein aggregate karta hai)
+  createFlagBatch: async (batch) => {
+    const response = await api.post('/flags/batch/', batch)
+    return response.data
+  },
+
+  // Page band hote waqt flag events bhejne ke liye - keepalive request unload ke baad bhi poori hoti hai
+  // (sendBeacon Authorization header nahi bhej sakta, isliye fetch keepalive)
+  sendFlagBatchOnExit: (batch) => {
+    const token = localStorage.getItem('token')
+    fetch(`${API_BASE_URL}/flags/batch/`, {
+      method: 'POST',
+      keepalive: true,
+      headers: {
+        'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      },
+      body: JSON.stringify(batch),
+    }).catch(() => {})
+  },
+
   updateFlag: async (flagId, updates) => {
     const response = await api.put(`/flags/${flagId}/`, updates)
     return response.data
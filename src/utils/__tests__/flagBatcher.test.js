@@ -0,0 +1,130 @@
+/**
+ * Tests for the flag event batcher
+ */
+
+import { describe, it, expect, vi, beforeEach, afterEach } from 'vitest';
+import { createFlagBatcher, isRetryableError, MAX_BATCH_EVENTS, EXIT_BATCH_EVENTS } from '../flagBatcher';
+
+describe('createFlagBatcher', () => {
+  beforeEach(() => {
+    vi.useFakeTimers();
+  });
+
+  afterEach(() => {
+    vi.useRealTimers();
+    vi.restoreAllMocks();
+  });
+
+  it('should send queued events together after the flush interval', async () => {
+    const send = vi.fn().mockResolvedValue({});
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', flushInterval: 1000 });
+
+    batcher.add({ type: 'tab_switch' });
+    batcher.add({ type: 'window_resize' });
+    expect(send).not.toHaveBeenCalled();
+
+    await vi.advanceTimersByTimeAsync(1000);
+
+    expect(send).toHaveBeenCalledTimes(1);
+    const payload = send.mock.calls[0][0];
+    expect(payload.quiz_id).toBe('quiz-1');
+    expect(payload.events.map(event => event.type)).toEqual(['tab_switch', 'window_resize']);
+    expect(payload.events[0].timestamp).toBeTruthy();
+  });
+
+  it('should flush immediately when the queue is full', () => {
+    const send = vi.fn().mockResolvedValue({});
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', maxEvents: 3 });
+
+    batcher.add({ type: 'window_resize' });
+    batcher.add({ type: 'window_resize' });
+    batcher.add({ type: 'window_resize' });
+
+    expect(send).toHaveBeenCalledTimes(1);
+    expect(send.mock.calls[0][0].events).toHaveLength(3);
+  });
+
+  it('should keep events and retry when sending fails', async () => {
+    vi.spyOn(console, 'error').mockImplementation(() => {});
+    const send = vi.fn()
+      .mockRejectedValueOnce(new Error('offline'))
+      .mockResolvedValue({});
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', flushInterval: 1000 });
+
+    batcher.add({ type: 'tab_switch' });
+    await batcher.flush();
+    expect(batcher.size()).toBe(1);
+
+    await vi.advanceTimersByTimeAsync(1000);
+
+    expect(send).toHaveBeenCalledTimes(2);
+    expect(batcher.size()).toBe(0);
+  });
+
+  it('should never send more events than the server accepts', async () => {
+    const send = vi.fn().mockResolvedValue({});
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', maxEvents: MAX_BATCH_EVENTS * 2 });
+
+    for (let i = 0; i < MAX_BATCH_EVENTS + 10; i++) {
+      batcher.add({ type: 'window_resize' });
+    }
+    await batcher.stop();
+
+    expect(send.mock.calls[0][0].events).toHaveLength(MAX_BATCH_EVENTS);
+    expect(batcher.size()).toBe(10);
+  });
+
+  it('should drop a batch the server rejects with a 4xx', async () => {
+    vi.spyOn(console, 'error').mockImplementation(() => {});
+    const rejected = Object.assign(new Error('bad request'), { response: { status: 400 } });
+    const send = vi.fn().mockRejectedValue(rejected);
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', flushInterval: 1000 });
+
+    batcher.add({ type: 'tab_switch' });
+    await batcher.flush();
+    expect(batcher.size()).toBe(0);
+
+    await vi.advanceTimersByTimeAsync(5000);
+    expect(send).toHaveBeenCalledTimes(1);
+  });
+
+  it('should retry network errors, 5xx and rate limits only', () => {
+    expect(isRetryableError(new Error('offline'))).toBe(true);
+    expect(isRetryableError({ response: { status: 503 } })).toBe(true);
+    expect(isRetryableError({ response: { status: 429 } })).toBe(true);
+    expect(isRetryableError({ response: { status: 400 } })).toBe(false);
+    expect(isRetryableError({ response: { status: 403 } })).toBe(false);
+  });
+
+  it('should send everything queued with the exit sender', () => {
+    const send = vi.fn().mockResolvedValue({});
+    const sendOnExit = vi.fn();
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', maxEvents: MAX_BATCH_EVENTS, sendOnExit });
+
+    for (let i = 0; i < EXIT_BATCH_EVENTS + 5; i++) {
+      batcher.add({ type: 'window_resize' });
+    }
+    batcher.flushOnExit();
+
+    expect(send).not.toHaveBeenCalled();
+    expect(sendOnExit).toHaveBeenCalledTimes(2);
+    expect(sendOnExit.mock.calls[0][0].events).toHaveLength(EXIT_BATCH_EVENTS);
+    expect(sendOnExit.mock.calls[1][0].events).toHaveLength(5);
+    expect(batcher.size()).toBe(0);
+  });
+
+  it('should flush on pagehide until stopped', async () => {
+    const send = vi.fn().mockResolvedValue({});
+    const sendOnExit = vi.fn();
+    const batcher = createFlagBatcher(send, { quizId: 'quiz-1', sendOnExit });
+
+    batcher.add({ type: 'tab_switch' });
+    window.dispatchEvent(new Event('pagehide'));
+    expect(sendOnExit).toHaveBeenCalledTimes(1);
+
+    await batcher.stop();
+    batcher.add({ type: 'tab_switch' });
+    window.dispatchEvent(new Event('pagehide'));
+    expect(sendOnExit).toHaveBeenCalledTimes(1);
+  });
+});
@@ -0,0 +1,123 @@
+/**
+ * Flag event batcher - proctoring events ko queue karke ek request mein bhejta hai
+ * Tab switches, resize storms aur focus changes ab har event par alag POST nahi karte;
+ * server (/flags/batch/) unhe 30-second windows mein aggregate kar leta hai
+ */
+
+// Server ek batch mein itne events hi accept karta hai
+export const MAX_BATCH_EVENTS = 500
+
+// keepalive requests ki body 64 KB tak hi ho sakti hai, isliye exit par chhote batches
+export const EXIT_BATCH_EVENTS = 200
+
+/**
+ * Whether a failed send is worth retrying
+ * Network errors, timeouts, rate limits aur 5xx dobara bheje ja sakte hain;
+ * baaki 4xx (invalid batch, forbidden) har baar fail honge
+ * @param {Error} error - Error thrown by send (axios style: error.response.status)
+ * @returns {boolean}
+ */
+export const isRetryableError = (error) => {
+  const status = error?.response?.status
+  return !status || status >= 500 || status === 408 || status === 429
+}
+
+/**
+ * Create a batcher that queues flag events and sends them together
+ * @param {Function} send - Called with { quiz_id, events }; returns a promise
+ * @param {Object} options
+ * @param {string} options.quizId - Quiz the events belong to
+ * @param {number} options.flushInterval - Max time an event waits in the queue (ms)
+ * @param {number} options.maxEvents - Queue length that triggers an immediate flush
+ * @param {Function} options.sendOnExit - Fire-and-forget sender that survives page unload
+ *   (fetch keepalive); used by flushOnExit and on pagehide
+ * @returns {{add: Function, flush: Function, flushOnExit: Function, stop: Function, size: Function}}
+ */
+export const createFlagBatcher = (send, { quizId, flushInterval = 5000, maxEvents = 100, sendOnExit = null } = {}) => {
+  let queue = []
+  let timer = null
+
+  const schedule = () => {
+    if (timer === null) {
+      timer = setTimeout(flush, flushInterval)
+    }
+  }
+
+  const flush = async () => {
+    if (timer !== null) {
+      clearTimeout(timer)
+      timer = null
+    }
+    if (queue.length === 0) return null
+
+    const events = queue.slice(0, MAX_BATCH_EVENTS)
+    queue = queue.slice(events.length)
+
+    try {
+      return await send({ quiz_id: quizId, events })
+    } catch (error) {
+      if (!isRetryableError(error)) {
+        // Server ne batch reject kiya (4xx) - dobara bhejne se kuch nahi badlega
+        console.error('Flag events rejected, dropping batch:', error)
+        return null
+      }
+      // Network / server fail hua to events wapas queue mein - agle flush par dobara bhejenge
+      console.error('Failed to send flag events:', error)
+      queue = events.concat(queue).slice(-MAX_BATCH_EVENTS)
+      schedule()
+      return null
+    } finally {
+      if (queue.length > 0) schedule()
+    }
+  }
+
+  // Tab hide / page close: sab kuch abhi bhej do, unload ke baad bhi request chalti rahe
+  const flushOnExit = () => {
+    if (!sendOnExit) return flush()
+
+    if (timer !== null) {
+      clearTimeout(timer)
+      timer = null
+    }
+
+    while (queue.length > 0) {
+      const events = queue.slice(0, EXIT_BATCH_EVENTS)
+      queue = queue.slice(events.length)
+      try {
+        sendOnExit({ quiz_id: quizId, events })
+      } catch (error) {
+        console.error('Failed to send flag events on exit:', error)
+      }
+    }
+    return null
+  }
+
+  const handlePageHide = () => flushOnExit()
+
+  if (sendOnExit && typeof window !== 'undefined') {
+    window.addEventListener('pagehide', handlePageHide)
+  }
+
+  const add = (event) => {
+    queue.push({
+      ...event,
+      timestamp: event.timestamp || new Date().toISOString(), // Event ka asli time, server isi se window decide karta hai
+    })
+
+    if (queue.length >= maxEvents) {
+      flush()
+    } else {
+      schedule()
+    }
+  }
+
+  // Exam khatam / component unmount par bache hue events bhej do
+  const stop = () => {
+    if (sendOnExit && typeof window !== 'undefined') {
+      window.removeEventListener('pagehide', handlePageHide)
+    }
+    return flush()
+  }
+
+  return { add, flush, flushOnExit, stop, size: () => queue.length }
+}